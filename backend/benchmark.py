@@ -0,0 +1,480 @@
+# backend/benchmark.py
+#
+# Reproducible performance benchmark.
+#
+# Generates a synthetic corpus (Zipf-distributed vocabulary with per-topic
+# words, so similarity and PageRank have some structure) in a temporary
+# DATA_DIR, then runs each stage in a fresh interpreter with DATA_DIR set:
+#
+#   build   time build_index, build_similarity_graph, compute_pagerank and
+#           the load snapshot
+#   serve   import main (cold start: time to ready and RSS), then replay a seeded
+#           query mix against the FastAPI app in-process and report
+#           p50/p95/p99 latency per endpoint and throughput
+#
+# The report is one JSON document (stdout or --out) meant to be kept per
+# release; --compare OLD.json prints how the numeric metrics moved.
+#
+#   python benchmark.py --books 200 --words 20000 --queries 2000 --out bench.json
+#   python benchmark.py --data-dir /tmp/bench --skip-build --compare bench.json
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from pathlib import Path
+from time import perf_counter
+
+HERE = Path(__file__).resolve().parent
+REPORT_VERSION = 1
+
+STOPWORD_LIKE = ["the", "and", "of", "to", "a", "in", "that", "it", "was", "he", "his", "is"]
+SYLLABLES = [
+    "ka", "to", "ri", "men", "sa", "lo", "ver", "an", "de", "il", "or", "mu",
+    "the", "ar", "ne", "cal", "es", "pon", "ti", "bra", "gu", "ly", "ow", "fen",
+]
+
+
+# ---------------------------------------------
+# Synthetic corpus
+# ---------------------------------------------
+def _make_vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def generate_corpus(data_dir, n_books=200, words_per_book=20000, vocab_size=20000,
+                    topics=20, seed=1):
+    """Write books/, covers/ and metadata.json (download_books.py layout)."""
+    rng = random.Random(seed)
+    data_dir = Path(data_dir)
+    books_dir = data_dir / "books"
+    books_dir.mkdir(parents=True, exist_ok=True)
+    (data_dir / "covers").mkdir(exist_ok=True)
+
+    vocab = _make_vocabulary(rng, vocab_size)
+    rng.shuffle(vocab)
+    vocab = STOPWORD_LIKE + vocab
+    cum = list(_zipf_cum_weights(len(vocab)))
+    topic_words = [rng.sample(vocab[len(STOPWORD_LIKE):], 200) for _ in range(topics)]
+    authors = [f"{rng.choice(vocab[100:]).title()}, {rng.choice(vocab[100:]).title()}"
+               for _ in range(max(1, n_books // 4))]
+
+    metadata = []
+    for i in range(n_books):
+        book_id = 10000 + i
+        topic = topic_words[i % topics]
+        n = max(50, int(words_per_book * rng.uniform(0.5, 1.5)))
+        words = rng.choices(vocab, cum_weights=cum, k=n)
+        for j in rng.sample(range(n), n // 10):
+            words[j] = rng.choice(topic)
+        lines = [" ".join(words[j:j + 12]) for j in range(0, n, 12)]
+        text = "\n".join(
+            "\n".join(lines[p:p + 8]) + "\n" for p in range(0, len(lines), 8)
+        )
+
+        title = f"The {rng.choice(topic).title()} of {rng.choice(vocab[100:2000]).title()}"
+        fname = f"book_{i + 1:04d}_{book_id}.txt"
+        (books_dir / fname).write_text(text, encoding="utf-8")
+        metadata.append({
+            "book_id": book_id,
+            "title": title,
+            "filename": fname,
+            "cover": None,
+            "path": str(books_dir / fname),
+            "word_count": n,
+            "languages": ["en"],
+            "authors": [rng.choice(authors)],
+            "summary": None,
+        })
+
+    with (data_dir / "metadata.json").open("w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+def _zipf_cum_weights(n, s=1.07):
+    total = 0.0
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** s
+        yield total
+
+
+# ---------------------------------------------
+# Stages (run in a child process with DATA_DIR set)
+# ---------------------------------------------
+def current_rss_mb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb(who=None):
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    # kilobytes on Linux, bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def stage_build(args):
+    import resource
+
+    timings = {}
+    with redirect_stdout(sys.stderr):
+        from indexing import build_index
+        from similarity import build_similarity_graph
+        from pagerank import load_graph, compute_pagerank, save_pagerank
+
+        start = perf_counter()
+        build_index(**({"workers": args.workers} if args.workers else {}))
+        timings["index_secs"] = perf_counter() - start
+
+        start = perf_counter()
+        build_similarity_graph()
+        timings["similarity_secs"] = perf_counter() - start
+
+        start = perf_counter()
+        save_pagerank(compute_pagerank(load_graph()))
+        timings["pagerank_secs"] = perf_counter() - start
+
+        if args.mmap:
+            from packed import pack_all
+
+            start = perf_counter()
+            pack_all(os.environ["DATA_DIR"])
+            timings["pack_secs"] = perf_counter() - start
+
+        if not args.no_snapshot:
+            from snapshot import write_snapshot
+
+            start = perf_counter()
+            write_snapshot()
+            timings["snapshot_secs"] = perf_counter() - start
+
+    data_dir = Path(os.environ["DATA_DIR"])
+    timings["total_secs"] = sum(timings.values())
+    if os.environ.get("SIMILARITY_METHOD") == "minhash":
+        from similarity import check_minhash
+
+        # recall of the LSH build against the exact all-pairs graph
+        with redirect_stdout(sys.stderr):
+            timings["minhash"] = check_minhash()
+    timings["peak_rss_mb"] = peak_rss_mb()
+    timings["workers_peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+    timings["artifact_bytes"] = sum(
+        p.stat().st_size for p in data_dir.rglob("*")
+        if p.is_file() and p.parent.name != "books" and p.parent.name != "covers"
+    )
+    return timings
+
+
+def _query_mix(gen, rng, n):
+    """n (endpoint, url) pairs drawn from the loaded generation."""
+    index = gen.inverted_index
+    book_ids = list(gen.meta_by_id.keys())
+    titles = [gen.meta_by_id[b]["title"] for b in book_ids]
+
+    # terms by document frequency: common, mid-range and rare
+    by_df = sorted(range(len(index)), key=lambda j: -index.df[j])
+    common = [index.term_at(j) for j in by_df[:50]]
+    mid = [index.term_at(j) for j in by_df[len(by_df) // 10:len(by_df) // 10 + 200]]
+    rare = [index.term_at(j) for j in by_df[-200:]]
+    terms = common + mid + rare
+
+    def keyword():
+        mode = rng.choice(["tf", "tf", "pr", "tfpr", "bm25"])
+        return f"/search-keyword?q={rng.choice(terms)}&rank_mode={mode}"
+
+    def keyword_multi():
+        return f"/search-keyword?q={rng.choice(mid)}+{rng.choice(common)}&rank_mode=bm25"
+
+    def boolean():
+        a, b, c = rng.choice(common), rng.choice(mid), rng.choice(mid)
+        return f"/search-keyword?q={a}+AND+({b}+OR+{c})+-{rng.choice(rare)}"
+
+    def phrase():
+        a, b = rng.sample(common, 2)
+        return f'/search-keyword?q="{a}+{b}"'
+
+    def regex():
+        t = rng.choice(mid)
+        return f"/search-keyword?q=^{t[:2]}.*{t[-1]}$&advanced=true"
+
+    def title():
+        words = rng.choice(titles).split()
+        return f"/search-title?q={'+'.join(words[:rng.randint(1, len(words))])}"
+
+    def page_two():
+        return f"/search-keyword?q={rng.choice(common)}&page=2&page_size=20"
+
+    def book_page():
+        return f"/book-page/{rng.choice(book_ids)}?page={rng.randint(1, 20)}"
+
+    def recommend():
+        return f"/recommend/{rng.choice(book_ids)}"
+
+    def cards():
+        ids = rng.sample(book_ids, min(len(book_ids), 20))
+        return f"/books?ids={','.join(map(str, ids))}"
+
+    mix = [
+        ("search-keyword", keyword, 30),
+        ("search-keyword:multi", keyword_multi, 8),
+        ("search-keyword:boolean", boolean, 6),
+        ("search-keyword:phrase", phrase, 4),
+        ("search-keyword:regex", regex, 4),
+        ("search-keyword:page2", page_two, 8),
+        ("search-title", title, 15),
+        ("book-page", book_page, 10),
+        ("recommend", recommend, 15),
+        ("books", cards, 5),
+    ]
+    kinds = rng.choices(mix, weights=[w for _, _, w in mix], k=n)
+    return [(name, make()) for name, make, _ in kinds]
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[k]
+
+
+def latency_summary(latencies_ms):
+    values = sorted(latencies_ms)
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) if values else None,
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": values[-1] if values else None,
+    }
+
+
+async def _replay(app, requests, concurrency):
+    import httpx
+
+    results = [None] * len(requests)
+    pending = iter(enumerate(requests))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            for i, (_, url) in pending:
+                start = perf_counter()
+                resp = await client.get(url)
+                await resp.aread()
+                results[i] = ((perf_counter() - start) * 1000, resp.status_code)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def stage_serve(args):
+    start = perf_counter()
+    with redirect_stdout(sys.stderr):
+        import main
+        import_secs = perf_counter() - start
+        main.generations.wait()
+    if main.generations.current is None:
+        sys.exit("data load failed:\n" + str(main.generations.last_error))
+    startup = {
+        "import_secs": import_secs,
+        "ready_secs": perf_counter() - start,
+        "load_secs": main.generations.current.load_secs,
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    gen = main.generations.current
+    rng = random.Random(args.seed)
+    warmup = _query_mix(gen, rng, args.warmup)
+    requests = _query_mix(gen, rng, args.queries)
+
+    asyncio.run(_replay(main.app, warmup, args.concurrency))
+    start = perf_counter()
+    results = asyncio.run(_replay(main.app, requests, args.concurrency))
+    wall = perf_counter() - start
+
+    by_endpoint = {}
+    errors = {}
+    for (name, _), (ms, status) in zip(requests, results):
+        by_endpoint.setdefault(name, []).append(ms)
+        if status >= 400:
+            errors[name] = errors.get(name, 0) + 1
+
+    queries = {
+        "count": len(requests),
+        "concurrency": args.concurrency,
+        "wall_secs": wall,
+        "throughput_rps": len(requests) / wall if wall else None,
+        "errors": errors,
+        "overall": latency_summary([ms for ms, _ in results]),
+        "by_endpoint": {k: latency_summary(v) for k, v in sorted(by_endpoint.items())},
+        "rss_after_mb": current_rss_mb(),
+    }
+    return {"startup": startup, "queries": queries}
+
+
+STAGES = {"build": stage_build, "serve": stage_serve}
+
+
+# ---------------------------------------------
+# Driver
+# ---------------------------------------------
+def run_stage(stage, args, data_dir):
+    env = dict(os.environ, DATA_DIR=str(data_dir), RELOAD_POLL_SECS="0",
+               ARTIFACT_MMAP="true" if args.mmap else "false")
+    if not args.result_cache:
+        env["RESULT_CACHE_SIZE"] = "0"    # measure the engine, not the response cache
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--stage", stage, *args.argv]
+    proc = subprocess.run(cmd, env=env, cwd=HERE, stdout=subprocess.PIPE,
+                          stderr=None if args.verbose else subprocess.DEVNULL, text=True)
+    if proc.returncode != 0:
+        sys.exit(f"benchmark stage {stage!r} failed (exit {proc.returncode}); rerun with --verbose")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(report, prefix=""):
+    """{"a.b.c": number} for the numeric leaves of a report."""
+    flat = {}
+    for k, v in report.items():
+        key = f"{prefix}{k}"
+        if isinstance(v, dict):
+            flat.update(flatten(v, key + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            flat[key] = v
+    return flat
+
+
+def compare(old, new, out=sys.stderr):
+    """Print each shared metric old -> new with its relative change."""
+    a, b = flatten(old), flatten(new)
+    for key in sorted(a.keys() & b.keys()):
+        if key.startswith("config."):
+            continue
+        change = (b[key] - a[key]) / a[key] * 100 if a[key] else 0.0
+        print(f"{key:60s} {a[key]:14.3f} -> {b[key]:14.3f} ({change:+7.1f}%)", file=out)
+
+
+def parse_args(argv):
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("--books", type=int, default=200)
+    p.add_argument("--words", type=int, default=20000, help="average words per book")
+    p.add_argument("--vocab", type=int, default=20000)
+    p.add_argument("--queries", type=int, default=2000)
+    p.add_argument("--warmup", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--workers", type=int, default=0, help="index workers (default: INDEX_WORKERS)")
+    p.add_argument("--mmap", action="store_true", help="serve packed artifacts (ARTIFACT_MMAP)")
+    p.add_argument("--result-cache", action="store_true", help="keep the response cache on")
+    p.add_argument("--compress-books", action="store_true",
+                   help="store the corpus block-compressed (bookstore.py)")
+    p.add_argument("--no-snapshot", action="store_true",
+                   help="do not write snapshot.bin (cold start from the artifacts)")
+    p.add_argument("--data-dir", help="reuse/keep this DATA_DIR instead of a temp one")
+    p.add_argument("--skip-build", action="store_true", help="serve an existing --data-dir")
+    p.add_argument("--out", help="write the JSON report here (default: stdout)")
+    p.add_argument("--compare", help="previous report to compare against")
+    p.add_argument("--verbose", action="store_true", help="show stage output")
+    p.add_argument("--stage", choices=sorted(STAGES), help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+    # options forwarded to the stage processes
+    args.argv = [
+        "--seed", str(args.seed), "--queries", str(args.queries), "--warmup", str(args.warmup),
+        "--concurrency", str(args.concurrency), "--workers", str(args.workers),
+        *(["--mmap"] if args.mmap else []),
+        *(["--no-snapshot"] if args.no_snapshot else []),
+    ]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.stage:
+        print(json.dumps(STAGES[args.stage](args)))
+        return
+
+    tmp = None
+    if args.data_dir:
+        data_dir = Path(args.data_dir)
+    else:
+        tmp = tempfile.mkdtemp(prefix="bench_data_")
+        data_dir = Path(tmp)
+
+    try:
+        report = {
+            "version": REPORT_VERSION,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": {
+                "books": args.books, "words_per_book": args.words, "vocab": args.vocab,
+                "queries": args.queries, "warmup": args.warmup,
+                "concurrency": args.concurrency, "seed": args.seed, "mmap": args.mmap,
+                "result_cache": args.result_cache, "snapshot": not args.no_snapshot,
+                "compress_books": args.compress_books,
+                "similarity_method": os.environ.get("SIMILARITY_METHOD", "exact"),
+            },
+        }
+        report["corpus"] = {}
+        if not args.skip_build:
+            start = perf_counter()
+            generate_corpus(data_dir, args.books, args.words, args.vocab, seed=args.seed)
+            report["corpus"]["generate_secs"] = perf_counter() - start
+            if args.compress_books:
+                from bookstore import compress_book
+
+                for path in (data_dir / "books").glob("*.txt"):
+                    compress_book(path)
+        files = list((data_dir / "books").iterdir())
+        report["corpus"].update(books=len(files), bytes=sum(p.stat().st_size for p in files))
+        if not args.skip_build:
+            report["build"] = run_stage("build", args, data_dir)
+        report.update(run_stage("serve", args, data_dir))
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
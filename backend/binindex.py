@@ -0,0 +1,476 @@
+# backend/binindex.py
+#
+# Compact on-disk inverted index.
+#
+# Layout (all integers little-endian):
+#
+#   header     fixed HEADER_SIZE bytes (see HEADER below)
+#   postings   one block per term: varint-encoded (delta book_id, tf[, first
+#              [, plen]]) tuples; `first` is the byte offset of the term's
+#              first occurrence in the book file (used for snippets), `plen`
+#              the byte length of the posting's run in positions.bin
+#   terms      utf-8 terms concatenated in sorted order
+#   term_offs  uint64[n_terms + 1]  start of each term inside `terms`
+#   post_offs  uint64[n_terms + 1]  start of each block inside `postings`
+#   df         uint32[n_terms]      number of books per term
+#
+# Terms are written in sorted (utf-8 byte) order so lookups are a binary
+# search over `term_offs`; posting lists are only decoded on demand.
+#
+# positions.bin (optional, width-4 indexes) holds token positions:
+#
+#   header     POS_HEADER
+#   blob       per term, per posting: delta-encoded token positions
+#   pos_offs   uint64[n_terms + 1]  start of each term's runs inside `blob`
+
+import heapq
+import itertools
+import json
+import mmap
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+MAGIC = b"BSIX"
+VERSION = 2
+
+# magic, version, width (fields per posting), n_terms, n_docs,
+# postings_off, terms_off, term_offs_off, post_offs_off, df_off, end
+# (version 1 had a u32 version and no width: it reads back as width 0)
+HEADER = struct.Struct("<4sHHII6Q")
+HEADER_SIZE = 64
+
+POS_MAGIC = b"BSPS"
+# magic, version, reserved, n_terms, pos_offs_off
+POS_HEADER = struct.Struct("<4sHHIQ")
+
+
+# ---------------------------------------------
+# Varint helpers
+# ---------------------------------------------
+def encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varint(buf, pos: int):
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_postings(postings) -> bytes:
+    """postings: iterable of (book_id, tf, ...) tuples sorted by book_id."""
+    out = bytearray()
+    prev = 0
+    for p in postings:
+        encode_varint(p[0] - prev, out)
+        for v in p[1:]:
+            encode_varint(v, out)
+        prev = p[0]
+    return bytes(out)
+
+
+def encode_deltas(values) -> bytes:
+    """Ascending ints as varint gaps (token positions)."""
+    out = bytearray()
+    prev = 0
+    for v in values:
+        encode_varint(v - prev, out)
+        prev = v
+    return bytes(out)
+
+
+def decode_deltas(buf, pos: int, end: int):
+    values = []
+    v = 0
+    while pos < end:
+        delta, pos = decode_varint(buf, pos)
+        v += delta
+        values.append(v)
+    return values
+
+
+def decode_postings(buf, pos: int, count: int, width: int = 2):
+    """Inverse of encode_postings; returns (tuples, end position)."""
+    result = []
+    book_id = 0
+    for _ in range(count):
+        delta, pos = decode_varint(buf, pos)
+        book_id += delta
+        fields = [book_id]
+        for _ in range(width - 1):
+            v, pos = decode_varint(buf, pos)
+            fields.append(v)
+        result.append(tuple(fields))
+    return result, pos
+
+
+def to_le(arr: array) -> bytes:
+    if sys.byteorder == "big":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _from_le(typecode: str, data) -> array:
+    arr = array(typecode)
+    arr.frombytes(data)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+def typed_view(buf, off: int, typecode: str, count: int):
+    """Zero-copy typed view of a little-endian array inside `buf`."""
+    size = array(typecode).itemsize * count
+    if sys.byteorder == "big":
+        return _from_le(typecode, buf[off:off + size])
+    return memoryview(buf)[off:off + size].cast(typecode)
+
+
+def open_buffer(path, use_mmap=False):
+    """Read a file into memory, or map it read-only so processes share pages."""
+    with Path(path).open("rb") as f:
+        if use_mmap:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return f.read()
+
+
+def pad8(f):
+    # keep fixed-width sections 8-byte aligned
+    pos = f.tell()
+    if pos % 8:
+        f.write(b"\0" * (8 - pos % 8))
+    return f.tell()
+
+
+# ---------------------------------------------
+# Writer (streaming, terms must arrive sorted)
+# ---------------------------------------------
+class IndexWriter:
+    def __init__(self, path, width=2, positions_path=None):
+        self.path = Path(path)
+        self.width = width
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.f = self.tmp_path.open("wb")
+        self.f.write(b"\0" * HEADER_SIZE)
+
+        self.pos_f = None
+        if positions_path is not None:
+            self.pos_path = Path(positions_path)
+            self.pos_tmp_path = self.pos_path.with_name(self.pos_path.name + ".tmp")
+            self.pos_f = self.pos_tmp_path.open("wb")
+            self.pos_f.write(b"\0" * POS_HEADER.size)
+            self.pos_offs = array("Q", [0])
+
+        self.terms = bytearray()
+        self.term_offs = array("Q", [0])
+        self.post_offs = array("Q", [0])
+        self.df = array("I")
+        self.doc_ids = set()
+        self.last_term = None
+
+    def add(self, term: str, postings, positions=b""):
+        """Append one term. `postings` is a list of (book_id, tf[, first
+        [, plen]]) tuples (`width` fields each) sorted by book_id; with a
+        positions file, `positions` is the concatenation of every posting's
+        encode_deltas() run, `plen` being each run's length."""
+        key = term if isinstance(term, bytes) else term.encode("utf-8")
+        if self.last_term is not None and key <= self.last_term:
+            raise ValueError(f"terms must be added in sorted order ({term!r})")
+        self.last_term = key
+
+        block = encode_postings(postings)
+        self.f.write(block)
+
+        self.terms += key
+        self.term_offs.append(len(self.terms))
+        self.post_offs.append(self.post_offs[-1] + len(block))
+        self.df.append(len(postings))
+        self.doc_ids.update(p[0] for p in postings)
+
+        if self.pos_f is not None:
+            self.pos_f.write(positions)
+            self.pos_offs.append(self.pos_offs[-1] + len(positions))
+
+    def close(self):
+        f = self.f
+        postings_off = HEADER_SIZE
+        terms_off = f.tell()
+        f.write(self.terms)
+        term_offs_off = pad8(f)
+        f.write(to_le(self.term_offs))
+        post_offs_off = f.tell()
+        f.write(to_le(self.post_offs))
+        df_off = f.tell()
+        f.write(to_le(self.df))
+        end = f.tell()
+
+        f.seek(0)
+        f.write(HEADER.pack(
+            MAGIC, VERSION, self.width, len(self.df), len(self.doc_ids),
+            postings_off, terms_off, term_offs_off, post_offs_off, df_off, end,
+        ))
+        f.close()
+
+        if self.pos_f is not None:
+            pf = self.pos_f
+            pos_offs_off = pad8(pf)
+            pf.write(to_le(self.pos_offs))
+            pf.seek(0)
+            pf.write(POS_HEADER.pack(POS_MAGIC, 1, 0, len(self.df), pos_offs_off))
+            pf.close()
+            self.pos_tmp_path.replace(self.pos_path)
+        self.tmp_path.replace(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+            self.tmp_path.unlink(missing_ok=True)
+            if self.pos_f is not None:
+                self.pos_f.close()
+                self.pos_tmp_path.unlink(missing_ok=True)
+
+
+def write_index(inverted_index: dict, path):
+    """Write a {term: {book_id: tf}} mapping as a binary index."""
+    with IndexWriter(path) as w:
+        for term in sorted(inverted_index, key=lambda t: t.encode("utf-8")):
+            w.add(term, sorted((int(b), tf) for b, tf in inverted_index[term].items()))
+
+
+# ---------------------------------------------
+# Sorted runs (partial indexes spilled by the builder)
+#
+# A run is a sequence of records sorted by term bytes:
+#   varint len(term), term, varint n_postings, encode_postings(...),
+#   positions (sum of the postings' last field, `plen`, bytes)
+# ---------------------------------------------
+def write_run(path, records):
+    """records: iterable of (term_bytes, postings, positions) already sorted
+    by term. Postings all have the same number of fields, the last one being
+    the byte length of that posting's slice of `positions`."""
+    with Path(path).open("wb") as f:
+        out = bytearray()
+        for key, postings, positions in records:
+            encode_varint(len(key), out)
+            out += key
+            encode_varint(len(postings), out)
+            out += encode_postings(postings)
+            out += positions
+            if len(out) >= 1 << 20:
+                f.write(out)
+                out.clear()
+        f.write(out)
+
+
+def read_run(path, width):
+    """Yield (term_bytes, postings, positions) from a run file without
+    loading it."""
+    with Path(path).open("rb") as f:
+        if f.seek(0, 2) == 0:
+            return
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with buf:
+        pos, end = 0, len(buf)
+        while pos < end:
+            n, pos = decode_varint(buf, pos)
+            key = buf[pos:pos + n]
+            pos += n
+            count, pos = decode_varint(buf, pos)
+            postings, pos = decode_postings(buf, pos, count, width)
+            size = sum(p[-1] for p in postings)
+            yield key, postings, buf[pos:pos + size]
+            pos += size
+
+
+def merge_runs(paths, width):
+    """k-way merge of runs; yields (term_bytes, postings, positions) in term
+    order, postings sorted by book_id with their positions following."""
+    merged = heapq.merge(*(read_run(p, width) for p in paths), key=lambda r: r[0])
+    for key, group in itertools.groupby(merged, key=lambda r: r[0]):
+        pairs = []
+        for _, postings, positions in group:
+            start = 0
+            for p in postings:
+                pairs.append((p, positions[start:start + p[-1]]))
+                start += p[-1]
+        pairs.sort(key=lambda pair: pair[0][0])
+        yield key, [p for p, _ in pairs], b"".join(chunk for _, chunk in pairs)
+
+
+# ---------------------------------------------
+# Reader
+# ---------------------------------------------
+class BinaryIndex:
+    """Read-only view over an index file; postings are decoded lazily.
+
+    With use_mmap=True the file is mapped instead of read, so every worker
+    process on the node shares one page-cache copy.
+    """
+
+    def __init__(self, path, use_mmap=False, positions_path=None):
+        self.path = Path(path)
+        self.buf = open_buffer(self.path, use_mmap)
+        self._parse()
+
+        self.pos_buf = None
+        if positions_path is not None and self.width >= 4:
+            self.pos_buf = open_buffer(positions_path, use_mmap)
+            magic, _, _, n, pos_offs_off = POS_HEADER.unpack_from(self.pos_buf, 0)
+            if magic != POS_MAGIC or n != self.n_terms:
+                raise ValueError(f"{positions_path} does not match {self.path}")
+            self.pos_offs = typed_view(self.pos_buf, pos_offs_off, "Q", n + 1)
+
+    def _parse(self):
+        buf = self.buf
+        (magic, version, self.width, self.n_terms, self.n_docs,
+         self.postings_off, self.terms_off, term_offs_off, post_offs_off,
+         df_off, end) = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a binary index")
+        if version == 1:
+            self.width = 2
+        elif version != VERSION:
+            raise ValueError(f"{self.path}: unsupported index version {version}")
+
+        n = self.n_terms
+        self.term_offs = typed_view(buf, term_offs_off, "Q", n + 1)
+        self.post_offs = typed_view(buf, post_offs_off, "Q", n + 1)
+        self.df = typed_view(buf, df_off, "I", n)
+
+    # --- term dictionary ---------------------------------
+    def term_at(self, i: int) -> str:
+        start = self.terms_off + self.term_offs[i]
+        end = self.terms_off + self.term_offs[i + 1]
+        return bytes(self.buf[start:end]).decode("utf-8")
+
+    def term_bytes(self, i: int) -> bytes:
+        """The i-th term as utf-8 bytes (the dictionary's sort key)."""
+        start = self.terms_off + self.term_offs[i]
+        return bytes(self.buf[start:self.terms_off + self.term_offs[i + 1]])
+
+    def lower_bound(self, key: bytes) -> int:
+        """First position whose term (as utf-8 bytes) is >= key."""
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.term_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, term: str) -> int:
+        """Position of `term` in the dictionary, or -1."""
+        key = term.encode("utf-8")
+        lo = self.lower_bound(key)
+        if lo < self.n_terms and self.term_bytes(lo) == key:
+            return lo
+        return -1
+
+    def prefix_range(self, prefix: str):
+        """(lo, hi) positions of the terms starting with `prefix`."""
+        key = prefix.encode("utf-8")
+        # 0xff never occurs in utf-8, so key + 0xff sorts after every
+        # term that starts with key
+        return self.lower_bound(key), self.lower_bound(key + b"\xff")
+
+    def __contains__(self, term) -> bool:
+        return self.find(term) >= 0
+
+    def __len__(self):
+        return self.n_terms
+
+    def keys(self):
+        for i in range(self.n_terms):
+            yield self.term_at(i)
+
+    __iter__ = keys
+
+    # --- postings ----------------------------------------
+    @property
+    def has_offsets(self) -> bool:
+        return self.width >= 3
+
+    def postings_at(self, i: int, full=False):
+        """Decoded postings of the i-th term as [(book_id, tf), ...];
+        full=True keeps every stored field, e.g. (book_id, tf, first)."""
+        pos = self.postings_off + self.post_offs[i]
+        result, _ = decode_postings(self.buf, pos, self.df[i], self.width)
+        if full or self.width == 2:
+            return result
+        return [p[:2] for p in result]
+
+    def postings(self, term: str, full=False):
+        i = self.find(term)
+        return self.postings_at(i, full) if i >= 0 else []
+
+    @property
+    def has_positions(self) -> bool:
+        return self.pos_buf is not None
+
+    def positions_at(self, i: int, book_ids):
+        """{book_id: [token positions]} of the i-th term for the given books."""
+        wanted = set(book_ids)
+        result = {}
+        start = POS_HEADER.size + self.pos_offs[i]
+        for p in self.postings_at(i, full=True):
+            end = start + p[3]
+            if p[0] in wanted:
+                result[p[0]] = decode_deltas(self.pos_buf, start, end)
+            start = end
+        return result
+
+    def position_chunks_at(self, i: int):
+        """[(posting, encoded positions)] of the i-th term, positions left
+        encoded (for rewriting them into another index)."""
+        start = POS_HEADER.size + self.pos_offs[i]
+        chunks = []
+        for p in self.postings_at(i, full=True):
+            end = start + p[3]
+            chunks.append((p, bytes(self.pos_buf[start:end])))
+            start = end
+        return chunks
+
+    def items(self):
+        for i in range(self.n_terms):
+            yield self.term_at(i), self.postings_at(i)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.buf)
+
+    @property
+    def posting_bytes(self) -> int:
+        """Size of the encoded postings (and positions, when loaded)."""
+        return self.post_offs[self.n_terms] + (len(self.pos_buf) if self.pos_buf is not None else 0)
+
+
+# ---------------------------------------------
+# JSON export / import
+# ---------------------------------------------
+def export_json(index: BinaryIndex, path):
+    """Write the legacy {term: {book_id: tf}} index.json."""
+    with Path(path).open("w", encoding="utf-8") as f:
+        json.dump({t: {str(p[0]): p[1] for p in ps} for t, ps in index.items()}, f)
+
+
+def import_json(json_path, path):
+    with Path(json_path).open("r", encoding="utf-8") as f:
+        write_index(json.load(f), path)
@@ -0,0 +1,46 @@
+# backend/bm25.py
+#
+# Okapi BM25 over the binary index.
+#
+# build_index writes every book's length (indexed tokens) to doclens.bin;
+# document frequencies are already stored per term in index.bin. At load
+# time each book's length normalisation k1 * (1 - b + b * dl / avgdl) is
+# computed once, so scoring a posting list is one dict lookup and a few
+# float operations per posting.
+
+import math
+import os
+
+BM25_K1 = float(os.environ.get("BM25_K1", "1.2"))
+BM25_B = float(os.environ.get("BM25_B", "0.75"))
+# weight of the PageRank prior in rank_mode="bm25pr"
+BM25_PR_WEIGHT = float(os.environ.get("BM25_PR_WEIGHT", "1.0"))
+
+
+class BM25:
+    def __init__(self, doc_lengths, n_docs=None, k1=BM25_K1, b=BM25_B):
+        """doc_lengths: book_id -> number of indexed tokens (books missing
+        from it are scored as average length)."""
+        self.k1 = k1
+        self.b = b
+        self.n_docs = n_docs or len(doc_lengths)
+        total = sum(doc_lengths.values())
+        self.avgdl = (total / len(doc_lengths)) if total else 1.0
+        self.norm = {
+            bid: k1 * (1 - b + b * dl / self.avgdl) for bid, dl in doc_lengths.items()
+        }
+
+    def idf(self, df: int) -> float:
+        return math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def score(self, postings, df: int):
+        """[(book_id, tf, ...)] -> [bm25 contribution of each posting]."""
+        idf = self.idf(df)
+        k1p = self.k1 + 1
+        norm = self.norm
+        default = self.k1
+        return [idf * p[1] * k1p / (p[1] + norm.get(p[0], default)) for p in postings]
+
+    def with_prior(self, score: float, pr: float) -> float:
+        """BM25 plus a log PageRank prior (pr * n_docs is 1 for an average book)."""
+        return score + BM25_PR_WEIGHT * math.log1p(pr * self.n_docs)
@@ -0,0 +1,67 @@
+# backend/bookio.py
+#
+# Bounded async I/O for book files.
+#
+# Sync endpoints run in the event loop's shared threadpool, so a burst of
+# reader traffic (each request blocking on disk) used to take every worker
+# thread and queue the search requests behind it. File-backed endpoints are
+# now async and push their reads through an IOLane: its blocking calls run on
+# worker threads gated by the lane's own CapacityLimiter, never by the
+# default one the search handlers use. Each endpoint gets its own lane, so a
+# flood of /book downloads cannot starve /book-page either.
+
+import os
+
+import anyio
+import anyio.to_thread
+
+_DONE = object()
+
+
+class IOLane:
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._limiter = None    # created lazily: needs a running event loop
+
+    @property
+    def limiter(self):
+        if self._limiter is None:
+            self._limiter = anyio.CapacityLimiter(self.limit)
+        return self._limiter
+
+    async def run(self, fn, *args):
+        """fn(*args) on a worker thread, at most `limit` at a time."""
+        return await anyio.to_thread.run_sync(fn, *args, limiter=self.limiter)
+
+    async def iterate(self, iterator):
+        """Async iterator over a blocking iterator, one item per thread hop.
+        The iterator is closed (and its file with it) if the client leaves."""
+        try:
+            while True:
+                item = await self.run(next, iterator, _DONE)
+                if item is _DONE:
+                    return
+                yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                await self.run(close)
+
+    def stats(self):
+        if self._limiter is None:
+            return {"limit": self.limit, "busy": 0, "waiting": 0}
+        stats = self._limiter.statistics()
+        return {
+            "limit": self.limit,
+            "busy": stats.borrowed_tokens,
+            "waiting": stats.tasks_waiting,
+        }
+
+
+# per-endpoint concurrency limits
+BOOK_IO_LIMIT = int(os.environ.get("BOOK_IO_LIMIT", "8"))
+BOOK_PAGE_IO_LIMIT = int(os.environ.get("BOOK_PAGE_IO_LIMIT", "16"))
+
+book_lane = IOLane("book", BOOK_IO_LIMIT)
+book_page_lane = IOLane("book-page", BOOK_PAGE_IO_LIMIT)
@@ -0,0 +1,337 @@
+# backend/bookstore.py
+#
+# Random access into book files.
+#
+# Book files are decoded as UTF-8 with errors ignored and universal newlines
+# (what open(..., "r", errors="ignore") returns), so character positions do
+# not map linearly to bytes. At index time we record (char, byte) checkpoints
+# at line starts every ~PAGE_STRIDE characters; a page read then seeks to the
+# nearest checkpoint and decodes only from there.
+#
+# Books can also be stored block-compressed (NAME.txt.blk next to, or
+# instead of, NAME.txt): the raw bytes are cut into BLOCK_SIZE blocks, each
+# zlib-compressed on its own, behind a table of their offsets. BlockFile
+# reads such a file as if it were the raw one (same byte offsets, so the
+# checkpoints and stored match offsets still apply), inflating only the
+# blocks a read touches. open_book() picks whichever copy exists. Inflated
+# blocks are kept in a small per-process LRU, so paging through a book or
+# re-reading a popular one does not inflate the same block again.
+
+import io
+import json
+import os
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from pathlib import Path
+
+from binindex import to_le, typed_view
+
+PAGE_STRIDE = 1000
+STREAM_CHARS = 64 * 1024
+
+BLOCKS_SUFFIX = ".blk"
+BLOCKS_MAGIC = b"BSBK"
+# magic, block size, block count, raw size
+BLOCKS_HEADER = struct.Struct("<4sIIQ")
+# a 5000-character page mostly falls in one block; bigger blocks compress a
+# little better but make every uncached page read inflate more
+BLOCK_SIZE = int(os.environ.get("BOOK_BLOCK_SIZE", str(16 * 1024)))
+BLOCK_LEVEL = 9
+# budget of the inflated-block LRU (0 disables it)
+BLOCK_CACHE_MB = float(os.environ.get("BOOK_BLOCK_CACHE_MB", "64"))
+
+
+class PageCheckpoints:
+    """Incremental page_checkpoints over a book's raw bytes fed in chunks."""
+
+    def __init__(self, stride: int = PAGE_STRIDE):
+        self.stride = stride
+        self.chars = array("Q", [0])
+        self.offsets = array("Q", [0])
+        self.c = self.b = 0
+        self.prev_cr = False
+        self.pending = b""
+
+    def feed(self, chunk: bytes):
+        lines = (self.pending + chunk).splitlines(keepends=True)
+        # the last line may go on in the next chunk ("\r" may still get its "\n")
+        self.pending = lines.pop() if lines else b""
+        for line in lines:
+            self._line(line)
+
+    def _line(self, line: bytes):
+        text = line.decode("utf-8", errors="ignore")
+        # "\r" + (ignored bytes) + "\n" still decodes to one newline
+        merged = self.prev_cr and text.startswith("\n")
+        if not merged and self.c - self.chars[-1] >= self.stride:
+            self.chars.append(self.c)
+            self.offsets.append(self.b)
+        n = len(text)
+        if text.endswith("\r\n"):
+            n -= 1  # read back as a single "\n"
+        if merged:
+            n -= 1
+        self.prev_cr = text.endswith("\r") and not text.endswith("\r\n") or (self.prev_cr and not text)
+        self.c += n
+        self.b += len(line)
+
+    def finish(self):
+        """(total_chars, char positions, byte offsets)."""
+        if self.pending:
+            self._line(self.pending)
+            self.pending = b""
+        return self.c, self.chars, self.offsets
+
+
+def page_checkpoints(raw: bytes, stride: int = PAGE_STRIDE):
+    """(total_chars, char positions, byte offsets) for a book's raw bytes."""
+    pages = PageCheckpoints(stride)
+    pages.feed(raw)
+    return pages.finish()
+
+
+# ---------------------------------------------
+# Block-compressed book files
+# ---------------------------------------------
+def blocks_path(path) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + BLOCKS_SUFFIX)
+
+
+def write_blocks(chunks, path, block_size: int = BLOCK_SIZE):
+    """Write the raw bytes yielded by `chunks` to `path` as compressed blocks."""
+    path = Path(path)
+    blocks = []
+    offsets = array("Q", [0])
+    size = 0
+
+    def add(block):
+        nonlocal size
+        blocks.append(zlib.compress(block, BLOCK_LEVEL))
+        offsets.append(offsets[-1] + len(blocks[-1]))
+        size += len(block)
+
+    pending = bytearray()
+    for chunk in chunks:
+        pending += chunk
+        while len(pending) >= block_size:
+            add(bytes(pending[:block_size]))
+            del pending[:block_size]
+    if pending:
+        add(bytes(pending))
+
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(BLOCKS_HEADER.pack(BLOCKS_MAGIC, block_size, len(blocks), size))
+        f.write(to_le(offsets))
+        for block in blocks:
+            f.write(block)
+    tmp.replace(path)
+
+
+def compress_book(path, block_size: int = BLOCK_SIZE):
+    """Replace a raw book file by its block-compressed copy."""
+    path = Path(path)
+    with path.open("rb") as f:
+        write_blocks(iter(lambda: f.read(STREAM_CHARS), b""), blocks_path(path), block_size)
+    path.unlink()
+
+
+class BlockCache:
+    """Thread-safe LRU of inflated blocks, bounded in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = OrderedDict()     # (file key, block number) -> bytes
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            block = self._items.get(key)
+            if block is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return block
+
+    def put(self, key, block: bytes):
+        if len(block) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old)
+            self._items[key] = block
+            self.nbytes += len(block)
+            while self.nbytes > self.max_bytes:
+                _, dropped = self._items.popitem(last=False)
+                self.nbytes -= len(dropped)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "blocks": len(self._items),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+block_cache = BlockCache(int(BLOCK_CACHE_MB * 2**20))
+
+
+class BlockFile(io.RawIOBase):
+    """Read-only, seekable view of the raw bytes of a .blk file."""
+
+    def __init__(self, path):
+        self.f = open(path, "rb")
+        try:
+            magic, self.block_size, n, self.size = BLOCKS_HEADER.unpack(
+                self.f.read(BLOCKS_HEADER.size))
+            if magic != BLOCKS_MAGIC:
+                raise ValueError(f"{path}: bad magic {magic!r}")
+            self.offsets = typed_view(self.f.read(8 * (n + 1)), 0, "Q", n + 1)
+        except Exception:
+            self.f.close()
+            raise
+        self.data_start = self.f.tell()
+        st = os.fstat(self.f.fileno())
+        # a rewritten file gets a new key, so the cache never serves stale blocks
+        self.key = (str(path), st.st_ino, st.st_mtime_ns)
+        self.pos = 0
+        self._block = (-1, b"")     # last inflated block
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self.pos = offset
+        return self.pos
+
+    def _load(self, i: int) -> bytes:
+        if self._block[0] != i:
+            block = block_cache.get((self.key, i))
+            if block is None:
+                lo, hi = self.offsets[i], self.offsets[i + 1]
+                self.f.seek(self.data_start + lo)
+                block = zlib.decompress(self.f.read(hi - lo))
+                block_cache.put((self.key, i), block)
+            self._block = (i, block)
+        return self._block[1]
+
+    def readinto(self, b):
+        if self.pos >= self.size:
+            return 0
+        i, start = divmod(self.pos, self.block_size)
+        block = self._load(i)
+        n = min(len(b), len(block) - start)
+        b[:n] = block[start:start + n]
+        self.pos += n
+        return n
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+
+def open_book(path):
+    """Binary file over a book's raw bytes (block-compressed copy if any)."""
+    try:
+        return io.BufferedReader(BlockFile(blocks_path(path)))
+    except FileNotFoundError:
+        return open(path, "rb")
+
+
+def open_book_text(path):
+    """Book text decoded the way open(path, "r", errors="ignore") would."""
+    return io.TextIOWrapper(open_book(path), encoding="utf-8", errors="ignore")
+
+
+def book_exists(path) -> bool:
+    return blocks_path(path).exists() or Path(path).exists()
+
+
+def read_chars(path, checkpoints, start: int, count: int) -> str:
+    """`count` characters from character position `start` of a book file."""
+    chars, offsets = checkpoints
+    i = max(0, bisect_right(chars, start) - 1)
+    with open_book(path) as raw:
+        raw.seek(offsets[i])
+        f = io.TextIOWrapper(raw, encoding="utf-8", errors="ignore")
+        skip = start - chars[i]
+        while skip > 0:
+            skipped = len(f.read(min(skip, STREAM_CHARS)))
+            if not skipped:
+                return ""
+            skip -= skipped
+        return f.read(count)
+
+
+def iter_text(path, chunk_chars: int = STREAM_CHARS):
+    with open_book_text(path) as f:
+        while True:
+            chunk = f.read(chunk_chars)
+            if not chunk:
+                return
+            yield chunk
+
+
+def iter_json_with_text(fields: dict, text_key: str, path):
+    """Stream `fields` as a JSON object whose `text_key` value is the book
+    text, without ever holding the whole text in memory."""
+    before = {}
+    after = {}
+    target = before
+    for k, v in fields.items():
+        if k == text_key:
+            target = after
+        else:
+            target[k] = v
+
+    head = json.dumps(before, ensure_ascii=False)[:-1]
+    yield (head + (", " if before else "") + json.dumps(text_key) + ': "').encode("utf-8")
+    for chunk in iter_text(path):
+        yield json.dumps(chunk, ensure_ascii=False)[1:-1].encode("utf-8")
+    tail = json.dumps(after, ensure_ascii=False)[1:]
+    yield ('"' + (", " if after else "") + tail).encode("utf-8")
+
+
+if __name__ == "__main__":
+    # python bookstore.py --compress   block-compress the raw books in BOOKS_DIR
+    import sys
+    from indexing import BOOKS_DIR
+
+    if "--compress" not in sys.argv:
+        sys.exit("usage: python bookstore.py --compress")
+    before = after = n = 0
+    for path in sorted(BOOKS_DIR.glob("*.txt")):
+        before += path.stat().st_size
+        compress_book(path)
+        after += blocks_path(path).stat().st_size
+        n += 1
+    if n:
+        print(f"Compressed {n} books: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB")
+    else:
+        print("No raw books to compress.")
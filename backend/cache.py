@@ -0,0 +1,119 @@
+# backend/cache.py
+#
+# In-process cache of finished endpoint responses.
+#
+# Popular keywords and /recommend lookups repeat all day, so whole response
+# bodies are kept in a size-bounded LRU with a TTL. Entries are tagged with
+# the artifact version: when scripts/build_data.sh rewrites .data_version
+# (checked at most once per RESULT_CACHE_CHECK_SECS) everything cached so far
+# is dropped.
+
+import os
+import threading
+from collections import OrderedDict
+from time import monotonic, time_ns
+
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "2048"))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "600"))
+RESULT_CACHE_CHECK_SECS = float(os.environ.get("RESULT_CACHE_CHECK_SECS", "1"))
+
+
+def read_data_version(path):
+    """Token identifying the current artifacts (None if never built)."""
+    try:
+        st = os.stat(path)
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip(), st.st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def touch_data_version(path) -> bool:
+    """Give the version file a new mtime (part of its token) without changing
+    its contents, so every process polling it sees a new version. False if
+    it does not exist."""
+    try:
+        old = os.stat(path).st_mtime_ns
+        now = time_ns()
+        os.utime(path, ns=(now, max(now, old + 1)))
+        return True
+    except FileNotFoundError:
+        return False
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache invalidated by a version file."""
+
+    def __init__(self, version_path, max_entries=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL,
+                 check_secs=RESULT_CACHE_CHECK_SECS):
+        self.version_path = version_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.check_secs = check_secs
+        self._items = OrderedDict()     # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._version = read_data_version(version_path)
+        self._next_check = monotonic() + check_secs
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def _check_version(self, now):
+        # caller holds the lock
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_secs
+        version = read_data_version(self.version_path)
+        if version != self._version:
+            self._version = version
+            self._items.clear()
+            self.invalidations += 1
+
+    def get(self, key):
+        """Cached value or None."""
+        now = monotonic()
+        with self._lock:
+            if self.max_entries <= 0:
+                return None
+            self._check_version(now)
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= now:
+                del self._items[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        now = monotonic()
+        with self._lock:
+            if self.max_entries <= 0:
+                return
+            self._check_version(now)
+            self._items[key] = (now + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "max_entries": self.max_entries,
+                "ttl_secs": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
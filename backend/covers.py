@@ -0,0 +1,166 @@
+# backend/covers.py
+#
+# Resized cover variants and their HTTP caching.
+#
+# download_books.py keeps each cover as Gutenberg serves it
+# (covers/cover_ID.jpg), while result grids show it at thumbnail size.
+# `python covers.py` (run by scripts/build_data.sh) scales every cover down
+# to fit each box in COVER_VARIANTS, re-encodes it as a progressive JPEG and
+# names the file after a hash of its bytes (cover_ID.thumb.<hash>.jpg).
+# covers.json maps each book to its current variant names; covers whose
+# source file has not changed since the last run are skipped.
+#
+# A hashed name never changes content, so CoverFiles serves those with an
+# immutable Cache-Control and the hash as a strong ETag; the original files
+# get a short max-age and are revalidated with their ETag.
+
+import hashlib
+import io
+import json
+import os
+import re
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from indexing import DATA_DIR, COVERS_DIR, METADATA_PATH
+
+COVERS_MANIFEST = DATA_DIR / "covers.json"
+# variant -> (max width, max height); covers are never scaled up
+COVER_VARIANTS = {"thumb": (160, 240), "medium": (400, 600)}
+COVER_QUALITY = int(os.environ.get("COVER_QUALITY", "80"))
+HASH_CHARS = 12
+HASHED_NAME_RE = re.compile(r"\.([0-9a-f]{%d})\.jpg$" % HASH_CHARS)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# originals keep their name when a rebuild replaces them
+ORIGINAL_MAX_AGE = int(os.environ.get("COVER_MAX_AGE", "3600"))
+
+
+def load_cover_manifest():
+    """book_id -> {"source": [...], variant: file name, ...} ({} before the
+    first covers.py run)."""
+    if not COVERS_MANIFEST.exists():
+        return {}
+    with COVERS_MANIFEST.open("r", encoding="utf-8") as f:
+        return {int(k): v for k, v in json.load(f).items()}
+
+
+# ---------------------------------------------
+# Build
+# ---------------------------------------------
+def render_variant(img, box, quality=COVER_QUALITY) -> bytes:
+    from PIL import Image
+
+    im = img.copy()
+    im.thumbnail(box, Image.LANCZOS)
+    if im.mode != "RGB":
+        im = im.convert("RGB")
+    out = io.BytesIO()
+    im.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def _variants(src: Path):
+    """variant -> (file name, bytes) for one cover file."""
+    from PIL import Image     # only the data build needs Pillow
+
+    raw = src.read_bytes()
+    with Image.open(src) as img:
+        img.load()
+        out = {}
+        for variant, box in COVER_VARIANTS.items():
+            data = render_variant(img, box)
+            fits = img.width <= box[0] and img.height <= box[1]
+            if fits and img.format == "JPEG" and len(raw) <= len(data):
+                data = raw      # already small: re-encoding would only grow it
+            digest = hashlib.sha256(data).hexdigest()[:HASH_CHARS]
+            out[variant] = (f"{src.stem}.{variant}.{digest}.jpg", data)
+    return out
+
+
+def build_covers():
+    from PIL import Image
+
+    with METADATA_PATH.open("r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    previous = load_cover_manifest()
+    manifest = {}
+    built = kept = failed = 0
+
+    for m in metadata:
+        cover = m.get("cover")
+        src = COVERS_DIR / cover if cover else None
+        if src is None or not src.exists():
+            continue
+        st = src.stat()
+        source = [cover, st.st_size, st.st_mtime_ns]
+
+        old = previous.get(m["book_id"])
+        if old and old["source"] == source and all(
+            v in old and (COVERS_DIR / old[v]).exists() for v in COVER_VARIANTS
+        ):
+            manifest[m["book_id"]] = old
+            kept += 1
+            continue
+
+        try:
+            variants = _variants(src)
+        except (OSError, Image.DecompressionBombError) as e:
+            print(f"Skipping cover {cover}: {e}")
+            failed += 1
+            continue
+        entry = {"source": source}
+        for variant, (name, data) in variants.items():
+            path = COVERS_DIR / name
+            if not path.exists():
+                tmp = path.with_name(name + ".tmp")
+                tmp.write_bytes(data)
+                tmp.replace(path)
+            entry[variant] = name
+        manifest[m["book_id"]] = entry
+        built += 1
+
+    tmp = COVERS_MANIFEST.with_name(COVERS_MANIFEST.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump({str(k): v for k, v in manifest.items()}, f, indent=2)
+    tmp.replace(COVERS_MANIFEST)
+
+    # drop variants neither this manifest nor the previous one points at: the
+    # API serves the previous one until it reloads, and clients may still hold
+    # responses naming its files
+    referenced = {
+        e[v] for e in (*manifest.values(), *previous.values()) for v in COVER_VARIANTS if v in e
+    }
+    removed = 0
+    for path in COVERS_DIR.glob("*.jpg"):
+        if HASHED_NAME_RE.search(path.name) and path.name not in referenced:
+            path.unlink()
+            removed += 1
+    print(f"Cover variants: {built} built, {kept} unchanged, {failed} unreadable, "
+          f"{removed} stale files removed")
+
+
+# ---------------------------------------------
+# Serving
+# ---------------------------------------------
+class CoverFiles(StaticFiles):
+    """StaticFiles with Cache-Control set per file: immutable for
+    content-hashed variants, a short max-age for the originals."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        headers = {"cache-control": f"public, max-age={ORIGINAL_MAX_AGE}"}
+        hashed = HASHED_NAME_RE.search(os.path.basename(full_path))
+        if hashed:
+            headers = {"cache-control": IMMUTABLE, "etag": f'"{hashed.group(1)}"'}
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result,
+                                headers=headers)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+if __name__ == "__main__":
+    build_covers()
@@ -1,70 +1,226 @@
 # download_books.py
+#
+# Concurrent, resumable Gutenberg downloader.
+#
+# Listing pages are read in order on the main thread; each candidate book
+# (text, cover, metadata) is fetched by a pool of workers sharing one pooled
+# HTTP session. Every request first takes a token from a global token bucket;
+# a 429 from any server pauses the whole bucket (honouring Retry-After) and
+# halves its rate, which then creeps back up on successes.
+#
+# Progress goes to an append-only journal (one JSON line per saved or
+# rejected book and per finished listing page), so an interrupted run resumes
+# without re-downloading anything; metadata.json is written once at the end.
+#
+# Point GUTENDEX_API / GUTENBERG_BASE at a local stand-in server to test.
+
 import os
 import json
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from bookstore import write_blocks, blocks_path
 
 DATA_DIR = os.environ.get("DATA_DIR", "data")
 BOOKS_DIR = os.path.join(DATA_DIR, "books")
 COVERS_DIR = os.path.join(DATA_DIR, "covers")
 METADATA_PATH = os.path.join(DATA_DIR, "metadata.json")
+JOURNAL_PATH = os.path.join(DATA_DIR, "download_journal.jsonl")
 
-os.makedirs(BOOKS_DIR, exist_ok=True)
-os.makedirs(COVERS_DIR, exist_ok=True)
-
-TARGET_COUNT = 1664
+TARGET_COUNT = int(os.environ.get("TARGET_COUNT", "1664"))
 MIN_WORDS = 10000
-API = "https://gutendex.com/books"
+# store book text block-compressed (NAME.txt.blk, see bookstore.py)
+COMPRESS_BOOKS = os.environ.get("COMPRESS_BOOKS", "true").lower() == "true"
+
+GUTENDEX_API = os.environ.get("GUTENDEX_API", "https://gutendex.com").rstrip("/")
+GUTENBERG_BASE = os.environ.get("GUTENBERG_BASE", "https://www.gutenberg.org").rstrip("/")
+API = f"{GUTENDEX_API}/books"
+GUTENDEX_URL = API + "/{}"
+
+# workers fetching books, requests/second across all of them (and burst)
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", "8"))
+DOWNLOAD_RATE = float(os.environ.get("DOWNLOAD_RATE", "4"))
+DOWNLOAD_BURST = int(os.environ.get("DOWNLOAD_BURST", "8"))
+MAX_RETRIES = 6
 
 
 def safe_filename(name: str) -> str:
     return "".join(c for c in name if c.isalnum() or c in " _-")[:60]
 
 
-def fetch_page(page=1):
-    retries = 3
-    while retries:
-        try:
-            r = requests.get(API, params={"page": page, "page_size": 100}, timeout=15)
-            r.raise_for_status()
-            return r.json()
-        except Exception as e:
-            print(f" !! Network error on page {page}: {e}")
-            retries -= 1
-            time.sleep(2)
-    return {"results": []}
-
-
-def download_text(book_id, formats):
-    # Try recommended plain text URLs
-    for fmt, url in formats.items():
-        if "text/plain" in fmt:
+# ----------------------------------------
+# Rate limiting
+# ----------------------------------------
+class TokenBucket:
+    """Global request budget: `rate` tokens/s up to `burst`.
+
+    throttle() is called on a 429: everyone pauses for `retry_after` and the
+    rate is halved; each success afterwards restores a little of it.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    delay = self.paused_until - now
+            time.sleep(delay)
+
+    def throttle(self, retry_after: float):
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + retry_after)
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+    def success(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate * 1.05)
+
+
+def make_session(pool_size: int):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = "bookSearchEngine-downloader"
+    return session
+
+
+class Fetcher:
+    """Pooled, rate-limited GET with retries."""
+
+    def __init__(self, workers=DOWNLOAD_WORKERS, rate=DOWNLOAD_RATE, burst=DOWNLOAD_BURST):
+        self.session = make_session(workers + 1)
+        self.bucket = TokenBucket(rate, burst)
+
+    def get(self, url, params=None, timeout=30, retries=MAX_RETRIES):
+        """Response for `url` (any status but 429/5xx), or None."""
+        wait_s = 2
+        for _ in range(retries):
+            self.bucket.acquire()
             try:
-                r = requests.get(url, timeout=30)
-                if r.status_code == 200:
-                    return r.text
-            except:
-                pass
-
-    # Fallback URLs
-    fallback_urls = [
-        f"https://www.gutenberg.org/files/{book_id}/{book_id}-0.txt",
-        f"https://www.gutenberg.org/files/{book_id}/{book_id}.txt",
-        f"https://www.gutenberg.org/cache/epub/{book_id}/pg{book_id}.txt"
-    ]
+                r = self.session.get(url, params=params, timeout=timeout)
+            except requests.RequestException as e:
+                print(f" !! Network error on {url}: {e}")
+                time.sleep(wait_s)
+                wait_s = min(wait_s * 2, 30)
+                continue
+
+            if r.status_code == 429:
+                retry_after = r.headers.get("Retry-After", "")
+                delay = float(retry_after) if retry_after.isdigit() else wait_s
+                print(f"429 Too Many Requests — pausing all workers {delay} sec...")
+                self.bucket.throttle(delay)
+                wait_s = min(wait_s * 2, 30)
+                continue
+            if r.status_code >= 500:
+                time.sleep(wait_s)
+                wait_s = min(wait_s * 2, 30)
+                continue
+
+            self.bucket.success()
+            return r
+        print(f"FAILED after retries: {url}")
+        return None
+
+
+# ----------------------------------------
+# Journal (append-only progress log)
+# ----------------------------------------
+class Journal:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def load(self):
+        """(saved entries in order, rejected book ids, finished pages)."""
+        saved, rejected, pages = {}, set(), set()
+        if not os.path.exists(self.path):
+            return [], rejected, pages
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break  # torn last line from an interrupted run
+                if "page" in rec:
+                    pages.add(rec["page"])
+                elif rec["status"] == "saved":
+                    saved[rec["entry"]["book_id"]] = rec["entry"]
+                else:
+                    # rejected, or removed later by indexing.py --remove
+                    saved.pop(rec["book_id"], None)
+                    rejected.add(rec["book_id"])
+        return list(saved.values()), rejected, pages
+
+    def append(self, rec):
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
 
-    for url in fallback_urls:
-        try:
-            r = requests.get(url, timeout=30)
-            if r.status_code == 200:
-                return r.text
-        except:
-            pass
 
+# ----------------------------------------
+# Downloads
+# ----------------------------------------
+def fetch_page(fetcher, page=1):
+    r = fetcher.get(API, params={"page": page, "page_size": 100}, timeout=15)
+    if r is None or r.status_code != 200:
+        return {"results": []}
+    return r.json()
+
+
+class FetchError(Exception):
+    """A download failed after its retries (network errors, 429s, 5xx)."""
+
+
+def download_text(fetcher, book_id, formats):
+    """The book's plain text, or None when no URL has one. Raises
+    FetchError if none succeeded and some only failed transiently."""
+    # Try recommended plain text URLs, then the usual fallbacks
+    urls = [url for fmt, url in formats.items() if "text/plain" in fmt]
+    urls += [
+        f"{GUTENBERG_BASE}/files/{book_id}/{book_id}-0.txt",
+        f"{GUTENBERG_BASE}/files/{book_id}/{book_id}.txt",
+        f"{GUTENBERG_BASE}/cache/epub/{book_id}/pg{book_id}.txt",
+    ]
+    failed = False
+    for url in urls:
+        r = fetcher.get(url, retries=2)
+        if r is None:
+            failed = True
+        elif r.status_code == 200:
+            return r.text
+    if failed:
+        raise FetchError(f"no text for {book_id}: some downloads failed after retries")
     return None
 
 
-def download_cover(book_id, formats):
+def download_cover(fetcher, book_id, formats):
     url = formats.get("image/jpeg")
     if not url:
         return None
@@ -75,15 +231,13 @@ def download_cover(book_id, formats):
     if os.path.exists(fpath):
         return fname
 
-    try:
-        r = requests.get(url, timeout=15)
-        if r.status_code == 200:
-            with open(fpath, "wb") as f:
-                f.write(r.content)
-            return fname
-    except:
-        pass
-
+    r = fetcher.get(url, timeout=15, retries=2)
+    if r is not None and r.status_code == 200:
+        tmp = fpath + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(r.content)
+        os.replace(tmp, fpath)
+        return fname
     return None
 
 
@@ -95,62 +249,14 @@ def load_existing_metadata():
 
 
 def save_metadata(metadata):
-    with open(METADATA_PATH, "w", encoding="utf-8") as f:
+    tmp = METADATA_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
         json.dump(metadata, f, indent=2, ensure_ascii=False)
-
-
-# ----------------------------------------
-# Fetch metadata for an existing book
-# ----------------------------------------
-# -------------------------------
-# GLOBAL cache to avoid re-fetching
-# -------------------------------
-GUTENDEX_CACHE = {}
-GUTENDEX_URL = "https://gutendex.com/books/{}"
-
-def fetch_gutendex(id):
-    """Safe request with retries, sleeps, caching."""
-    if id in GUTENDEX_CACHE:
-        return GUTENDEX_CACHE[id]
-
-    retries = 6
-    wait = 2
-
-    while retries:
-        try:
-            r = requests.get(GUTENDEX_URL.format(id), timeout=15)
-
-            # RATE LIMIT signal
-            if r.status_code == 429:
-                print(f"429 Too Many Requests — sleeping {wait} sec...")
-                time.sleep(wait)
-                retries -= 1
-                wait = min(wait * 2, 30)  # exponential backoff
-                continue
-
-            r.raise_for_status()
-            data = r.json()
-
-            # Cache result
-            GUTENDEX_CACHE[id] = data
-
-            # Smooth throttle
-            time.sleep(1.5)
-
-            return data
-
-        except Exception as e:
-            print(f"Error fetching ID {id}: {e}")
-            time.sleep(wait)
-            retries -= 1
-            wait = min(wait * 2, 30)
-
-    print(f"FAILED after retries: book {id}")
-    return None
+    os.replace(tmp, METADATA_PATH)
 
 
 # -------------------------------
-# Decide if a book needs enrichment
+# Metadata enrichment
 # -------------------------------
 def needs_enrichment(entry):
     required = ["languages", "authors", "summary"]
@@ -164,23 +270,8 @@ def needs_enrichment(entry):
     return False
 
 
-# -------------------------------
-# Enrich a metadata entry
-# -------------------------------
-def enrich_metadata(entry):
-    gid = entry["book_id"]
-
-    if not needs_enrichment(entry):
-        print(f"Book {gid} already enriched")
-        return entry
-
-    print(f"Enriching {gid} ({entry['title'][:40]}...)")
-
-    data = fetch_gutendex(gid)
-    if not data:
-        print(f"Skipping {gid} (no data)")
-        return entry
-
+def apply_gutendex(entry, data):
+    """Copy languages/authors/summary from a Gutendex book record."""
     entry["languages"] = data.get("languages", [])
     entry["authors"] = [a["name"] for a in data.get("authors", [])]
 
@@ -191,106 +282,159 @@ def enrich_metadata(entry):
         entry["summary"] = summaries
     else:
         entry["summary"] = None
-
-    print(f"✓ Enriched {gid}")
     return entry
 
 
-def main():
-    print("=== Gutenberg Downloader (with metadata enrichment) ===")
-
-    metadata = load_existing_metadata()
-    downloaded_ids = {m["book_id"] for m in metadata}
-    downloaded_files = {m["filename"] for m in metadata}
-
-    print(f"Loaded {len(metadata)} existing entries")
-
-    # --------------------------------------------------------
-    # STEP 1 — Enrich metadata for already-downloaded books
-    # --------------------------------------------------------
-    print("\n=== Enriching existing metadata ===")
-    new_metadata = []
-
-    for entry in metadata:
-        enriched = enrich_metadata(entry)
-        new_metadata.append(enriched)
-    save_metadata(new_metadata)
-    metadata = new_metadata
-    print("Existing metadata enriched.\n")
-
-    # --------------------------------------------------------
-    # STEP 2 — Continue normal download process
-    # --------------------------------------------------------
-    count = len(metadata)
-    page = 1
-
-    while count < TARGET_COUNT:
-        data = fetch_page(page)
-        books = data.get("results", [])
-
-        if not books:
-            print("No more pages available.")
-            break
-
-        for b in books:
-            book_id = b["id"]
-            title = b["title"]
-            formats = b["formats"]
-
-            if book_id in downloaded_ids:
-                print(f"[SKIP] Book {book_id} already downloaded.")
-                continue
-
-            print(f"\n------ Trying book {book_id}: {title}")
+def enrich_metadata(fetcher, entry):
+    gid = entry["book_id"]
+    if not needs_enrichment(entry):
+        return entry
 
-            text = download_text(book_id, formats)
-            if not text:
-                print(" -> ERROR: No usable text file.")
-                continue
+    r = fetcher.get(GUTENDEX_URL.format(gid), timeout=15)
+    if r is None or r.status_code != 200:
+        print(f"Skipping enrichment of {gid} (no data)")
+        return entry
 
-            wc = len(text.split())
-            if wc < MIN_WORDS:
-                print(f" -> TOO SHORT ({wc} words), skipping.")
-                continue
+    print(f"✓ Enriched {gid}")
+    return apply_gutendex(entry, r.json())
 
-            cover = download_cover(book_id, formats)
 
-            fname = f"book_{count+1:04d}_{book_id}_{safe_filename(title)}.txt"
-            fpath = os.path.join(BOOKS_DIR, fname)
+# -------------------------------
+# Main loop
+# -------------------------------
+class Downloader:
+    def __init__(self, target=TARGET_COUNT, workers=DOWNLOAD_WORKERS):
+        self.target = target
+        self.workers = workers
+        self.fetcher = Fetcher(workers)
+        self.journal = Journal(JOURNAL_PATH)
+        self.lock = threading.Lock()
+        # set when a book of the current page was neither saved nor rejected
+        self.page_incomplete = False
+
+    def fetch_book(self, b):
+        """Download one listing entry; journals and returns its metadata
+        entry, or None if the book is rejected or the target is reached."""
+        book_id = b["id"]
+        title = b["title"]
+        formats = b["formats"]
 
-            with open(fpath, "w", encoding="utf-8") as f:
+        try:
+            text = download_text(self.fetcher, book_id, formats)
+        except FetchError as e:
+            # not journaled: a later run tries the book (and its page) again
+            print(f" -> {e}")
+            self.page_incomplete = True
+            return None
+        if not text:
+            print(f" -> {book_id}: no usable text file.")
+            self.journal.append({"book_id": book_id, "status": "no_text"})
+            return None
+
+        wc = len(text.split())
+        if wc < MIN_WORDS:
+            print(f" -> {book_id}: too short ({wc} words), skipping.")
+            self.journal.append({"book_id": book_id, "status": "too_short"})
+            return None
+
+        cover = download_cover(self.fetcher, book_id, formats)
+
+        # the listing record already carries languages/authors/summaries
+        entry = apply_gutendex({"book_id": book_id, "title": title}, b)
+        if needs_enrichment(entry):
+            entry = enrich_metadata(self.fetcher, entry)
+
+        with self.lock:
+            if self.count >= self.target:
+                self.page_incomplete = True
+                return None
+            self.count += 1
+            ordinal = self.count
+
+        fname = f"book_{ordinal:04d}_{book_id}_{safe_filename(title)}.txt"
+        fpath = os.path.join(BOOKS_DIR, fname)
+        if COMPRESS_BOOKS:
+            write_blocks([text.encode("utf-8")], blocks_path(fpath))
+        else:
+            tmp = fpath + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
                 f.write(text)
+            os.replace(tmp, fpath)
+
+        entry = {
+            "book_id": book_id,
+            "title": title,
+            "filename": fname,
+            "cover": cover,
+            "path": fpath,
+            "word_count": wc,
+            **{k: entry.get(k) for k in ("languages", "authors", "summary")},
+        }
+        self.journal.append({"book_id": book_id, "status": "saved", "entry": entry})
+        print(f" -> SAVED {book_id}: {title[:50]} (total={ordinal})")
+        return entry
 
-            entry = {
-                "book_id": book_id,
-                "title": title,
-                "filename": fname,
-                "cover": cover,
-                "path": fpath,
-                "word_count": wc,
-            }
-
-            # NEW: metadata enrichment for fresh books
-            entry = enrich_metadata(entry)
-
-            metadata.append(entry)
-            downloaded_ids.add(book_id)
-
-            save_metadata(metadata)
-
-            count += 1
-            print(f" -> SAVED! total={count}")
-
-            if count >= TARGET_COUNT:
-                break
-
-            time.sleep(1)
+    def run(self):
+        print("=== Gutenberg Downloader ===")
+
+        # metadata.json from a finished run + journal of an interrupted one
+        metadata = {m["book_id"]: m for m in load_existing_metadata()}
+        journaled, rejected, done_pages = self.journal.load()
+        for entry in journaled:
+            metadata.setdefault(entry["book_id"], entry)
+        metadata = list(metadata.values())
+        print(f"Loaded {len(metadata)} existing entries ({len(journaled)} from the journal)")
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            # enrich already-downloaded books that miss fields
+            metadata = list(pool.map(lambda e: enrich_metadata(self.fetcher, e), metadata))
+
+            seen = {m["book_id"] for m in metadata} | rejected
+            self.count = len(metadata)
+            pending = set()
+            page = 1
+            while self.count < self.target:
+                if page in done_pages:
+                    page += 1
+                    continue
+                books = fetch_page(self.fetcher, page).get("results", [])
+                if not books:
+                    print("No more pages available.")
+                    break
+
+                self.page_incomplete = False
+                for b in books:
+                    if b["id"] in seen:
+                        continue
+                    seen.add(b["id"])
+                    # keep at most 2x workers books in flight
+                    while len(pending) >= 2 * self.workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        metadata.extend(f.result() for f in done if f.result())
+                    if self.count >= self.target:
+                        self.page_incomplete = True
+                        break
+                    pending.add(pool.submit(self.fetch_book, b))
+
+                # the page is finished once all of its books are saved or
+                # rejected; one left early (target reached, failed downloads)
+                # is listed again by the next run
+                done, pending = wait(pending)
+                metadata.extend(f.result() for f in done if f.result())
+                if not self.page_incomplete:
+                    self.journal.append({"page": page})
+                page += 1
+
+        save_metadata(metadata)
+
+        print("\n=== DONE ===")
+        print(f"Total metadata entries: {len(metadata)}")
 
-        page += 1
-        time.sleep(2)
 
-    print("\n=== DONE ===")
-    print(f"Total metadata entries: {count}")
+def main():
+    os.makedirs(BOOKS_DIR, exist_ok=True)
+    os.makedirs(COVERS_DIR, exist_ok=True)
+    Downloader().run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,232 @@
+# backend/generation.py
+#
+# Loaded artifacts as swappable generations.
+#
+# A Generation holds everything the API serves from (metadata, index,
+# PageRank, similarity graph, snippet/page stores and the structures derived
+# from them), loaded from DATA_DIR at one point in time. Handlers grab
+# `generations.current` once per request and use only that object, so a
+# reload can build the next generation on a background thread and swap the
+# reference atomically: in-flight requests finish on the old one, which is
+# freed once the last of them drops it.
+#
+# Reloads are triggered by POST /admin/reload or by a watcher thread that
+# polls the .data_version file written last by scripts/build_data.sh.
+#
+# The first generation can be loaded in the background too (the API starts
+# serving /healthz and /readyz at once; data endpoints answer 503 until it
+# is in). Loads report which step they are on for /readyz, and use the
+# prebuilt snapshot.bin (snapshot.py) when it matches the artifacts.
+
+import json
+import os
+import threading
+import traceback
+from time import perf_counter, sleep
+
+from indexing import (
+    load_metadata_and_index, load_index, load_stopwords, load_doc_lengths, load_snippets,
+    load_page_index, DATA_DIR, TRIGRAMS_PATH,
+)
+from binindex import BinaryIndex
+from similarity import load_similarity_graph
+from packed import PackedScores, PackedGraph
+from ranking import CursorCache
+from termdict import TermMatcher
+from titleindex import TitleIndex
+from bm25 import BM25
+from query import QueryEvaluator
+from cache import read_data_version
+from snapshot import load_snapshot
+from covers import load_cover_manifest
+
+VERSION_PATH = DATA_DIR / ".data_version"
+# seconds between .data_version checks (0 disables the watcher)
+RELOAD_POLL_SECS = float(os.environ.get("RELOAD_POLL_SECS", "30"))
+
+# steps reported while a generation loads, in order
+LOAD_STEPS = (
+    "snapshot", "metadata", "index", "pagerank", "similarity", "snippets", "pages",
+    "trigrams", "title_index", "query", "bm25", "covers",
+)
+
+
+class Generation:
+    def __init__(self, number: int, use_mmap: bool, progress=None):
+        """progress(step) is called before each of LOAD_STEPS."""
+        start = perf_counter()
+        step = progress or (lambda name: None)
+        self.number = number
+        self.version = read_data_version(VERSION_PATH)
+
+        # derived structures prebuilt by snapshot.py (None: build them here)
+        step("snapshot")
+        snap = load_snapshot(use_mmap)
+        self.from_snapshot = snap is not None
+        snap = snap or {}
+
+        # book_id -> meta, BinaryIndex (SegmentedIndex with incremental segments)
+        step("metadata")
+        if "meta_by_id" in snap:
+            self.meta_by_id = snap["meta_by_id"]
+            step("index")
+            self.inverted_index = load_index(use_mmap)
+        else:
+            self.meta_by_id, self.inverted_index = load_metadata_and_index(use_mmap)
+            step("index")
+
+        step("pagerank")
+        if use_mmap:
+            self.pagerank_scores = PackedScores(DATA_DIR / "pagerank.bin", use_mmap=True)
+            step("similarity")
+            self.similarity_graph = PackedGraph(DATA_DIR / "similarity.bin", use_mmap=True)
+        elif snap:
+            self.pagerank_scores = snap["pagerank_scores"]
+            step("similarity")
+            self.similarity_graph = snap["similarity_graph"]
+        else:
+            with (DATA_DIR / "pagerank.json").open("r", encoding="utf-8") as f:
+                self.pagerank_scores = json.load(f)           # book_id_str -> PR
+
+            # book_id -> {other_id: sim}, rows sorted by score
+            step("similarity")
+            self.similarity_graph = PackedGraph.from_graph(load_similarity_graph())
+
+        # book_id -> opening text, precomputed by indexing.py (older data: read files)
+        step("snippets")
+        self.snippet_store = load_snippets(use_mmap)
+
+        # book_id -> (total_chars, char/byte checkpoints) for seeking into book files
+        step("pages")
+        self.page_index = load_page_index(use_mmap)
+
+        # regex search: prefix ranges + trigram prefilter over the vocabulary
+        step("trigrams")
+        self.trigram_index = (
+            BinaryIndex(TRIGRAMS_PATH, use_mmap) if TRIGRAMS_PATH.exists() else None
+        )
+        self.term_matcher = TermMatcher(self.inverted_index, self.trigram_index)
+
+        # n-gram index over lowercased titles and authors
+        step("title_index")
+        self.title_index = snap.get("title_index") or TitleIndex(self.meta_by_id)
+
+        # boolean / phrase queries (same stopwords the index dropped)
+        step("query")
+        self.query_stopwords = load_stopwords()
+        self.query_evaluator = QueryEvaluator(self.inverted_index, self.meta_by_id.keys())
+
+        # BM25 length norms, computed once from doclens.bin
+        step("bm25")
+        doc_lengths = snap["doc_lengths"] if snap else load_doc_lengths()
+        self.bm25 = BM25(doc_lengths, n_docs=self.inverted_index.n_docs)
+
+        # book_id -> {variant: content-hashed file name} written by covers.py
+        step("covers")
+        self.cover_variants = load_cover_manifest()
+
+        # (kind, query, ...) -> RankedCursor, only valid for this generation
+        self.ranked_cursors = CursorCache()
+
+        self.load_secs = perf_counter() - start
+
+
+class Generations:
+    """Holds the current Generation and replaces it on reload.
+
+    With background=True the first generation loads on a thread and
+    `current` is None until it is in (wait() blocks for it)."""
+
+    def __init__(self, use_mmap: bool, background: bool = False):
+        self.use_mmap = use_mmap
+        self.current = None
+        self.last_error = None
+        self.loading = None      # progress of the load running now, if any
+        self._ready = threading.Event()
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        if background:
+            threading.Thread(target=self._first_load, name="data-load", daemon=True).start()
+        else:
+            self.reload()
+
+    def _first_load(self):
+        try:
+            self.reload()
+        except Exception:
+            # the watcher retries; /readyz shows the error meanwhile
+            print("Initial data load failed:")
+            print(self.last_error)
+
+    def wait(self, timeout=None) -> bool:
+        """Block until a generation is loaded; False on timeout."""
+        return self._ready.wait(timeout)
+
+    def _progress(self, number):
+        started = perf_counter()
+        self.loading = {"generation": number, "step": None, "steps_done": 0,
+                        "steps_total": len(LOAD_STEPS), "started": started}
+
+        def step(name):
+            self.loading = {**self.loading, "step": name, "steps_done": LOAD_STEPS.index(name)}
+        return step
+
+    def reload(self, if_changed=False):
+        """Load a new generation and swap it in; returns the generation
+        serving afterwards. Concurrent calls wait for the running reload."""
+        with self._reload_lock:
+            old = self.current
+            if if_changed and old is not None and read_data_version(VERSION_PATH) == old.version:
+                return old
+            number = old.number + 1 if old is not None else 1
+            try:
+                new = Generation(number, self.use_mmap, progress=self._progress(number))
+            except Exception:
+                # keep serving the old generation
+                self.last_error = traceback.format_exc()
+                raise
+            finally:
+                self.loading = None
+            self.last_error = None
+            self.current = new
+            source = "snapshot" if new.from_snapshot else "artifacts"
+            print(f"Loaded data generation {new.number} from {source} in {new.load_secs:.2f}s")
+            self._ready.set()
+            return new
+
+    def _watch(self, poll_secs):
+        while True:
+            sleep(poll_secs)
+            try:
+                self.reload(if_changed=True)
+            except Exception:
+                print("Data reload failed, still serving the previous generation:")
+                print(self.last_error)
+
+    def start_watcher(self, poll_secs=RELOAD_POLL_SECS):
+        if poll_secs <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(
+            target=self._watch, args=(poll_secs,), name="data-reload", daemon=True
+        )
+        self._watcher.start()
+
+    def info(self):
+        gen = self.current
+        info = {
+            "generation": gen.number if gen else None,
+            "data_version": gen.version[0] if gen and gen.version else None,
+            "load_secs": gen.load_secs if gen else None,
+            "from_snapshot": gen.from_snapshot if gen else None,
+            "last_error": self.last_error,
+        }
+        loading = self.loading
+        if loading is not None:
+            info["loading"] = {
+                "generation": loading["generation"],
+                "step": loading["step"],
+                "steps_done": loading["steps_done"],
+                "steps_total": loading["steps_total"],
+                "elapsed_secs": round(perf_counter() - loading["started"], 3),
+            }
+        return info
@@ -2,39 +2,113 @@
 
 import os
 import json
+import codecs
 import re
-from collections import defaultdict
+import shutil
+import sys
+import tempfile
+from array import array
+from collections import ChainMap, defaultdict
+from functools import lru_cache
+from multiprocessing import Pool
 from pathlib import Path
-import nltk
-from nltk.corpus import stopwords
-from langcodes import Language
+
+from binindex import (
+    BinaryIndex, IndexWriter, write_run, merge_runs, encode_deltas,
+    export_json, import_json,
+)
+from packed import (
+    PackedRecords, PackedScores, PackedTexts, PackedPageIndex,
+    TextsWriter, PageIndexWriter, ScoresWriter,
+    write_texts, write_page_index, write_scores,
+)
+from segments import (
+    SegmentedIndex, segments_dir, deleted_path, list_segments, next_segment_name,
+    load_deleted, save_deleted,
+)
+from bookstore import PageCheckpoints, open_book
+from termdict import build_trigram_index
 
 DATA_DIR = Path(os.environ.get("DATA_DIR", Path(__file__).parent / "data"))
 BOOKS_DIR = DATA_DIR / "books"
 COVERS_DIR = DATA_DIR / "covers"
 METADATA_PATH = DATA_DIR / "metadata.json"
-INDEX_PATH = DATA_DIR / "index.json"
+INDEX_PATH = DATA_DIR / "index.json"          # legacy JSON export
+INDEX_BIN_PATH = DATA_DIR / "index.bin"
+METADATA_BIN_PATH = DATA_DIR / "metadata.bin"
+SNIPPETS_PATH = DATA_DIR / "snippets.bin"
+PAGES_PATH = DATA_DIR / "pages.bin"
+TRIGRAMS_PATH = DATA_DIR / "trigrams.bin"
+POSITIONS_PATH = DATA_DIR / "positions.bin"
+STOPWORDS_PATH = DATA_DIR / "stopwords.json"
+DOCLENS_PATH = DATA_DIR / "doclens.bin"
+WORDSETS_PATH = DATA_DIR / "wordsets.bin"     # per-book distinct words, for similarity.py
+
+SNIPPET_CHARS = 300
 
 WORD_RE = re.compile(r"\w+", re.UNICODE)
+# undecodable bytes, as errors="surrogateescape" leaves them
+SURROGATE_RE = re.compile("[\udc80-\udcff]")
+
+# bytes read per step when scanning a book file
+READ_CHUNK = int(os.environ.get("INDEX_READ_CHUNK", str(1 << 20)))
+
+# Builder tuning: books per sorted run (bounds worker memory), max runs
+# merged at once (bounds open files), worker processes (default: all cores
+# available to this container).
+RUN_BATCH = int(os.environ.get("INDEX_RUN_BATCH", "32"))
+MERGE_FANIN = int(os.environ.get("INDEX_MERGE_FANIN", "64"))
+INDEX_WORKERS = int(os.environ.get("INDEX_WORKERS", "0")) or (
+    len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+)
 
 # ---------------------------------------------
 # Build multilingual stopword list
 # ---------------------------------------------
 STOPWORDS = set()
+EXTRA_STOPWORDS = {"also", "would", "could", "shall"}
 
-def load_language_stopwords(all_languages):
-    global STOPWORDS
-    STOPWORDS = set()
 
-    available = stopwords.fileids()
+@lru_cache(maxsize=None)
+def _nltk_stopword_language(code):
+    """NLTK stopword file for a language code ("en" -> "english"), or None."""
+    from langcodes import Language
+    from nltk.corpus import stopwords
 
-    for lang in all_languages:
-        lang = Language.get(lang).display_name().lower()
-        if lang in available:
-            STOPWORDS.update(stopwords.words(lang))
+    lang = Language.get(code).display_name().lower()
+    return lang if lang in stopwords.fileids() else None
+
+
+def resolve_stopwords(all_languages):
+    from nltk.corpus import stopwords
+
+    words = set()
+    for lang in {_nltk_stopword_language(code) for code in all_languages}:
+        if lang:
+            words.update(stopwords.words(lang))
 
     # also add generic garbage
-    STOPWORDS.update({"also", "would", "could", "shall"})
+    words.update(EXTRA_STOPWORDS)
+    return words
+
+
+def load_language_stopwords(all_languages):
+    """Set STOPWORDS for a corpus in `all_languages`, reusing stopwords.json
+    when it was resolved for the same languages."""
+    global STOPWORDS
+    languages = sorted(set(all_languages))
+    if STOPWORDS_PATH.exists():
+        with STOPWORDS_PATH.open("r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if isinstance(saved, dict) and saved.get("languages") == languages:
+            STOPWORDS = set(saved["words"])
+            return
+
+    STOPWORDS = resolve_stopwords(languages)
+    tmp = STOPWORDS_PATH.with_name(STOPWORDS_PATH.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump({"languages": languages, "words": sorted(STOPWORDS)}, f, ensure_ascii=False)
+    tmp.replace(STOPWORDS_PATH)
 
 
 # ---------------------------------------------
@@ -45,10 +119,172 @@ def tokenize(text: str):
     return [w for w in tokens if w not in STOPWORDS]
 
 
+def scan_book(path):
+    """Tokenize one book file in a single streaming pass.
+
+    The file is read READ_CHUNK bytes at a time; each chunk is decoded,
+    lowercased and tokenized once, holding back the text after its last
+    space or newline.
+    Returns (positions, first, head, pages, words): `positions` maps each
+    term to its token positions (counting stopwords too, so phrase gaps
+    survive stopword removal), `first` maps each term to the byte offset of
+    its first occurrence in the file, `head` is the opening SNIPPET_CHARS
+    characters as a text-mode read would return them, `pages` are the
+    page-offset checkpoints from bookstore.PageCheckpoints and `words` is
+    every distinct word, stopwords included (what similarity.py compares).
+    """
+    positions = defaultdict(list)
+    first = {}
+    stops = set()
+    pages = PageCheckpoints()
+    # invalid bytes decode to lone surrogates (one per byte) rather than
+    # vanishing, so text offsets still map back to raw file offsets
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="surrogateescape")
+    n = b = 0
+    head = ""
+    carry = ""
+
+    def consume(text):
+        nonlocal n, b
+        low = text.lower()
+        to_text = None
+        if len(low) != len(text):
+            # a few characters lowercase to several: map `low` back to `text`
+            to_text = array("I")
+            for i, ch in enumerate(text):
+                to_text.extend([i] * len(ch.lower()))
+        c = 0
+        for m in WORD_RE.finditer(low):
+            w = m.group()
+            if w in STOPWORDS:
+                stops.add(w)
+            else:
+                plist = positions[w]
+                if not plist:
+                    # char -> byte offset, walking first occurrences in text order
+                    pos = m.start() if to_text is None else to_text[m.start()]
+                    b += len(text[c:pos].encode("utf-8", "surrogateescape"))
+                    c = pos
+                    first[w] = b
+                plist.append(n)
+            n += 1
+        b += len(text[c:].encode("utf-8", "surrogateescape"))
+
+    with open_book(path) as f:
+        while True:
+            chunk = f.read(READ_CHUNK)
+            pages.feed(chunk)
+            decoded = decoder.decode(chunk, final=not chunk)
+            if len(head) < 2 * SNIPPET_CHARS:
+                # what errors="ignore" would have kept
+                head += SURROGATE_RE.sub("", decoded)[:2 * SNIPPET_CHARS - len(head)]
+            text = carry + decoded
+            if not chunk:
+                consume(text)
+                break
+            # cut after the last space/newline: no word (nor a final sigma's
+            # context for lower()) spans it
+            cut = max(text.rfind(" "), text.rfind("\n")) + 1
+            consume(text[:cut])
+            carry = text[cut:]
+
+    head = head.replace("\r\n", "\n").replace("\r", "\n")
+    return positions, first, head[:SNIPPET_CHARS], pages.finish(), stops.union(positions)
+
+
 # ---------------------------------------------
 # BUILD INDEX
+#
+# Workers tokenize batches of RUN_BATCH books and spill each batch as a
+# sorted run; the runs are then k-way merged straight into index.bin, so
+# peak memory depends on the batch size, not on the corpus size.
 # ---------------------------------------------
-def build_index():
+def _init_worker(stopword_set):
+    global STOPWORDS
+    STOPWORDS = stopword_set
+
+
+def _index_batch(job):
+    run_path, entries = job
+    # term -> [((book_id, tf, first_byte, plen), encoded positions), ...]
+    postings = defaultdict(list)
+    done = []
+
+    for bid, fname in sorted(entries):
+        positions, first, head, pages, words = scan_book(BOOKS_DIR / fname)
+
+        n_tokens = 0
+        for w, plist in positions.items():
+            chunk = encode_deltas(plist)
+            postings[w].append(((bid, len(plist), first[w], len(chunk)), chunk))
+            n_tokens += len(plist)
+        done.append((bid, n_tokens, head, pages, "\n".join(sorted(words))))
+
+    write_run(run_path, (
+        (key, [p for p, _ in plist], b"".join(c for _, c in plist))
+        for key, plist in sorted((w.encode("utf-8"), p) for w, p in postings.items())
+    ))
+    return run_path, done
+
+
+def _merge_to_fanin(runs, run_dir):
+    # merge groups of runs until one final pass can take them all
+    level = 0
+    while len(runs) > MERGE_FANIN:
+        merged = []
+        for i in range(0, len(runs), MERGE_FANIN):
+            out = Path(run_dir) / f"merge_{level}_{i // MERGE_FANIN:05d}.run"
+            write_run(out, merge_runs(runs[i:i + MERGE_FANIN], width=4))
+            for p in runs[i:i + MERGE_FANIN]:
+                Path(p).unlink()
+            merged.append(out)
+        runs = merged
+        level += 1
+    return runs
+
+
+def _index_books(entries, out_dir, workers):
+    """Index `entries` [(book_id, filename)] into out_dir: index.bin and
+    positions.bin, snippets.bin, pages.bin, doclens.bin, wordsets.bin."""
+    out_dir = Path(out_dir)
+    processed = 0
+
+    # each finished book goes straight to the writers (nothing per book is
+    # kept here); doclens feeds BM25 length normalisation, wordsets
+    # similarity.py
+    with tempfile.TemporaryDirectory(prefix=".index_runs_", dir=DATA_DIR) as run_dir, \
+            TextsWriter(out_dir / SNIPPETS_PATH.name) as snippets, \
+            PageIndexWriter(out_dir / PAGES_PATH.name) as page_index, \
+            ScoresWriter(out_dir / DOCLENS_PATH.name) as doc_lengths, \
+            TextsWriter(out_dir / WORDSETS_PATH.name) as wordsets:
+        jobs = [
+            (Path(run_dir) / f"run_{i // RUN_BATCH:05d}.run", entries[i:i + RUN_BATCH])
+            for i in range(0, len(entries), RUN_BATCH)
+        ]
+        print(f"Indexing {len(entries)} books in {len(jobs)} runs with {workers} workers")
+
+        runs = []
+        with Pool(workers, initializer=_init_worker, initargs=(STOPWORDS,)) as pool:
+            for run_path, done in pool.imap_unordered(_index_batch, jobs):
+                runs.append(run_path)
+                for bid, n_tokens, head, pages, words in done:
+                    snippets.add(bid, head)
+                    page_index.add(bid, pages)
+                    doc_lengths.add(bid, n_tokens)
+                    wordsets.add(bid, words)
+                    processed += 1
+                    print(f"{processed} - Indexed book_id={bid} ({n_tokens} tokens)")
+
+        print(f"Merging {len(runs)} runs...")
+        runs = _merge_to_fanin(sorted(runs), run_dir)
+        with IndexWriter(out_dir / INDEX_BIN_PATH.name, width=4,
+                         positions_path=out_dir / POSITIONS_PATH.name) as w:
+            for key, postings, positions in merge_runs(runs, width=4):
+                w.add(key, postings, positions)
+    return processed
+
+
+def build_index(export=False, workers=INDEX_WORKERS):
     # Load metadata
     with METADATA_PATH.open("r", encoding="utf-8") as f:
         metadata = json.load(f)
@@ -57,50 +293,240 @@ def build_index():
     all_langs = set()
     for m in metadata:
         all_langs.update(m.get("languages", []))
+    # (saved to stopwords.json: the query parser drops the same stopwords)
     load_language_stopwords(all_langs)
 
-    inverted_index = defaultdict(lambda: defaultdict(int))
-    processed = 0
+    entries = [(m["book_id"], m["filename"]) for m in metadata]
+    processed = _index_books(entries, DATA_DIR, workers)
+
+    print("Building trigram index over terms...")
+    build_trigram_index(BinaryIndex(INDEX_BIN_PATH), TRIGRAMS_PATH)
 
-    for entry in metadata:
-        bid = entry["book_id"]
-        fname = entry["filename"]
-        book_path = BOOKS_DIR / fname
+    if export:
+        export_json(BinaryIndex(INDEX_BIN_PATH), INDEX_PATH)
 
-        with book_path.open("r", encoding="utf-8", errors="ignore") as f:
-            tokens = tokenize(f.read())
+    # a full build supersedes any incremental state
+    _drop_segments()
 
-        for w in tokens:
-            inverted_index[w][bid] += 1  # KEEP integer book_id
+    print(f"\nDone. Indexed {processed} books.")
 
-        processed += 1
-        print(f"{processed} - Indexed book_id={bid} ({len(tokens)} tokens)")
 
-    # Save index
-    index_dict = {w: dict(counts) for w, counts in inverted_index.items()}
-    with INDEX_PATH.open("w", encoding="utf-8") as f:
-        json.dump(index_dict, f)
+# ---------------------------------------------
+# INCREMENTAL UPDATES (see segments.py)
+# ---------------------------------------------
+def _drop_segments():
+    shutil.rmtree(segments_dir(DATA_DIR), ignore_errors=True)
+    deleted_path(DATA_DIR).unlink(missing_ok=True)
 
-    print(f"\nDone. Indexed {processed} books.")
+
+def indexed_books():
+    """book_ids held by the main index or a segment (tombstones included)."""
+    if not DOCLENS_PATH.exists():
+        sys.exit("doclens.bin is missing: run a full build (python indexing.py) first")
+    books = set(PackedScores(DOCLENS_PATH))
+    for seg in list_segments(DATA_DIR):
+        books.update(PackedScores(seg / DOCLENS_PATH.name))
+    return books
+
+
+def build_segment(workers=INDEX_WORKERS):
+    """Index the books of metadata.json that no index part holds yet (or
+    that were removed and came back) into a new segment."""
+    with METADATA_PATH.open("r", encoding="utf-8") as f:
+        metadata = json.load(f)
+
+    deleted = load_deleted(DATA_DIR)
+    indexed = indexed_books() - deleted
+    entries = [(m["book_id"], m["filename"]) for m in metadata if m["book_id"] not in indexed]
+    if not entries:
+        print("No new books to index.")
+        return None
+
+    # same stopwords as the main index
+    global STOPWORDS
+    STOPWORDS = load_stopwords()
+
+    root = segments_dir(DATA_DIR)
+    root.mkdir(exist_ok=True)
+    name = next_segment_name(DATA_DIR)
+    tmp = root / f".{name}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    processed = _index_books(entries, tmp, workers)
+    tmp.rename(root / name)
+
+    if deleted & {bid for bid, _ in entries}:
+        save_deleted(DATA_DIR, deleted - {bid for bid, _ in entries})
+
+    print(f"\nDone. Indexed {processed} new books into segment {name}.")
+    return root / name
+
+
+def remove_books(book_ids):
+    """Drop books from metadata.json and tombstone them in the index."""
+    book_ids = set(book_ids)
+    with METADATA_PATH.open("r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    kept = [m for m in metadata if m["book_id"] not in book_ids]
+
+    tmp = METADATA_PATH.with_name(METADATA_PATH.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(kept, f, indent=2, ensure_ascii=False)
+    tmp.replace(METADATA_PATH)
+
+    save_deleted(DATA_DIR, load_deleted(DATA_DIR) | book_ids)
+
+    # keep a resumed download from bringing them back
+    journal = DATA_DIR / "download_journal.jsonl"
+    if journal.exists():
+        with journal.open("a", encoding="utf-8") as f:
+            for bid in sorted(book_ids):
+                f.write(json.dumps({"book_id": bid, "status": "removed"}) + "\n")
+
+    print(f"Removed {len(metadata) - len(kept)} books.")
+
+
+def compact_index(max_segments=0):
+    """Rewrite the main index with every segment merged in and tombstoned
+    books dropped, if there are more than `max_segments` segments (or any
+    tombstones when max_segments is 0)."""
+    segs = list_segments(DATA_DIR)
+    deleted = load_deleted(DATA_DIR)
+    if len(segs) <= max_segments and not (deleted and max_segments == 0):
+        print(f"{len(segs)} segments, nothing to compact.")
+        return
+
+    index = load_index()
+    if not index.has_positions:
+        sys.exit("compaction needs positions.bin everywhere: run a full build instead")
+
+    print(f"Compacting main index + {len(segs)} segments ({len(deleted)} removed books)...")
+    doc_lengths = load_doc_lengths()
+    snippets = load_snippets()
+    page_index = load_page_index()
+    wordsets = load_wordsets()
+
+    with IndexWriter(INDEX_BIN_PATH, width=index.width, positions_path=POSITIONS_PATH) as w:
+        for j in range(len(index)):
+            chunks = index.position_chunks_at(j)
+            if chunks:
+                w.add(index.term_bytes(j), [p for p, _ in chunks], b"".join(c for _, c in chunks))
+
+    write_texts({bid: snippets[bid] for bid in doc_lengths if bid in snippets}, SNIPPETS_PATH)
+    write_page_index({bid: page_index[bid] for bid in doc_lengths if bid in page_index}, PAGES_PATH)
+    write_scores(doc_lengths, DOCLENS_PATH)
+    if wordsets:
+        write_texts({bid: wordsets[bid] for bid in doc_lengths if bid in wordsets}, WORDSETS_PATH)
+
+    print("Building trigram index over terms...")
+    build_trigram_index(BinaryIndex(INDEX_BIN_PATH), TRIGRAMS_PATH)
+
+    _drop_segments()
+    print(f"Done. Main index now holds {len(doc_lengths)} books.")
 
 
 # ---------------------------------------------
 # Loader for backend
 # ---------------------------------------------
-def load_metadata_and_index():
-    # Load metadata
-    with METADATA_PATH.open("r", encoding="utf-8") as f:
-        raw = json.load(f)
+def load_stopwords():
+    if not STOPWORDS_PATH.exists():
+        return set()
+    with STOPWORDS_PATH.open("r", encoding="utf-8") as f:
+        saved = json.load(f)
+    # {"languages", "words"}; a plain list before the languages were recorded
+    return set(saved["words"] if isinstance(saved, dict) else saved)
+
+
+def load_index(use_mmap=False):
+    """The main BinaryIndex, or a SegmentedIndex when incremental segments
+    or tombstones exist."""
+    positions = POSITIONS_PATH if POSITIONS_PATH.exists() else None
+    main = BinaryIndex(INDEX_BIN_PATH, use_mmap=use_mmap, positions_path=positions)
+
+    segs = list_segments(DATA_DIR)
+    deleted = load_deleted(DATA_DIR)
+    if not segs and not deleted:
+        return main
+
+    segments, segment_books = [], []
+    for seg in segs:
+        pos = seg / POSITIONS_PATH.name
+        segments.append(BinaryIndex(seg / INDEX_BIN_PATH.name, use_mmap=use_mmap,
+                                    positions_path=pos if pos.exists() else None))
+        segment_books.append(set(PackedScores(seg / DOCLENS_PATH.name)))
+    main_books = set(PackedScores(DOCLENS_PATH)) if DOCLENS_PATH.exists() else None
+    return SegmentedIndex(main, segments, segment_books, deleted, main_books)
+
+
+def _book_store(path, cls, use_mmap):
+    """Per-book store of the main index, chained behind the segments' own
+    (newest first); {} when the main one is missing (older data)."""
+    if not path.exists():
+        return {}
+    stores = [cls(seg / path.name, use_mmap) for seg in reversed(list_segments(DATA_DIR))]
+    main = cls(path, use_mmap)
+    return ChainMap(*stores, main) if stores else main
+
+
+def load_snippets(use_mmap=False):
+    return _book_store(SNIPPETS_PATH, PackedTexts, use_mmap)
+
+
+def load_page_index(use_mmap=False):
+    return _book_store(PAGES_PATH, PackedPageIndex, use_mmap)
+
+
+def load_wordsets(use_mmap=False):
+    """book_id -> newline-joined distinct words ({} for older data)."""
+    return _book_store(WORDSETS_PATH, PackedTexts, use_mmap)
+
+
+def load_doc_lengths():
+    """book_id -> indexed token count ({} for indexes built before doclens.bin)."""
+    if not DOCLENS_PATH.exists():
+        return {}
+    lengths = {bid: int(n) for bid, n in PackedScores(DOCLENS_PATH).items()}
+    for seg in list_segments(DATA_DIR):
+        lengths.update((bid, int(n)) for bid, n in PackedScores(seg / DOCLENS_PATH.name).items())
+    for bid in load_deleted(DATA_DIR):
+        lengths.pop(bid, None)
+    return lengths
+
 
-    meta_by_id = {m["book_id"]: m for m in raw}
+def load_metadata_and_index(use_mmap=False):
+    # Load metadata (mmap mode: packed copy written by packed.py)
+    if use_mmap:
+        meta_by_id = PackedRecords(METADATA_BIN_PATH, use_mmap=True)
+    else:
+        with METADATA_PATH.open("r", encoding="utf-8") as f:
+            raw = json.load(f)
+        meta_by_id = {m["book_id"]: m for m in raw}
 
-    # Load index
-    with INDEX_PATH.open("r", encoding="utf-8") as f:
-        inverted_index = json.load(f)
+    # Load index (term -> [(book_id, tf), ...], decoded on demand)
+    inverted_index = load_index(use_mmap)
 
     return meta_by_id, inverted_index
 
 
 if __name__ == "__main__":
-    build_index()
+    # python indexing.py               build index.bin
+    # python indexing.py --json        build index.bin and export index.json
+    # python indexing.py --export-json export an existing index.bin
+    # python indexing.py --import-json convert a legacy index.json
+    # python indexing.py --add         index new metadata.json books into a segment
+    # python indexing.py --remove ID.. drop books (metadata + index tombstones)
+    # python indexing.py --compact [N] merge segments into index.bin (if more than N)
+    if "--add" in sys.argv:
+        build_segment()
+    elif "--remove" in sys.argv:
+        remove_books(int(a) for a in sys.argv[sys.argv.index("--remove") + 1:])
+    elif "--compact" in sys.argv:
+        rest = sys.argv[sys.argv.index("--compact") + 1:]
+        compact_index(int(rest[0]) if rest else 0)
+    elif "--export-json" in sys.argv:
+        export_json(BinaryIndex(INDEX_BIN_PATH), INDEX_PATH)
+    elif "--import-json" in sys.argv:
+        import_json(INDEX_PATH, INDEX_BIN_PATH)
+    else:
+        build_index(export="--json" in sys.argv)
 
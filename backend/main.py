@@ -1,14 +1,28 @@
 # backend/main.py
 from time import perf_counter
-import json
+import heapq
 import re
+from collections import defaultdict
+from itertools import repeat
 from pathlib import Path
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, PlainTextResponse
 
-from indexing import load_metadata_and_index, DATA_DIR, BOOKS_DIR, COVERS_DIR
-from similarity import load_similarity_graph
+from indexing import DATA_DIR, BOOKS_DIR, COVERS_DIR, WORD_RE
+from bookstore import (
+    read_chars, iter_json_with_text, open_book, open_book_text, book_exists, block_cache,
+)
+from bookio import book_lane, book_page_lane
+from ranking import RankedCursor
+from cache import ResultCache, touch_data_version
+from generation import Generations, VERSION_PATH, RELOAD_POLL_SECS
+from covers import CoverFiles
+from query import parse_query, normalize_query, QueryError
+from models import RecommendBatchRequest
+from metrics import (
+    REGISTRY, CONTENT_TYPE, MetricsMiddleware, Stages, metric, get_profile,
+)
 
 # ----------------------------------------------------
 # FastAPI setup
@@ -19,19 +33,78 @@ app = FastAPI(title="Book Search API")
 from fastapi.responses import JSONResponse
 import os
 
+# ARTIFACT_MMAP=true: map the packed artifacts read-only instead of parsing
+# JSON per process, so uvicorn workers share one page-cache copy.
+USE_MMAP = os.environ.get("ARTIFACT_MMAP", "false").lower() == "true"
+
 @app.get("/healthz")
 def healthz():
     return {"ok": True}
 
+@app.get("/cache-stats")
+def cache_stats():
+    return {
+        "results": result_cache.stats(),
+        "book_blocks": block_cache.stats(),
+        "io_lanes": {lane.name: lane.stats() for lane in (book_lane, book_page_lane)},
+    }
+
+# POST /admin/reload: load the current DATA_DIR contents as a new generation
+# (requires X-Admin-Token when ADMIN_TOKEN is set). The request reaches one
+# worker, so it also bumps .data_version: the other workers' watchers (and
+# result caches) pick that up within RELOAD_POLL_SECS.
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+@app.post("/admin/reload")
+def admin_reload(x_admin_token: str = Header(default="")):
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(403, "Invalid admin token")
+    bumped = touch_data_version(VERSION_PATH)
+    watched = bumped and RELOAD_POLL_SECS > 0
+    others = {
+        "data_version_bumped": bumped,
+        "other_workers_reload_within_secs": RELOAD_POLL_SECS if watched else None,
+    }
+    try:
+        generations.reload()
+    except Exception:
+        return JSONResponse(status_code=500,
+                            content={"reloaded": False, **others, **generations.info()})
+    result_cache.clear()
+    return {"reloaded": True, **others, **generations.info()}
+
+@app.get("/admin/generation")
+def admin_generation():
+    return generations.info()
+
+# folded stacks of a request sent with X-Profile (needs METRICS_PROFILING=true)
+@app.get("/admin/profiles/{profile_id}")
+def admin_profile(profile_id: str, x_admin_token: str = Header(default="")):
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(403, "Invalid admin token")
+    folded = get_profile(profile_id)
+    if folded is None:
+        raise HTTPException(404, "Profile not found")
+    return PlainTextResponse(folded)
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 @app.get("/readyz")
 def readyz():
+    # ready once a generation is loaded; until then report the load's progress
+    if generations.current is not None:
+        return {"ready": True, **generations.info()}
     data_dir = os.environ.get("DATA_DIR", str(DATA_DIR))
-    # basic readiness: backend can read required files
-    required = ["metadata.json", "index.json", "similarity.json", "pagerank.json"]
+    if USE_MMAP:
+        required = ["metadata.bin", "index.bin", "similarity.bin", "pagerank.bin"]
+    else:
+        required = ["metadata.json", "index.bin", "similarity.json", "pagerank.json"]
     missing = [f for f in required if not Path(data_dir, f).exists()]
-    if missing:
-        return JSONResponse(status_code=503, content={"ready": False, "missing": missing})
-    return {"ready": True}
+    return JSONResponse(
+        status_code=503, content={"ready": False, "missing": missing, **generations.info()}
+    )
 
 
 app.add_middleware(
@@ -40,29 +113,92 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Profile-Id"],
 )
+# request latency histograms + Server-Timing (outermost, so CORS time counts)
+app.add_middleware(MetricsMiddleware)
 
-app.mount("/covers", StaticFiles(directory=COVERS_DIR), name="covers")
+# content-hashed cover variants are served immutable, originals revalidate
+app.mount("/covers", CoverFiles(directory=COVERS_DIR), name="covers")
 
 # ----------------------------------------------------
 # Load index + metadata + pagerank + similarity graph
+# (one Generation; swapped as a whole on reload)
 # ----------------------------------------------------
-meta_by_id, inverted_index = load_metadata_and_index()  # book_id_str -> meta
-
-with (DATA_DIR / "pagerank.json").open("r", encoding="utf-8") as f:
-    pagerank_scores = json.load(f)                      # book_id_str -> PR
-
-similarity_graph = load_similarity_graph()              # book_id_str -> {other_id_str: similarity score}
+# BACKGROUND_LOAD=true: start serving at once and load the first generation on
+# a thread (/readyz turns 200 when it is in; data endpoints answer 503 until then)
+BACKGROUND_LOAD = os.environ.get("BACKGROUND_LOAD", "true").lower() == "true"
+
+generations = Generations(USE_MMAP, background=BACKGROUND_LOAD)
+generations.start_watcher()
+REGISTRY.start_flushing()
+
+
+def serving_generation():
+    """The generation to answer from; 503 while the first one is loading."""
+    gen = generations.current
+    if gen is None:
+        raise HTTPException(503, "Data is still loading", headers={"Retry-After": "1"})
+    return gen
+
+
+# finished responses, dropped when build_data.sh writes a new .data_version
+result_cache = ResultCache(VERSION_PATH)
+
+
+@REGISTRY.collector
+def data_metrics():
+    gen = generations.current
+    cache = result_cache.stats()
+    samples = [
+        metric("bookapi_data_ready", "1 once a data generation is loaded.", int(gen is not None)),
+    ]
+    if gen is not None:
+        index = gen.inverted_index
+        samples += [
+            metric("bookapi_generation", "Data generation being served.", gen.number),
+            metric("bookapi_index_load_seconds", "Time to load the current generation.",
+                   gen.load_secs),
+            metric("bookapi_vocabulary_terms", "Distinct terms in the index.", len(index)),
+            metric("bookapi_indexed_books", "Books in the index.", index.n_docs),
+            metric("bookapi_posting_bytes", "Encoded postings and positions.", index.posting_bytes),
+            metric("bookapi_index_bytes", "Size of index.bin (and its segments).", index.nbytes),
+        ]
+    samples += [
+        metric("bookapi_result_cache_entries", "Cached responses.", cache["entries"]),
+        metric("bookapi_result_cache_hit_ratio", "Result cache hits / lookups.", cache["hit_rate"]),
+        metric("bookapi_result_cache_hits_total", "Result cache hits.", cache["hits"], kind="counter"),
+        metric("bookapi_result_cache_misses_total", "Result cache misses.", cache["misses"],
+               kind="counter"),
+        metric("bookapi_result_cache_evictions_total", "Result cache evictions.",
+               cache["evictions"], kind="counter"),
+    ]
+    blocks = block_cache.stats()
+    samples += [
+        metric("bookapi_book_block_cache_bytes", "Inflated book blocks cached.", blocks["bytes"]),
+        metric("bookapi_book_block_cache_hit_ratio", "Book block cache hits / lookups.",
+               blocks["hit_rate"]),
+    ]
+    for lane in (book_lane, book_page_lane):
+        stats = lane.stats()
+        samples.append(metric("bookapi_io_lane_busy", "Book file reads running.",
+                              stats["busy"], {"lane": lane.name}))
+        samples.append(metric("bookapi_io_lane_waiting", "Book file reads queued.",
+                              stats["waiting"], {"lane": lane.name}))
+    return samples
 
 
 # ----------------------------------------------------
 # Helpers
 # ----------------------------------------------------
-def make_cover_url(meta: dict):
+def make_cover_url(gen, meta: dict, variant: str = "medium"):
+    """URL of a cover variant from covers.py ("thumb" for result lists,
+    "medium" for book pages); the original file when it has none."""
     cover = meta.get("cover")
     if not cover:
         return None
-    return f"/covers/{cover}"
+    name = gen.cover_variants.get(meta["book_id"], {}).get(variant)
+    return f"/covers/{name or cover}"
 
 
 def empty_result(q, page, page_size):
@@ -75,29 +211,47 @@ def empty_result(q, page, page_size):
     }
 
 
-def format_snippet(meta: dict, length: int = 300) -> str:
-    book_path = BOOKS_DIR / meta["filename"]
-    with book_path.open("r", encoding="utf-8", errors="ignore") as f:
-        text = f.read(length)
-    return text.replace("\n", " ") + "..."
+def format_snippet(gen, meta: dict, length: int = 300) -> str:
+    text = gen.snippet_store.get(meta["book_id"])
+    if text is None:
+        with open_book_text(BOOKS_DIR / meta["filename"]) as f:
+            text = f.read(length)
+    return text[:length].replace("\n", " ") + "..."
+
+
+def match_snippet(meta: dict, offset: int, length: int = 300) -> str:
+    """Window around a term occurrence, read at its stored byte offset."""
+    start = max(0, offset - length // 3)
+    with open_book(BOOKS_DIR / meta["filename"]) as f:
+        f.seek(start)
+        raw = f.read(2 * length)
+    text = raw.decode("utf-8", errors="ignore")
+    text = " ".join(text.split())
+    if start > 0:
+        # drop the (probably cut) first word
+        text = "..." + text.split(" ", 1)[-1]
+    return text[:length] + "..."
 
 
 # ----------------------------------------------------
 # Unified Keyword Search (with optional regex)
 # Ranking mode: TF / PR / TF×PR
 # ----------------------------------------------------
-@app.get("/search-keyword")
-def search_keyword(
-    q: str,
-    advanced: bool = False,
-    rank_mode: str = "tf",
-    page: int = 1,
-    page_size: int = 20,
-):
-    start_time = perf_counter()
-    query = q.strip().lower()
-    if not query:
-        return empty_result(q, page, page_size)
+keyword_stages = Stages("search_keyword")
+
+
+def score_keyword(gen, query: str, advanced: bool, scored: bool = False):
+    """(scores, truncated) for a query.
+
+    scores: book_id -> {"tf": ..., "pr": ..., "terms": set(...), "first": offset,
+    "bm25": ...}, "first" being the earliest stored match offset (or None) and
+    "bm25" the summed BM25 of the matched terms (0.0 unless `scored`).
+    truncated is True when a regex hit the term/time budget before testing
+    every term.
+    """
+    inverted_index = gen.inverted_index
+    pagerank_scores = gen.pagerank_scores
+    scorer = gen.bm25 if scored else None
 
     # -----------------------------------
     # Regex on terms (advanced = True)
@@ -108,181 +262,377 @@ def search_keyword(
         except re.error:
             raise HTTPException(400, "Invalid regex pattern")
 
-        matched_terms = [t for t in inverted_index.keys() if pattern.search(t)]
-        if not matched_terms:
-            return empty_result(q, page, page_size)
+        with keyword_stages("match"):
+            matched, truncated = gen.term_matcher.match(pattern)
 
-        scores = {}  # book_id_str -> {"tf": ..., "pr": ..., "terms": set(...)}
-
-        for term in matched_terms:
-            for book_id_str, tf in inverted_index[term].items():
-                pr = float(pagerank_scores.get(book_id_str, 0.0))
-                info = scores.setdefault(
-                    book_id_str, {"tf": 0, "pr": pr, "terms": set()}
-                )
-                info["tf"] += tf
-                info["terms"].add(term)
+        scores = {}
+        with keyword_stages("score"):
+            for i in matched:
+                term = inverted_index.term_at(i)
+                postings = inverted_index.postings_at(i, full=True)
+                weights = scorer.score(postings, inverted_index.df[i]) if scorer else repeat(0.0)
+                for (book_id, tf, *first), w in zip(postings, weights):
+                    pr = float(pagerank_scores.get(str(book_id), 0.0))
+                    info = scores.setdefault(
+                        book_id, {"tf": 0, "pr": pr, "terms": set(), "first": None, "bm25": 0.0}
+                    )
+                    info["tf"] += tf
+                    info["bm25"] += w
+                    info["terms"].add(term)
+                    if first and (info["first"] is None or first[0] < info["first"]):
+                        info["first"] = first[0]
+        return scores, truncated
 
     # -----------------------------------
     # Simple keyword
     # -----------------------------------
-    else:
-        if query not in inverted_index:
-            return empty_result(q, page, page_size)
-
+    if WORD_RE.fullmatch(query):
+        with keyword_stages("match"):
+            i = inverted_index.find(query)
+            postings = inverted_index.postings_at(i, full=True) if i >= 0 else []
         scores = {}
-        for book_id_str, tf in inverted_index[query].items():
-            pr = float(pagerank_scores.get(book_id_str, 0.0))
-            scores[book_id_str] = {"tf": tf, "pr": pr, "terms": {query}}
+        with keyword_stages("score"):
+            weights = (scorer.score(postings, inverted_index.df[i]) if scorer and postings
+                       else repeat(0.0))
+            for (book_id, tf, *first), w in zip(postings, weights):
+                pr = float(pagerank_scores.get(str(book_id), 0.0))
+                scores[book_id] = {
+                    "tf": tf, "pr": pr, "terms": {query}, "first": first[0] if first else None,
+                    "bm25": w,
+                }
+        return scores, False
 
     # -----------------------------------
-    # Apply ranking mode
+    # Boolean / phrase query
     # -----------------------------------
-    def rank_value(info):
-        if rank_mode == "pr":
-            return info["pr"]
-        elif rank_mode == "tfpr":
-            return info["tf"] * info["pr"]
-        else:  # "tf"
-            return info["tf"]
+    try:
+        with keyword_stages("parse"):
+            node = parse_query(query, gen.query_stopwords)
+        # postings intersection/union; BM25 is summed along the way
+        with keyword_stages("match"):
+            hits = gen.query_evaluator.evaluate(node, scorer) if node is not None else []
+    except QueryError as e:
+        raise HTTPException(400, f"Invalid query: {e}")
+
+    scores = {}
+    with keyword_stages("score"):
+        for book_id, tf, first, terms, w in hits:
+            pr = float(pagerank_scores.get(str(book_id), 0.0))
+            scores[book_id] = {
+                "tf": tf, "pr": pr, "terms": set(terms), "first": first, "bm25": w,
+            }
+    return scores, False
+
+
+BM25_MODES = ("bm25", "bm25pr")
 
-    ranked = sorted(scores.items(), key=lambda kv: rank_value(kv[1]), reverse=True)
 
-    total = len(ranked)
-    start = (page - 1) * page_size
-    sliced = ranked[start:start + page_size]
+def rank_value(gen, info, rank_mode):
+    if rank_mode == "pr":
+        return info["pr"]
+    elif rank_mode == "tfpr":
+        return info["tf"] * info["pr"]
+    elif rank_mode == "bm25":
+        return info["bm25"]
+    elif rank_mode == "bm25pr":
+        return gen.bm25.with_prior(info["bm25"], info["pr"])
+    else:  # "tf"
+        return info["tf"]
+
+
+@app.get("/search-keyword")
+def search_keyword(
+    q: str,
+    advanced: bool = False,
+    rank_mode: str = "tf",
+    page: int = 1,
+    page_size: int = 20,
+    snippet: str = "head",
+):
+    """Without `advanced`, q may combine words with AND / OR / NOT (or a
+    leading "-"), parentheses and "quoted phrases" (see query.py).
+
+    snippet="match" shows text around the first match instead of the
+    book's opening lines (one small ranged read per result)."""
+    start_time = perf_counter()
+    gen = serving_generation()
+    query = q.strip().lower() if advanced else normalize_query(q)
+    if not query:
+        return empty_result(q, page, page_size)
+
+    result_key = (gen.number, "keyword", query, advanced, rank_mode, page, page_size, snippet)
+    with keyword_stages("cache"):
+        cached = result_cache.get(result_key)
+    if cached is not None:
+        backend_ms = (perf_counter() - start_time) * 1000
+        return {**cached, "query": q, "backend_ms": backend_ms}
+
+    # Scored + lazily ranked candidates are cached per query, so the next
+    # page only pops a few more entries off the heap.
+    cache_key = ("keyword", query, advanced, rank_mode)
+    cursor = gen.ranked_cursors.get(cache_key)
+    if cursor is None:
+        scores, truncated = score_keyword(gen, query, advanced, rank_mode in BM25_MODES)
+        with keyword_stages("sort"):
+            cursor = RankedCursor(
+                scores.items(), key=lambda info: rank_value(gen, info, rank_mode),
+                truncated=truncated,
+            )
+        gen.ranked_cursors.put(cache_key, cursor)
+
+    if not cursor.total:
+        return empty_result(q, page, page_size)
+
+    total = cursor.total
+    with keyword_stages("sort"):
+        sliced = cursor.page(page, page_size)
 
     results = []
-    for book_id_str, info in sliced:
-        meta = meta_by_id[int(book_id_str)]
-        snippet = format_snippet(meta)
-
-        if rank_mode == "pr":
-            display_score = info["pr"]
-        elif rank_mode == "tf":
-            display_score = info["tf"]
-        else:
-            display_score = info["tf"] * info["pr"]
-
-        results.append({
-            "book_id": meta["book_id"],           # int for frontend
-            "title": meta["title"],
-            "snippet": snippet,
-            "cover_url": make_cover_url(meta),
-            "tf": info["tf"],
-            "pagerank": info["pr"],
-            "matched_terms": sorted(info["terms"]),
-            "score": display_score,
-        })
+    with keyword_stages("snippets"):
+        for book_id, info in sliced:
+            meta = gen.meta_by_id[book_id]
+            if snippet == "match" and info["first"] is not None:
+                snippet_text = match_snippet(meta, info["first"])
+            else:
+                snippet_text = format_snippet(gen, meta)
+
+            if rank_mode in BM25_MODES:
+                display_score = rank_value(gen, info, rank_mode)
+            elif rank_mode == "pr":
+                display_score = info["pr"]
+            elif rank_mode == "tf":
+                display_score = info["tf"]
+            else:
+                display_score = info["tf"] * info["pr"]
+
+            results.append({
+                "book_id": meta["book_id"],           # int for frontend
+                "title": meta["title"],
+                "snippet": snippet_text,
+                "cover_url": make_cover_url(gen, meta, "thumb"),
+                "tf": info["tf"],
+                "pagerank": info["pr"],
+                "matched_terms": sorted(info["terms"]),
+                "score": display_score,
+            })
     backend_ms = (perf_counter() - start_time) * 1000
-    return {
+    response = {
         "query": q,
         "page": page,
         "page_size": page_size,
         "rank_mode": rank_mode,
         "advanced": advanced,
         "total": total,
+        "truncated": cursor.truncated,
         "backend_ms": backend_ms,
         "results": results,
     }
+    result_cache.put(result_key, response)
+    return response
 
 
 # ----------------------------------------------------
 # Title Search (uses PageRank for ranking)
 # ----------------------------------------------------
+title_stages = Stages("search_title")
+
+
 @app.get("/search-title")
 def search_title(q: str, page: int = 1, page_size: int = 20):
+    gen = serving_generation()
     term = q.strip().lower()
     if not term:
         return empty_result(q, page, page_size)
 
-    matches = []
-    for book_id, meta in meta_by_id.items():
-        if term in meta["title"].lower():
-            pr = float(pagerank_scores.get(str(book_id), 0.0))
-            matches.append((book_id, pr))
-        for author in meta["authors"]:
-            if term in author.lower():
-                pr = float(pagerank_scores.get(str(book_id), 0.0))
-                matches.append((book_id, pr))
-    matches.sort(key=lambda x: x[1], reverse=True)
-
-    total = len(matches)
-    start = (page - 1) * page_size
-    sliced = matches[start:start + page_size]
+    result_key = (gen.number, "title", term, page, page_size)
+    with title_stages("cache"):
+        cached = result_cache.get(result_key)
+    if cached is not None:
+        return {**cached, "query": q}
+
+    cache_key = ("title", term)
+    cursor = gen.ranked_cursors.get(cache_key)
+    if cursor is None:
+        with title_stages("match"):
+            book_ids = gen.title_index.search(term)
+        with title_stages("score"):
+            matches = [
+                (book_id, float(gen.pagerank_scores.get(str(book_id), 0.0)))
+                for book_id in book_ids
+            ]
+        with title_stages("sort"):
+            cursor = RankedCursor(matches, key=lambda pr: pr)
+        gen.ranked_cursors.put(cache_key, cursor)
+
+    total = cursor.total
+    with title_stages("sort"):
+        sliced = cursor.page(page, page_size)
     results = []
-    for book_id, pr in sliced:
-        meta = meta_by_id[book_id]
-        snippet = format_snippet(meta)
-        results.append({
-            "book_id": meta["book_id"],
-            "title": meta["title"],
-            "snippet": snippet,
-            "cover_url": make_cover_url(meta),
-            "score": pr,
-            "pagerank": pr,
-        })
-    return {
+    with title_stages("snippets"):
+        for book_id, pr in sliced:
+            meta = gen.meta_by_id[book_id]
+            snippet = format_snippet(gen, meta)
+            results.append({
+                "book_id": meta["book_id"],
+                "title": meta["title"],
+                "snippet": snippet,
+                "cover_url": make_cover_url(gen, meta, "thumb"),
+                "score": pr,
+                "pagerank": pr,
+            })
+    response = {
         "query": q,
         "page": page,
         "page_size": page_size,
         "total": total,
         "results": results,
     }
+    result_cache.put(result_key, response)
+    return response
 
 
 # ----------------------------------------------------
 # Book info  /book/{book_id}
 # ----------------------------------------------------
 @app.get("/book/{book_id}")
-def get_book(book_id: int):
+async def get_book(book_id: int):
     key = str(book_id)
-    meta = meta_by_id.get(book_id)
+    gen = serving_generation()
+    meta = gen.meta_by_id.get(book_id)
     if not meta:
         raise HTTPException(404, "Book not found")
 
     book_path = BOOKS_DIR / meta["filename"]
-    with book_path.open("r", encoding="utf-8", errors="ignore") as f:
-        text = f.read()
+    if not await book_lane.run(book_exists, book_path):
+        raise HTTPException(404, "Book file not found")
 
-    return {
+    # streamed: the full text is never held in memory; reads go through
+    # the /book I/O lane, not the threadpool the search handlers use
+    body = {
         "book_id": meta["book_id"],
         "title": meta["title"],
-        "cover_url": make_cover_url(meta),
-        "content": text,
+        "cover_url": make_cover_url(gen, meta),
+        "content": None,
         "summary": meta["summary"],
         "authors": meta["authors"],
     }
+    return StreamingResponse(
+        book_lane.iterate(iter_json_with_text(body, "content", book_path)),
+        media_type="application/json",
+    )
+
+
+# ----------------------------------------------------
+# Book cards  /books?ids=1,2,3&fields=title,cover_url
+# (grids and shelves: metadata only, never the book text)
+# ----------------------------------------------------
+CARD_FIELDS = {
+    "title": lambda gen, meta: meta["title"],
+    "authors": lambda gen, meta: meta.get("authors") or [],
+    "cover_url": lambda gen, meta: make_cover_url(gen, meta),
+    "cover_thumb_url": lambda gen, meta: make_cover_url(gen, meta, "thumb"),
+    "snippet": format_snippet,
+    "pagerank": lambda gen, meta: float(gen.pagerank_scores.get(str(meta["book_id"]), 0.0)),
+    "summary": lambda gen, meta: meta.get("summary"),
+    "languages": lambda gen, meta: meta.get("languages") or [],
+    "word_count": lambda gen, meta: meta.get("word_count"),
+}
+DEFAULT_CARD_FIELDS = ("title", "authors", "cover_url", "snippet", "pagerank")
+# max ids per /books request
+BOOKS_BATCH_MAX = int(os.environ.get("BOOKS_BATCH_MAX", "200"))
+
+
+def parse_id_list(value: str, name: str):
+    try:
+        return [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise HTTPException(400, f"{name} must be comma-separated integers")
+
+
+@app.get("/books")
+def get_books(ids: str, fields: str = ""):
+    """Cards for many books in one response, in the order asked.
+
+    fields: comma-separated subset of CARD_FIELDS (default: title, authors,
+    cover_url, snippet, pagerank); book_id is always included. Unknown
+    ids are listed under "missing"."""
+    gen = serving_generation()
+    book_ids = parse_id_list(ids, "ids")
+    if len(book_ids) > BOOKS_BATCH_MAX:
+        raise HTTPException(400, f"At most {BOOKS_BATCH_MAX} ids per request")
+
+    wanted = [f.strip() for f in fields.split(",") if f.strip()] or DEFAULT_CARD_FIELDS
+    unknown = [f for f in wanted if f not in CARD_FIELDS and f != "book_id"]
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}")
+    getters = [(f, CARD_FIELDS[f]) for f in dict.fromkeys(wanted) if f != "book_id"]
+
+    books = []
+    missing = []
+    for book_id in dict.fromkeys(book_ids):
+        meta = gen.meta_by_id.get(book_id)
+        if meta is None:
+            missing.append(book_id)
+            continue
+        card = {"book_id": meta["book_id"]}
+        for name, get in getters:
+            card[name] = get(gen, meta)
+        books.append(card)
+    return {"books": books, "missing": missing}
 
 
 # ----------------------------------------------------
 # Paginated reading  /book-page/{book_id}
 # ----------------------------------------------------
-@app.get("/book-page/{book_id}")
-def get_book_page(book_id: int, page: int = 1, size: int = 5000):
-    key = str(book_id)
-    meta = meta_by_id.get(book_id)
-    if not meta:
-        raise HTTPException(404, "Book not found")
+book_page_stages = Stages("get_book_page")
 
-    book_path = BOOKS_DIR / meta["filename"]
-    if not book_path.exists():
-        raise HTTPException(404, "Book file not found")
 
-    with book_path.open("r", encoding="utf-8", errors="ignore") as f:
-        text = f.read()
+def read_book_page(gen, meta: dict, page: int, size: int):
+    """(page, total_pages, text) for a book; blocking, run on book_page_lane."""
+    book_path = BOOKS_DIR / meta["filename"]
+    with book_page_stages("locate"):
+        if not book_exists(book_path):
+            raise HTTPException(404, "Book file not found")
+        pages = gen.page_index.get(meta["book_id"])
+
+    if pages is None:
+        # no page index for this book (older data): read it all
+        with book_page_stages("read"), open_book_text(book_path) as f:
+            text = f.read()
+        total_chars = len(text)
+    else:
+        total_chars, chars, offsets = pages
 
-    total_pages = (len(text) + size - 1) // size
+    total_pages = (total_chars + size - 1) // size
     page = max(1, min(page, total_pages))
 
     start = (page - 1) * size
     end = start + size
-    chunk = text[start:end]
+    if pages is None:
+        chunk = text[start:end]
+    else:
+        with book_page_stages("read"):
+            chunk = read_chars(book_path, (chars, offsets), start, size)
+    return page, total_pages, chunk
+
+
+@app.get("/book-page/{book_id}")
+async def get_book_page(book_id: int, page: int = 1, size: int = 5000):
+    key = str(book_id)
+    gen = serving_generation()
+    meta = gen.meta_by_id.get(book_id)
+    if not meta:
+        raise HTTPException(404, "Book not found")
+
+    if size < 1:
+        raise HTTPException(400, "size must be positive")
+
+    page, total_pages, chunk = await book_page_lane.run(read_book_page, gen, meta, page, size)
 
     return {
         "book_id": meta["book_id"],
         "title": meta["title"],
-        "cover_url": make_cover_url(meta),
+        "cover_url": make_cover_url(gen, meta),
         "page": page,
         "total_pages": total_pages,
         "text": chunk,
@@ -291,25 +641,90 @@ def get_book_page(book_id: int, page: int = 1, size: int = 5000):
 
 # ----------------------------------------------------
 # Jaccard-based recommendations  /recommend/{book_id}
+# (similarity rows are presorted by score: top-k is a slice)
 # ----------------------------------------------------
+def recommendation(gen, other_id: int, sim: float):
+    meta = gen.meta_by_id[other_id]
+    return {
+        "book_id": meta["book_id"],
+        "title": meta["title"],
+        "cover_url": make_cover_url(gen, meta, "thumb"),
+        "score": sim,
+    }
+
+
 @app.get("/recommend/{book_id}")
 def recommend(book_id: int, limit: int = 5):
     start_time = perf_counter()
-    if book_id not in similarity_graph:
-        raise HTTPException(404, "Book not found in similarity graph")
+    gen = serving_generation()
+    result_key = (gen.number, "recommend", book_id, limit)
+    cached = result_cache.get(result_key)
+    if cached is not None:
+        return {**cached, "backend_ms": (perf_counter() - start_time) * 1000}
 
-    neighbors = similarity_graph[book_id]  # { other_id: sim }
+    if book_id not in gen.similarity_graph:
+        raise HTTPException(404, "Book not found in similarity graph")
 
-    ranked = sorted(neighbors.items(), key=lambda x: x[1], reverse=True)[:limit]
+    ranked = gen.similarity_graph.top(book_id, limit)   # [(other_id, sim)]
 
-    results = []
-    for other_id, sim in ranked:
-        meta = meta_by_id[other_id]
-        results.append({
-            "book_id": meta["book_id"],
-            "title": meta["title"],
-            "cover_url": make_cover_url(meta),
-            "score": sim,
-        })
+    results = [recommendation(gen, other_id, sim) for other_id, sim in ranked]
     backend_ms = (perf_counter() - start_time ) * 1000
-    return {"book_id": book_id, "recommendations": results, "backend_ms": backend_ms}
+    response = {"book_id": book_id, "recommendations": results, "backend_ms": backend_ms}
+    result_cache.put(result_key, response)
+    return response
+
+
+# max book_ids + seeds in one POST /recommend
+RECOMMEND_BATCH_MAX = int(os.environ.get("RECOMMEND_BATCH_MAX", "200"))
+
+
+@app.post("/recommend")
+def recommend_batch(req: RecommendBatchRequest):
+    """Recommendations for many books in one call.
+
+    book_ids: the top `limit` neighbours of each (e.g. a whole shelf).
+    seeds: one merged top `limit` over all of them; a candidate scores the
+    sum of its similarities to the seeds, and seeds themselves are left out.
+    Unknown ids are listed under "missing"."""
+    start_time = perf_counter()
+    gen = serving_generation()
+    graph = gen.similarity_graph
+    if len(req.book_ids) + len(req.seeds) > RECOMMEND_BATCH_MAX:
+        raise HTTPException(400, f"At most {RECOMMEND_BATCH_MAX} book_ids + seeds per request")
+
+    missing = []
+    recommendations = {}
+    for book_id in dict.fromkeys(req.book_ids):
+        if book_id not in graph:
+            missing.append(book_id)
+            continue
+        recommendations[str(book_id)] = [
+            recommendation(gen, other_id, sim) for other_id, sim in graph.top(book_id, req.limit)
+        ]
+
+    merged = []
+    if req.seeds:
+        seeds = set(req.seeds)
+        totals = defaultdict(float)
+        via = defaultdict(list)
+        for seed in dict.fromkeys(req.seeds):
+            if seed not in graph:
+                if seed not in missing:
+                    missing.append(seed)
+                continue
+            for other_id, sim in graph.top(seed):
+                if other_id not in seeds:
+                    totals[other_id] += sim
+                    via[other_id].append(seed)
+        best = heapq.nlargest(max(0, req.limit), totals.items(), key=lambda x: x[1])
+        merged = [
+            {**recommendation(gen, other_id, score), "seeds": via[other_id]}
+            for other_id, score in best
+        ]
+
+    return {
+        "recommendations": recommendations,
+        "merged": merged,
+        "missing": missing,
+        "backend_ms": (perf_counter() - start_time) * 1000,
+    }
@@ -0,0 +1,428 @@
+# backend/metrics.py
+#
+# Prometheus-style metrics and per-request stage timing.
+#
+# MetricsMiddleware records every request in a latency histogram labelled
+# with the matched route. Inside handlers, `with stages(...)` blocks (one
+# Stages timer per endpoint) time the parts of a request (term matching, scoring, sorting, snippet reads...) into
+# a per-stage histogram, and the stages of the current request are returned
+# in a Server-Timing header so one slow response can be read in the browser.
+# GET /metrics renders everything in the Prometheus text format, together
+# with gauges registered through REGISTRY.collector.
+#
+# uvicorn runs WEB_CONCURRENCY worker processes behind one port and a scrape
+# lands on any of them, so each worker also writes its series to
+# METRICS_DIR/<parent pid>-<pid>.json (every METRICS_FLUSH_SECS, and on each
+# scrape it answers) and /metrics renders the histograms summed over every
+# worker of the same server, including workers that have exited, so the
+# counters never go back. Collector gauges describe one worker (its caches,
+# its generation) and are rendered per live worker with a "worker" label.
+#
+# With METRICS_PROFILING=true a request sent with "X-Profile: 1" is also
+# sampled: a background thread snapshots the stacks of the threads running
+# its stages every PROFILE_INTERVAL_MS (it needs the GIL to do so, so finer
+# than sys.getswitchinterval() buys nothing) and keeps them as folded stacks
+# (flamegraph.pl / speedscope input). The response carries X-Profile-Id
+# (<pid>-<n>, unique across workers); the last PROFILE_KEEP profiles are kept
+# under METRICS_DIR/profiles so any worker serves GET /admin/profiles/{id}.
+
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from tempfile import gettempdir
+from time import perf_counter, sleep
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROFILING_ENABLED = os.environ.get("METRICS_PROFILING", "false").lower() == "true"
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "32"))
+
+# shared by the workers of one pod (an emptyDir in k8s)
+METRICS_DIR = Path(os.environ.get("METRICS_DIR", Path(gettempdir()) / "bookapi-metrics"))
+METRICS_FLUSH_SECS = float(os.environ.get("METRICS_FLUSH_SECS", "1"))
+PROFILES_DIR = METRICS_DIR / "profiles"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ---------------------------------------------
+# Histograms and the registry
+# ---------------------------------------------
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}       # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {k: list(v) for k, v in self._series.items()}
+
+    def render(self, series=None):
+        """Lines for `series` (label values -> values, this process's by default)."""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        if series is None:
+            series = self.snapshot()
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), values[:-2] + [values[-1]]):
+                cumulative = n if bound == float("inf") else cumulative + n
+                lbl = _labels(self.labelnames + ("le",), labels + (_number(bound),))
+                lines.append(f"{self.name}_bucket{lbl} {cumulative}")
+            lbl = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{lbl} {_number(values[-2])}")
+            lines.append(f"{self.name}_count{lbl} {values[-1]}")
+        return lines
+
+
+def metric(name: str, help: str, value, labels=None, kind="gauge"):
+    """One sample returned by a collector; samples sharing a name are
+    rendered as one metric family."""
+    return name, help, kind, labels or {}, value
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    def __init__(self, directory: Path = METRICS_DIR):
+        self.histograms = []
+        self.collectors = []
+        self.directory = directory
+        # workers forked by one uvicorn/gunicorn master share its pid
+        self.group = os.getppid()
+        self._flusher = None
+        self._flush_lock = threading.Lock()
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        hist = Histogram(*args, **kwargs)
+        self.histograms.append(hist)
+        return hist
+
+    def collector(self, fn):
+        """Register fn() -> [metric(...), ...], called on every scrape."""
+        self.collectors.append(fn)
+        return fn
+
+    def collect(self):
+        samples = []
+        for collect in self.collectors:
+            samples += [s for s in collect() if s[4] is not None]
+        return samples
+
+    # -- sharing with the other workers -------------------------------------
+    def _path(self, pid: int) -> Path:
+        return self.directory / f"{self.group}-{pid}.json"
+
+    def flush(self):
+        """Write this worker's series and gauges where the others can read them."""
+        state = {
+            "histograms": {h.name: [[list(k), v] for k, v in h.snapshot().items()]
+                           for h in self.histograms},
+            "gauges": [[name, help, kind, labels, value]
+                       for name, help, kind, labels, value in self.collect()],
+        }
+        path = self._path(os.getpid())
+        with self._flush_lock:
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(state))
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"Cannot write metrics to {self.directory}: {e}")
+
+    def start_flushing(self):
+        """Flush every METRICS_FLUSH_SECS from a daemon thread (once per process)."""
+        if self._flusher is not None and self._flusher[0] == os.getpid():
+            return
+        try:
+            self._remove_stale()
+        except OSError:
+            pass
+
+        def run():
+            while True:
+                sleep(METRICS_FLUSH_SECS)
+                self.flush()
+
+        thread = threading.Thread(target=run, name="metrics-flush", daemon=True)
+        self._flusher = (os.getpid(), thread)
+        thread.start()
+
+    def _remove_stale(self):
+        """Drop files left by servers that are gone (other parent pids)."""
+        for path in self.directory.glob("*-*.json"):
+            group = path.stem.split("-")[0]
+            if group.isdigit() and int(group) != self.group and not _alive(int(group)):
+                path.unlink(missing_ok=True)
+
+    def _workers(self):
+        """(pid, state) of every worker of this server, this one read fresh."""
+        own = os.getpid()
+        workers = []
+        for path in sorted(self.directory.glob(f"{self.group}-*.json")):
+            pid = path.stem.split("-")[1]
+            if not pid.isdigit() or int(pid) == own:
+                continue
+            try:
+                workers.append((int(pid), json.loads(path.read_text())))
+            except (OSError, ValueError):
+                continue    # being replaced; its series are back on the next scrape
+        return workers
+
+    def render(self) -> str:
+        self.flush()
+        own = os.getpid()
+        workers = self._workers()
+
+        families = OrderedDict()
+        gauges = [(own, self.collect())]
+        gauges += [(pid, state["gauges"]) for pid, state in workers if _alive(pid)]
+        for pid, samples in gauges:
+            for name, help, kind, labels, value in samples:
+                family = families.setdefault(name, (help, kind, []))
+                family[2].append(({**labels, "worker": pid}, value))
+
+        lines = []
+        for name, (help, kind, samples) in families.items():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+        for hist in self.histograms:
+            merged = hist.snapshot()
+            for _, state in workers:
+                for labels, values in state["histograms"].get(hist.name, []):
+                    series = merged.setdefault(tuple(labels), [0] * len(values))
+                    for i, v in enumerate(values):
+                        series[i] += v
+            lines += hist.render(merged)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REQUEST_LATENCY = REGISTRY.histogram(
+    "bookapi_request_duration_seconds", "Request latency by route and status.",
+    ("method", "endpoint", "status"),
+)
+STAGE_LATENCY = REGISTRY.histogram(
+    "bookapi_stage_duration_seconds", "Time spent in each stage of a request.",
+    ("endpoint", "stage"),
+)
+
+
+# ---------------------------------------------
+# Per-request stage timing
+# ---------------------------------------------
+class RequestTimings:
+    def __init__(self, profile=None):
+        self.stages = defaultdict(float)    # stage -> seconds
+        self.profile = profile
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={secs * 1000:.3f}" for name, secs in self.stages.items())
+
+
+_current = ContextVar("request_timings", default=None)
+
+
+class Stages:
+    """Stage timer for one endpoint: `with stages("score"): ...`."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+
+    @contextmanager
+    def __call__(self, name: str):
+        timings = _current.get()
+        profile = timings.profile if timings is not None else None
+        if profile is not None:
+            profile.attach()
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            secs = perf_counter() - start
+            if profile is not None:
+                profile.detach()
+            STAGE_LATENCY.observe(secs, self.endpoint, name)
+            if timings is not None:
+                timings.stages[name] += secs
+
+
+# ---------------------------------------------
+# Sampling profiler
+# ---------------------------------------------
+def _folded(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{Path(code.co_filename).name}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples the stacks of the threads currently attached to it."""
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.threads = Counter()     # thread ident -> open stages
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def attach(self):
+        self.threads[threading.get_ident()] += 1
+
+    def detach(self):
+        ident = threading.get_ident()
+        self.threads[ident] -= 1
+        if self.threads[ident] <= 0:
+            del self.threads[ident]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.threads):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_folded(frame)] += 1
+                    self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+_profile_ids = itertools.count(1)
+_profiles_lock = threading.Lock()
+PROFILE_ID_RE = re.compile(r"\d+-\d+")
+
+
+def _next_profile_id() -> str:
+    return f"{os.getpid()}-{next(_profile_ids)}"
+
+
+def get_profile(profile_id: str):
+    if not PROFILE_ID_RE.fullmatch(profile_id):
+        return None
+    try:
+        return (PROFILES_DIR / f"{profile_id}.folded").read_text()
+    except OSError:
+        return None
+
+
+def _keep_profile(profile_id: str, text: str):
+    with _profiles_lock:
+        try:
+            PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+            path = PROFILES_DIR / f"{profile_id}.folded"
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(text)
+            os.replace(tmp, path)
+            kept = sorted(PROFILES_DIR.glob("*.folded"), key=lambda p: p.stat().st_mtime)
+            for old in kept[:-PROFILE_KEEP]:
+                old.unlink(missing_ok=True)
+        except OSError as e:
+            print(f"Cannot keep profile {profile_id}: {e}")
+
+
+# ---------------------------------------------
+# ASGI middleware
+# ---------------------------------------------
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = profile_id = None
+        if PROFILING_ENABLED and dict(scope["headers"]).get(b"x-profile", b"") not in (b"", b"0"):
+            profile, profile_id = SamplingProfiler(), _next_profile_id()
+            profile.start()
+
+        timings = RequestTimings(profile)
+        token = _current.set(timings)
+        status = 500
+        start = perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                if timings.stages:
+                    headers.append((b"server-timing", timings.server_timing().encode("latin-1")))
+                if profile_id is not None:
+                    headers.append((b"x-profile-id", profile_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "other"
+            REQUEST_LATENCY.observe(perf_counter() - start, scope["method"], route, str(status))
+            if profile is not None:
+                profile.stop()
+                _keep_profile(profile_id, profile.folded())
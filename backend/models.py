@@ -20,3 +20,9 @@ class BookDetail(BaseModel):
 class SearchResponse(BaseModel):
     query: str
     results: List[BookSummary]
+
+
+class RecommendBatchRequest(BaseModel):
+    book_ids: List[int] = []    # top `limit` for each of these books
+    seeds: List[int] = []       # one merged top `limit` for all of them
+    limit: int = 5
@@ -0,0 +1,414 @@
+# backend/packed.py
+#
+# Flat binary copies of metadata.json, pagerank.json and similarity.json,
+# plus the snippet table and page-offset index written by the index build.
+#
+# The JSON artifacts are parsed into per-process dicts; these files can be
+# memory-mapped read-only instead, so every uvicorn worker (and every pod on
+# the same node) shares one page-cache copy of the data. Each file is a small
+# header followed by 8-byte aligned little-endian arrays keyed by a sorted
+# book_id array, so a lookup is a binary search plus a slice.
+#
+# The index build hands books over one at a time, in completion order, to the
+# *Writer classes; they spill values to disk and sort only the id arrays, so
+# writing these files does not hold the corpus in memory.
+
+import io
+import json
+import struct
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from pathlib import Path
+
+from binindex import pad8, to_le, typed_view, open_buffer
+
+# magic, count, aux (edges for the graph), flags
+HEADER = struct.Struct("<4sIQQ")
+
+RECORDS_MAGIC = b"BSMR"
+TEXTS_MAGIC = b"BSTX"
+PAGES_MAGIC = b"BSPG"
+SCORES_MAGIC = b"BSPR"
+GRAPH_MAGIC = b"BSSG"
+
+# graph rows are ordered by descending score (older files: unordered)
+FLAG_SORTED = 1
+
+
+def _write_to(f, magic, count, aux, sections, flags=0):
+    # a section is bytes, or an iterable of byte chunks (streamed values)
+    f.write(HEADER.pack(magic, count, aux, flags))
+    for data in sections:
+        pad8(f)
+        if isinstance(data, (bytes, bytearray)):
+            f.write(data)
+        else:
+            for part in data:
+                f.write(part)
+
+
+def _write(path, magic, count, aux, sections, flags=0):
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        _write_to(f, magic, count, aux, sections, flags)
+    tmp.replace(path)
+
+
+def _open(path, magic, use_mmap, buf=None):
+    if buf is None:
+        buf = open_buffer(path, use_mmap)
+    found, count, aux, _ = HEADER.unpack_from(buf, 0)
+    if found != magic:
+        raise ValueError(f"{path}: bad magic {found!r}")
+    return buf, count, aux
+
+
+def _align(off: int) -> int:
+    return (off + 7) & ~7
+
+
+class _SpillWriter:
+    """Base of the streaming writers: book_ids arrive one at a time, in any
+    order; variable-size values are spilled to a temp file next to `path`,
+    so memory holds only fixed-size per-book arrays until close() writes the
+    file in book_id order."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.ids = array("I")
+        self.spill_path = self.path.with_name(self.path.name + ".spill")
+        self.spill = self.spill_path.open("w+b")
+
+    def _spill(self, data) -> int:
+        start = self.spill.tell()
+        self.spill.write(data)
+        return start
+
+    def _unspill(self, start, size):
+        self.spill.seek(start)
+        return self.spill.read(size)
+
+    def close(self):
+        order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        self.spill.flush()
+        try:
+            self._write_sorted(order)
+        finally:
+            self.spill.close()
+            self.spill_path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.spill.close()
+            self.spill_path.unlink(missing_ok=True)
+
+
+class _Packed(Mapping):
+    """Mapping over a sorted uint32 id array; subclasses decode values."""
+
+    def _index(self, book_id) -> int:
+        try:
+            book_id = int(book_id)
+        except (TypeError, ValueError):
+            raise KeyError(book_id)
+        i = bisect_left(self.ids, book_id)
+        if i < len(self.ids) and self.ids[i] == book_id:
+            return i
+        raise KeyError(book_id)
+
+    def __contains__(self, book_id):
+        try:
+            self._index(book_id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.buf)
+
+
+# ---------------------------------------------
+# metadata: book_id -> dict
+# ---------------------------------------------
+def write_records(records: dict, path):
+    ids = array("I", sorted(records))
+    offs = array("Q", [0])
+    blob = bytearray()
+    for bid in ids:
+        blob += json.dumps(records[bid], ensure_ascii=False).encode("utf-8")
+        offs.append(len(blob))
+    _write(path, RECORDS_MAGIC, len(ids), 0, [to_le(ids), to_le(offs), bytes(blob)])
+
+
+class PackedRecords(_Packed):
+    """Metadata entries, JSON-decoded on access (with a small cache)."""
+
+    CACHE_SIZE = 4096
+
+    def __init__(self, path, use_mmap=False):
+        self.buf, n, _ = _open(path, RECORDS_MAGIC, use_mmap)
+        off = HEADER.size
+        self.ids = typed_view(self.buf, off, "I", n)
+        off = _align(off + 4 * n)
+        self.offs = typed_view(self.buf, off, "Q", n + 1)
+        self.blob_off = _align(off + 8 * (n + 1))
+        self._cache = {}
+
+    def __getitem__(self, book_id):
+        i = self._index(book_id)
+        rec = self._cache.get(i)
+        if rec is None:
+            start = self.blob_off + self.offs[i]
+            rec = json.loads(bytes(self.buf[start:self.blob_off + self.offs[i + 1]]))
+            if len(self._cache) >= self.CACHE_SIZE:
+                self._cache.clear()
+            self._cache[i] = rec
+        return rec
+
+
+# ---------------------------------------------
+# snippets: book_id -> str
+# ---------------------------------------------
+class TextsWriter(_SpillWriter):
+    def __init__(self, path):
+        super().__init__(path)
+        self.starts = array("Q")
+        self.sizes = array("Q")
+
+    def add(self, book_id, text: str):
+        data = text.encode("utf-8")
+        self.ids.append(int(book_id))
+        self.starts.append(self._spill(data))
+        self.sizes.append(len(data))
+
+    def _write_sorted(self, order):
+        offs = array("Q", [0])
+        for i in order:
+            offs.append(offs[-1] + self.sizes[i])
+        blob = (self._unspill(self.starts[i], self.sizes[i]) for i in order)
+        ids = array("I", (self.ids[i] for i in order))
+        _write(self.path, TEXTS_MAGIC, len(ids), 0, [to_le(ids), to_le(offs), blob])
+
+
+def write_texts(texts: dict, path):
+    with TextsWriter(path) as w:
+        for bid, text in texts.items():
+            w.add(bid, text)
+
+
+class PackedTexts(_Packed):
+    def __init__(self, path, use_mmap=False):
+        self.buf, n, _ = _open(path, TEXTS_MAGIC, use_mmap)
+        off = HEADER.size
+        self.ids = typed_view(self.buf, off, "I", n)
+        off = _align(off + 4 * n)
+        self.offs = typed_view(self.buf, off, "Q", n + 1)
+        self.blob_off = _align(off + 8 * (n + 1))
+
+    def __getitem__(self, book_id):
+        i = self._index(book_id)
+        start = self.blob_off + self.offs[i]
+        return bytes(self.buf[start:self.blob_off + self.offs[i + 1]]).decode("utf-8")
+
+
+# ---------------------------------------------
+# page index: book_id -> (total_chars, char checkpoints, byte checkpoints)
+# ---------------------------------------------
+class PageIndexWriter(_SpillWriter):
+    def __init__(self, path):
+        super().__init__(path)
+        self.totals = array("Q")
+        self.starts = array("Q")
+        self.counts = array("Q")
+
+    def add(self, book_id, pages):
+        total, c, b = pages
+        c, b = array("Q", c), array("Q", b)
+        self.ids.append(int(book_id))
+        self.totals.append(total)
+        self.starts.append(self._spill(to_le(c) + to_le(b)))
+        self.counts.append(len(c))
+
+    def _write_sorted(self, order):
+        totals = array("Q", (self.totals[i] for i in order))
+        indptr = array("Q", [0])
+        for i in order:
+            indptr.append(indptr[-1] + self.counts[i])
+        # each spilled value is its char checkpoints then its byte offsets
+        chars = (self._unspill(self.starts[i], 8 * self.counts[i]) for i in order)
+        offsets = (self._unspill(self.starts[i] + 8 * self.counts[i], 8 * self.counts[i])
+                   for i in order)
+        ids = array("I", (self.ids[i] for i in order))
+        _write(self.path, PAGES_MAGIC, len(ids), indptr[-1],
+               [to_le(ids), to_le(totals), to_le(indptr), chars, offsets])
+
+
+def write_page_index(pages: dict, path):
+    with PageIndexWriter(path) as w:
+        for bid, value in pages.items():
+            w.add(bid, value)
+
+
+class PackedPageIndex(_Packed):
+    def __init__(self, path, use_mmap=False):
+        self.buf, n, m = _open(path, PAGES_MAGIC, use_mmap)
+        off = HEADER.size
+        self.ids = typed_view(self.buf, off, "I", n)
+        off = _align(off + 4 * n)
+        self.totals = typed_view(self.buf, off, "Q", n)
+        off += 8 * n
+        self.indptr = typed_view(self.buf, off, "Q", n + 1)
+        off += 8 * (n + 1)
+        self.chars = typed_view(self.buf, off, "Q", m)
+        self.offsets = typed_view(self.buf, off + 8 * m, "Q", m)
+
+    def __getitem__(self, book_id):
+        i = self._index(book_id)
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return self.totals[i], self.chars[lo:hi], self.offsets[lo:hi]
+
+
+# ---------------------------------------------
+# pagerank: book_id -> float
+# ---------------------------------------------
+class ScoresWriter:
+    """Streaming counterpart of write_scores; values are fixed-size, so
+    nothing is spilled."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.ids = array("I")
+        self.vals = array("d")
+
+    def add(self, book_id, score):
+        self.ids.append(int(book_id))
+        self.vals.append(float(score))
+
+    def close(self):
+        order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        ids = array("I", (self.ids[i] for i in order))
+        vals = array("d", (self.vals[i] for i in order))
+        _write(self.path, SCORES_MAGIC, len(ids), 0, [to_le(ids), to_le(vals)])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+def write_scores(scores: dict, path):
+    with ScoresWriter(path) as w:
+        for bid, score in scores.items():
+            w.add(bid, score)
+
+
+class PackedScores(_Packed):
+    def __init__(self, path, use_mmap=False):
+        self.buf, n, _ = _open(path, SCORES_MAGIC, use_mmap)
+        off = HEADER.size
+        self.ids = typed_view(self.buf, off, "I", n)
+        self.vals = typed_view(self.buf, _align(off + 4 * n), "d", n)
+
+    def __getitem__(self, book_id):
+        return self.vals[self._index(book_id)]
+
+
+# ---------------------------------------------
+# similarity graph (CSR): book_id -> {other_id: sim}
+# Each row is sorted by descending score (ties keep their similarity.json
+# order), so the top-k neighbours of a book are the first k entries of its row.
+# ---------------------------------------------
+def _graph_sections(graph: dict):
+    ids = array("I", sorted(int(k) for k in graph))
+    indptr = array("Q", [0])
+    nbrs = array("I")
+    weights = array("d")
+    for bid in ids:
+        row = graph.get(bid, graph.get(str(bid), {}))
+        ranked = sorted(((int(o), float(w)) for o, w in row.items()), key=lambda x: -x[1])
+        for other, w in ranked:
+            nbrs.append(other)
+            weights.append(w)
+        indptr.append(len(nbrs))
+    return len(ids), len(nbrs), [to_le(ids), to_le(indptr), to_le(nbrs), to_le(weights)]
+
+
+def write_graph(graph: dict, path):
+    n, m, sections = _graph_sections(graph)
+    _write(path, GRAPH_MAGIC, n, m, sections, flags=FLAG_SORTED)
+
+
+class PackedGraph(_Packed):
+    def __init__(self, path, use_mmap=False, buf=None):
+        self.buf, n, m = _open(path, GRAPH_MAGIC, use_mmap, buf)
+        self.presorted = bool(HEADER.unpack_from(self.buf, 0)[3] & FLAG_SORTED)
+        off = HEADER.size
+        self.ids = typed_view(self.buf, off, "I", n)
+        off = _align(off + 4 * n)
+        self.indptr = typed_view(self.buf, off, "Q", n + 1)
+        off = _align(off + 8 * (n + 1))
+        self.nbrs = typed_view(self.buf, off, "I", m)
+        self.weights = typed_view(self.buf, _align(off + 4 * m), "d", m)
+
+    @classmethod
+    def from_graph(cls, graph: dict):
+        """In-memory PackedGraph of a {book_id: {other_id: sim}} dict."""
+        n, m, sections = _graph_sections(graph)
+        f = io.BytesIO()
+        _write_to(f, GRAPH_MAGIC, n, m, sections, flags=FLAG_SORTED)
+        return cls("<memory>", buf=f.getvalue())
+
+    def __getitem__(self, book_id):
+        i = self._index(book_id)
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return dict(zip(self.nbrs[lo:hi], self.weights[lo:hi]))
+
+    def top(self, book_id, k=None):
+        """[(other_id, sim)] best first, at most k; KeyError if unknown."""
+        i = self._index(book_id)
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        if not self.presorted:
+            ranked = sorted(zip(self.nbrs[lo:hi], self.weights[lo:hi]), key=lambda x: -x[1])
+            return ranked if k is None else ranked[:k]
+        if k is not None:
+            hi = min(hi, lo + max(0, k))
+        return list(zip(self.nbrs[lo:hi], self.weights[lo:hi]))
+
+
+# ---------------------------------------------
+# Build packed copies from the JSON artifacts
+# ---------------------------------------------
+def pack_all(data_dir):
+    data_dir = Path(data_dir)
+
+    with (data_dir / "metadata.json").open("r", encoding="utf-8") as f:
+        write_records({m["book_id"]: m for m in json.load(f)}, data_dir / "metadata.bin")
+
+    with (data_dir / "pagerank.json").open("r", encoding="utf-8") as f:
+        write_scores(json.load(f), data_dir / "pagerank.bin")
+
+    with (data_dir / "similarity.json").open("r", encoding="utf-8") as f:
+        write_graph(json.load(f), data_dir / "similarity.bin")
+
+
+if __name__ == "__main__":
+    from indexing import DATA_DIR
+
+    pack_all(DATA_DIR)
+    print("Packed metadata.bin, pagerank.bin, similarity.bin in", DATA_DIR)
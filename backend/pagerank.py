@@ -1,8 +1,11 @@
 import json
 import os
+import sys
+import numpy as np
 
 DAMPING = 0.85
-ITERATIONS = 30
+ITERATIONS = 100      # upper bound; stops earlier once converged
+TOLERANCE = 1e-10     # L1 change between iterations
 
 DATA_DIR = os.environ.get("DATA_DIR", "data")
 
@@ -14,24 +17,75 @@ def load_graph(path=None):
     return {int(k): {int(n): w for n, w in v.items()} for k, v in raw.items()}
 
 
-def compute_pagerank(graph):
+def to_csr(graph, weighted=False):
+    """Edge arrays (src, dst, p) where p is the transition probability
+    src -> dst: 1/outdeg, or weight / total out-weight when weighted."""
     nodes = list(graph.keys())
+    pos = {n: i for i, n in enumerate(nodes)}
+
+    src, dst, w = [], [], []
+    for n, nbrs in graph.items():
+        for m, weight in nbrs.items():
+            if m in pos:
+                src.append(pos[n])
+                dst.append(pos[m])
+                w.append(weight if weighted else 1.0)
+
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    w = np.asarray(w, dtype=np.float64)
+
+    out_weight = np.bincount(src, weights=w, minlength=len(nodes))
+    p = w / out_weight[src] if len(w) else w
+    return nodes, src, dst, p, out_weight == 0
+
+
+def pagerank_vector(graph, damping=DAMPING, max_iter=ITERATIONS, tol=TOLERANCE,
+                    weighted=False, init=None):
+    """Power iteration; returns (nodes, scores, iterations, residual).
+
+    Rank held by dangling nodes (no out-edges) is spread uniformly over all
+    nodes each step, so the scores always sum to 1. `init` (node -> score,
+    e.g. the previous pagerank.json) warm-starts the iteration; nodes missing
+    from it start at 1/N.
+    """
+    nodes, src, dst, p, dangling = to_csr(graph, weighted)
     N = len(nodes)
+    if N == 0:
+        return nodes, np.zeros(0), 0, 0.0
+
+    if init:
+        pr = np.fromiter((init.get(n, 1.0 / N) for n in nodes), dtype=np.float64, count=N)
+        pr /= pr.sum()
+    else:
+        pr = np.full(N, 1.0 / N)
+    residual = 0.0
+    it = 0
+    for it in range(1, max_iter + 1):
+        new_pr = np.bincount(dst, weights=pr[src] * p, minlength=N)
+        new_pr += pr[dangling].sum() / N
+        new_pr = damping * new_pr + (1 - damping) / N
 
-    pr = {n: 1 / N for n in nodes}
-    outdeg = {n: len(graph[n]) for n in nodes}
-
-    for _ in range(ITERATIONS):
-        new_pr = {}
-        for node in nodes:
-            score = (1 - DAMPING) / N
-            for src in nodes:
-                if node in graph[src] and outdeg[src] > 0:
-                    score += DAMPING * (pr[src] / outdeg[src])
-            new_pr[node] = score
+        residual = float(np.abs(new_pr - pr).sum())
         pr = new_pr
+        if residual < tol:
+            break
 
-    return pr
+    return nodes, pr, it, residual
+
+
+def compute_pagerank(graph, weighted=False, **kwargs):
+    nodes, pr, iterations, residual = pagerank_vector(graph, weighted=weighted, **kwargs)
+    print(f"PageRank: {len(nodes)} nodes, {iterations} iterations, L1 residual {residual:.3e}")
+    return {n: float(s) for n, s in zip(nodes, pr)}
+
+
+def load_pagerank(path=None):
+    path = path or os.path.join(DATA_DIR, "pagerank.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return {int(k): v for k, v in json.load(f).items()}
 
 
 def save_pagerank(pr, path=None):
@@ -41,6 +95,10 @@ def save_pagerank(pr, path=None):
 
 
 if __name__ == "__main__":
+    # python pagerank.py [--weighted] [--warm]
+    #   --weighted: use Jaccard scores as edge weights
+    #   --warm:     start from the previous pagerank.json (incremental updates)
     graph = load_graph()
-    pr = compute_pagerank(graph)
+    init = load_pagerank() if "--warm" in sys.argv else None
+    pr = compute_pagerank(graph, weighted="--weighted" in sys.argv, init=init)
     save_pagerank(pr)
@@ -0,0 +1,294 @@
+# backend/query.py
+#
+# Boolean and phrase queries over the binary index.
+#
+# Syntax (operators are case-sensitive, AND is implied between terms):
+#
+#   white whale            both terms
+#   white OR grey          either term
+#   whale NOT white        whale without white   (also: whale -white)
+#   "white whale"          phrase (adjacent tokens, via positions.bin)
+#   (white OR grey) whale  grouping
+#
+# Every sub-expression evaluates to a list of hits sorted by book_id, so
+# AND/NOT are galloping intersections/differences over sorted lists and OR
+# is a linear merge; no per-term dicts are built.
+
+import re
+from bisect import bisect_left
+from itertools import repeat
+from operator import itemgetter
+
+TOKEN_RE = re.compile(r'"[^"]*"?|[()]|[^\s()"]+')
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+OPERATORS = {"AND", "OR", "NOT"}
+
+# hit: (book_id, tf, first_offset or None, frozenset(matched terms), score)
+_bid = itemgetter(0)
+
+
+class QueryError(ValueError):
+    pass
+
+
+# ---------------------------------------------
+# AST
+# ---------------------------------------------
+class Term:
+    def __init__(self, word):
+        self.word = word
+
+
+class Phrase:
+    def __init__(self, words):
+        self.words = words      # [(word, position in the phrase), ...]
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+
+# ---------------------------------------------
+# Parser
+# ---------------------------------------------
+def normalize_query(q: str):
+    """Lowercase everything but the operators (used as the cache key)."""
+    return " ".join(t if t in OPERATORS else t.lower() for t in TOKEN_RE.findall(q))
+
+
+def _words_node(text, stopwords):
+    """Term or Phrase for a word / quoted string; stopwords keep their slot
+    in the phrase but are not looked up."""
+    words = [(w, i) for i, w in enumerate(WORD_RE.findall(text.lower()))
+             if w not in stopwords]
+    if not words:
+        return None
+    if len(words) == 1:
+        return Term(words[0][0])
+    return Phrase(words)
+
+
+def parse_query(q: str, stopwords=frozenset()):
+    """Parse a query string; returns None when nothing searchable is left."""
+    tokens = TOKEN_RE.findall(q)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def parse_or():
+        nonlocal pos
+        children = [parse_and()]
+        while peek() == "OR":
+            pos += 1
+            children.append(parse_and())
+        children = [c for c in children if c is not None]
+        if not children:
+            return None
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and():
+        nonlocal pos
+        children = []
+        while peek() not in (None, ")", "OR"):
+            if peek() == "AND":
+                pos += 1
+                continue
+            node = parse_unary()
+            if node is not None:
+                children.append(node)
+        if not children:
+            return None
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_unary():
+        nonlocal pos
+        tok = peek()
+        if tok == "NOT":
+            pos += 1
+            if peek() in (None, ")", "OR"):
+                raise QueryError("NOT needs an operand")
+            child = parse_unary()
+            return Not(child) if child is not None else None
+        if tok.startswith("-") and len(tok) > 1:
+            pos += 1
+            child = _words_node(tok[1:], stopwords)
+            return Not(child) if child is not None else None
+        if tok == "(":
+            pos += 1
+            node = parse_or()
+            if peek() != ")":
+                raise QueryError("missing closing parenthesis")
+            pos += 1
+            return node
+        pos += 1
+        if tok.startswith('"'):
+            return _words_node(tok.strip('"'), stopwords)
+        return _words_node(tok, stopwords)
+
+    node = parse_or()
+    if peek() is not None:
+        raise QueryError(f"unexpected {peek()!r}")
+    return node
+
+
+# ---------------------------------------------
+# Sorted-list operations
+# ---------------------------------------------
+def _gallop(hits, book_id, lo):
+    """First index >= lo whose book_id >= book_id (exponential search)."""
+    n = len(hits)
+    step = 1
+    hi = lo
+    while hi < n and hits[hi][0] < book_id:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    return bisect_left(hits, book_id, lo, min(hi, n), key=_bid)
+
+
+def _combine(a, b):
+    firsts = [f for f in (a[2], b[2]) if f is not None]
+    return (a[0], a[1] + b[1], min(firsts) if firsts else None, a[3] | b[3], a[4] + b[4])
+
+
+def intersect(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    out = []
+    j = 0
+    for hit in a:
+        j = _gallop(b, hit[0], j)
+        if j == len(b):
+            break
+        if b[j][0] == hit[0]:
+            out.append(_combine(hit, b[j]))
+            j += 1
+    return out
+
+
+def difference(a, b):
+    out = []
+    j = 0
+    for hit in a:
+        j = _gallop(b, hit[0], j)
+        if j == len(b) or b[j][0] != hit[0]:
+            out.append(hit)
+    return out
+
+
+def union(a, b):
+    out = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i][0] < b[j][0]:
+            out.append(a[i])
+            i += 1
+        elif a[i][0] > b[j][0]:
+            out.append(b[j])
+            j += 1
+        else:
+            out.append(_combine(a[i], b[j]))
+            i += 1
+            j += 1
+    out.extend(a[i:])
+    out.extend(b[j:])
+    return out
+
+
+# ---------------------------------------------
+# Evaluation
+# ---------------------------------------------
+class QueryEvaluator:
+    def __init__(self, index, all_book_ids):
+        self.index = index
+        self.universe = [(b, 0, None, frozenset(), 0.0) for b in sorted(all_book_ids)]
+
+    def term_hits(self, word, scorer=None):
+        """Hits for one term; `scorer` (a bm25.BM25) fills in the score."""
+        i = self.index.find(word)
+        if i < 0:
+            return []
+        terms = frozenset([word])
+        postings = self.index.postings_at(i, full=True)
+        scores = scorer.score(postings, self.index.df[i]) if scorer else repeat(0.0)
+        return [(p[0], p[1], p[2] if len(p) > 2 else None, terms, s)
+                for p, s in zip(postings, scores)]
+
+    def phrase_hits(self, words, scorer=None):
+        if not self.index.has_positions:
+            raise QueryError("phrase search needs positions.bin (rebuild the index)")
+
+        ids = [self.index.find(w) for w, _ in words]
+        if min(ids) < 0:
+            return []
+
+        # candidates: books containing every word, rarest word first
+        order = sorted(range(len(words)), key=lambda k: self.index.df[ids[k]])
+        hits = self.term_hits(words[order[0]][0])
+        for k in order[1:]:
+            hits = intersect(hits, self.term_hits(words[k][0]))
+            if not hits:
+                return []
+
+        book_ids = [h[0] for h in hits]
+        positions = [self.index.positions_at(i, book_ids) for i in ids]
+        anchor = words[0][1]
+
+        out = []
+        for hit in hits:
+            bid = hit[0]
+            others = [(set(positions[k][bid]), words[k][1] - anchor)
+                      for k in range(1, len(words))]
+            count = sum(
+                1 for p in positions[0][bid]
+                if all(p + gap in pset for pset, gap in others)
+            )
+            if count:
+                out.append((bid, count, hit[2], hit[3], 0.0))
+
+        if scorer and out:
+            # the phrase is scored like a single term occurring `count` times
+            scores = scorer.score(out, len(out))
+            out = [h[:4] + (s,) for h, s in zip(out, scores)]
+        return out
+
+    def evaluate(self, node, scorer=None):
+        if isinstance(node, Term):
+            return self.term_hits(node.word, scorer)
+        if isinstance(node, Phrase):
+            return self.phrase_hits(node.words, scorer)
+        if isinstance(node, Not):
+            return difference(self.universe, self.evaluate(node.child))
+        if isinstance(node, Or):
+            result = []
+            for child in node.children:
+                result = union(result, self.evaluate(child, scorer))
+            return result
+        if isinstance(node, And):
+            positive = [c for c in node.children if not isinstance(c, Not)]
+            negative = [c.child for c in node.children if isinstance(c, Not)]
+            if positive:
+                result = None
+                for child in positive:
+                    hits = self.evaluate(child, scorer)
+                    result = hits if result is None else intersect(result, hits)
+                    if not result:
+                        return []
+            else:
+                result = self.universe
+            for child in negative:
+                result = difference(result, self.evaluate(child))
+            return result
+        raise TypeError(node)
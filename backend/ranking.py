@@ -0,0 +1,71 @@
+# backend/ranking.py
+#
+# Partial top-k ranking for paginated search results.
+#
+# Instead of sorting every matching book to return one page, a RankedCursor
+# heapifies the scored candidates once (O(n)) and pops only as many as the
+# requested pages need (O(k log n)). Cursors are kept in a small LRU keyed by
+# the query, so fetching page N+1 reuses the scoring and the already-ranked
+# prefix of page N.
+
+import heapq
+import threading
+from collections import OrderedDict
+
+
+class RankedCursor:
+    def __init__(self, items, key, truncated=False):
+        """items: iterable of (id, info); key(info) -> rank value (higher first).
+
+        Ties keep the order of `items`, like a stable sort would. `truncated`
+        records that the candidates themselves were cut short (e.g. by the
+        regex budget).
+        """
+        self.truncated = truncated
+        self._heap = [(-key(info), seq, item_id, info)
+                      for seq, (item_id, info) in enumerate(items)]
+        heapq.heapify(self._heap)
+        self.total = len(self._heap)
+        self.ranked = []
+        self._lock = threading.Lock()
+
+    def top(self, n: int):
+        """The n best items, ranking only as far as needed."""
+        with self._lock:
+            while len(self.ranked) < n and self._heap:
+                _, _, item_id, info = heapq.heappop(self._heap)
+                self.ranked.append((item_id, info))
+        return self.ranked[:n]
+
+    def page(self, page: int, page_size: int):
+        if page < 1 or page_size < 1:
+            return []
+        start = (page - 1) * page_size
+        return self.top(start + page_size)[start:]
+
+
+class CursorCache:
+    """Thread-safe LRU of RankedCursors keyed by normalized query."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            cursor = self._items.get(key)
+            if cursor is not None:
+                self._items.move_to_end(key)
+            return cursor
+
+    def put(self, key, cursor):
+        with self._lock:
+            self._items[key] = cursor
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
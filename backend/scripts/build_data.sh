@@ -8,11 +8,19 @@ BOOKS_DIR="${DATA_DIR}/books"
 COVERS_DIR="${DATA_DIR}/covers"
 
 META="${DATA_DIR}/metadata.json"
-INDEX="${DATA_DIR}/index.json"
+INDEX="${DATA_DIR}/index.bin"
+INDEX_JSON="${DATA_DIR}/index.json"
 SIM="${DATA_DIR}/similarity.json"
 PR="${DATA_DIR}/pagerank.json"
 VERSION_FILE="${DATA_DIR}/.data_version"
 DATA_VERSION="${DATA_VERSION:-v1}"
+# COMPRESS_BOOKS=true: keep book texts block-compressed (bookstore.py)
+COMPRESS_BOOKS="${COMPRESS_BOOKS:-true}"
+export COMPRESS_BOOKS
+# INCREMENTAL=true: add new books (up to TARGET_COUNT) without a full rebuild
+INCREMENTAL="${INCREMENTAL:-false}"
+# compact index segments back into index.bin once there are more than this
+INDEX_MAX_SEGMENTS="${INDEX_MAX_SEGMENTS:-4}"
 
 mkdir -p "$DATA_DIR"
 
@@ -36,7 +44,14 @@ fi
 
 if [ "$should_rebuild" = "true" ]; then
   echo "Rebuilding dataset (FORCE_REBUILD=$FORCE_REBUILD, DATA_VERSION=$DATA_VERSION)..."
-  rm -f "$META" "$INDEX" "$SIM" "$PR"
+  rm -f "$META" "$INDEX" "$INDEX_JSON" "$SIM" "$PR"
+  rm -f "${DATA_DIR}"/metadata.bin "${DATA_DIR}"/similarity.bin "${DATA_DIR}"/pagerank.bin
+  rm -f "${DATA_DIR}"/snippets.bin "${DATA_DIR}"/pages.bin "${DATA_DIR}"/trigrams.bin \
+        "${DATA_DIR}"/positions.bin "${DATA_DIR}"/stopwords.json "${DATA_DIR}"/doclens.bin \
+        "${DATA_DIR}"/wordsets.bin "${DATA_DIR}"/snapshot.bin "${DATA_DIR}"/snapshot.pkl \
+        "${DATA_DIR}"/covers.json
+  rm -f "${DATA_DIR}"/download_journal.jsonl "${DATA_DIR}"/deleted.json
+  rm -rf "${DATA_DIR}"/segments
   rm -rf "$BOOKS_DIR" "$COVERS_DIR"
 fi
 
@@ -48,16 +63,40 @@ else
   echo "Books/metadata already present, skipping download."
 fi
 
+# Step 1a: compress books downloaded as plain text (older runs)
+if [ "$COMPRESS_BOOKS" = "true" ]; then
+  python bookstore.py --compress
+fi
+
+# Step 1b: incremental update of an existing build: fetch more books, index
+# only those into a new segment, compare only them for similarity, and
+# warm-start PageRank from the previous scores
+if [ "$INCREMENTAL" = "true" ] && [ "$should_rebuild" = "false" ] \
+   && [ -f "$INDEX" ] && [ -f "$SIM" ] && [ -f "$PR" ]; then
+  echo "Incremental update..."
+  python download_books.py
+  python indexing.py --add
+  python similarity.py --add
+  python pagerank.py --warm
+  # compaction happens here, off the API workers; they reload the result
+  python indexing.py --compact "$INDEX_MAX_SEGMENTS"
+fi
+
 # Step 2: build artifacts only if missing
+if [ ! -f "$INDEX" ] && [ -f "$INDEX_JSON" ]; then
+  echo "Converting legacy index.json to index.bin..."
+  python indexing.py --import-json
+fi
+
 if [ ! -f "$INDEX" ]; then
   echo "Building index..."
   python indexing.py
 else
-  echo "index.json exists, skipping."
+  echo "index.bin exists, skipping."
 fi
 
 if [ ! -f "$SIM" ]; then
-  echo "Building similarity graph..."
+  echo "Building similarity graph (${SIMILARITY_METHOD:-exact})..."
   python similarity.py
 else
   echo "similarity.json exists, skipping."
@@ -70,5 +109,17 @@ else
   echo "pagerank.json exists, skipping."
 fi
 
+# Step 2b: resized, content-hashed cover variants (only changed covers are redone)
+echo "Building cover variants..."
+python covers.py
+
+# Step 3: packed copies for ARTIFACT_MMAP=true (cheap, always refreshed)
+echo "Packing artifacts for mmap..."
+python packed.py
+
+# Step 4: prebuilt structures the API loads at startup instead of rebuilding
+echo "Writing load snapshot..."
+python snapshot.py
+
 echo "$DATA_VERSION" > "$VERSION_FILE"
 echo "Done."
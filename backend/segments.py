@@ -0,0 +1,245 @@
+# backend/segments.py
+#
+# Incremental index segments.
+#
+# A full build writes the main index into DATA_DIR. `indexing.py --add`
+# indexes only books missing from it into a small segment directory
+# (DATA_DIR/segments/seg_NNNNNN, same file layout as the main index), and
+# `indexing.py --remove` records tombstones in deleted.json. At query time a
+# SegmentedIndex presents the main index plus its segments as one BinaryIndex:
+#
+#   - term positions are positions in the merged (sorted) vocabulary: the
+#     main dictionary plus the few terms only segments contain;
+#   - postings are merged by book_id; a book indexed again in a later segment
+#     hides its older postings, and tombstoned books are dropped;
+#   - n_docs and df[j] count live books exactly (what BM25's idf needs), so
+#     ranking does not drift with the number of segments and tombstones.
+#
+# `indexing.py --compact` folds everything back into a single main index. It
+# runs in the data job (scripts/build_data.sh, once there are more than
+# INDEX_MAX_SEGMENTS), never in the API workers, which load the compacted
+# index as a new generation like any other data update.
+
+import json
+import heapq
+import os
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from operator import itemgetter
+from pathlib import Path
+
+from binindex import BinaryIndex
+
+SEGMENT_PREFIX = "seg_"
+# terms whose merged df is cached per SegmentedIndex
+DF_CACHE_SIZE = int(os.environ.get("SEGMENT_DF_CACHE", "65536"))
+_bid = itemgetter(0)
+
+
+def segments_dir(data_dir) -> Path:
+    return Path(data_dir) / "segments"
+
+
+def deleted_path(data_dir) -> Path:
+    return Path(data_dir) / "deleted.json"
+
+
+def list_segments(data_dir):
+    """Segment directories, oldest first."""
+    root = segments_dir(data_dir)
+    if not root.is_dir():
+        return []
+    return sorted(p for p in root.iterdir() if p.is_dir() and p.name.startswith(SEGMENT_PREFIX))
+
+
+def next_segment_name(data_dir) -> str:
+    existing = list_segments(data_dir)
+    n = int(existing[-1].name[len(SEGMENT_PREFIX):]) + 1 if existing else 1
+    return f"{SEGMENT_PREFIX}{n:06d}"
+
+
+def load_deleted(data_dir):
+    path = deleted_path(data_dir)
+    if not path.exists():
+        return set()
+    with path.open("r", encoding="utf-8") as f:
+        return set(json.load(f))
+
+
+def save_deleted(data_dir, book_ids):
+    path = deleted_path(data_dir)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(sorted(book_ids), f)
+    tmp.replace(path)
+
+
+class _MergedDf:
+    """df[j] of a SegmentedIndex: books holding the term net of shadowed and
+    tombstoned ones. Parts with no hidden book among theirs add their stored
+    df; the others have their postings counted (once per term, cached)."""
+
+    def __init__(self, index, cache_size=DF_CACHE_SIZE):
+        self.index = index
+        self._count = lru_cache(maxsize=cache_size)(self._count)
+
+    def _count(self, key: bytes) -> int:
+        total = 0
+        for part, i, hidden in self.index._locate(key, all_hidden=False):
+            if hidden:
+                total += sum(1 for p in part.postings_at(i) if p[0] not in hidden)
+            else:
+                total += part.df[i]
+        return total
+
+    def __getitem__(self, j):
+        return self._count(self.index.term_bytes(j))
+
+
+class SegmentedIndex:
+    def __init__(self, main: BinaryIndex, segments, segment_books, deleted=frozenset(),
+                 main_books=None):
+        """segments: BinaryIndex per segment, oldest first; segment_books:
+        the set of book_ids indexed in each of them; main_books: those of
+        the main index (None if unknown: its postings are then filtered
+        for every hidden book)."""
+        self.main = main
+        self.parts = [main, *segments]
+        self.width = main.width
+
+        # part k hides tombstoned books and books re-indexed in a later part
+        hidden = set(deleted)
+        self.hidden = [None] * len(self.parts)
+        for k in range(len(self.parts) - 1, -1, -1):
+            self.hidden[k] = frozenset(hidden)
+            if k > 0:
+                hidden |= segment_books[k - 1]
+        # ...of which the books the part actually holds (what df must subtract)
+        books = [main_books, *segment_books]
+        self.hidden_held = [h if b is None else h & b for h, b in zip(self.hidden, books)]
+
+        # terms only segments contain, and their merged positions
+        extra = set()
+        for seg in segments:
+            for i in range(len(seg)):
+                key = seg.term_bytes(i)
+                if main.find(key.decode("utf-8")) < 0:
+                    extra.add(key)
+        self.extra = sorted(extra)
+        self.extra_pos = array("Q", (main.lower_bound(key) + k for k, key in enumerate(self.extra)))
+
+        self.n_terms = main.n_terms + len(self.extra)
+        # exact unless main_books is unknown (then assume tombstones hit main)
+        in_main = len(self.hidden_held[0]) if main_books is not None else len(deleted)
+        self.n_docs = max(0, main.n_docs - in_main + sum(
+            len(b - h) for b, h in zip(segment_books, self.hidden[1:])))
+        self.df = _MergedDf(self)
+
+    # --- term dictionary ---------------------------------
+    def _split(self, j):
+        """("extra", k) or ("main", i) for merged position j."""
+        k = bisect_left(self.extra_pos, j)
+        if k < len(self.extra_pos) and self.extra_pos[k] == j:
+            return "extra", k
+        return "main", j - k
+
+    def term_bytes(self, j: int) -> bytes:
+        kind, i = self._split(j)
+        return self.extra[i] if kind == "extra" else self.main.term_bytes(i)
+
+    def term_at(self, j: int) -> str:
+        return self.term_bytes(j).decode("utf-8")
+
+    def lower_bound(self, key: bytes) -> int:
+        return self.main.lower_bound(key) + bisect_left(self.extra, key)
+
+    def find(self, term: str) -> int:
+        key = term.encode("utf-8")
+        j = self.lower_bound(key)
+        if j < self.n_terms and self.term_bytes(j) == key:
+            return j
+        return -1
+
+    def prefix_range(self, prefix: str):
+        key = prefix.encode("utf-8")
+        return self.lower_bound(key), self.lower_bound(key + b"\xff")
+
+    def from_main(self, i: int) -> int:
+        """Merged position of the main index's i-th term."""
+        return i + bisect_left(self.extra, self.main.term_bytes(i))
+
+    def extra_ids(self):
+        """Merged positions of the terms missing from the main index."""
+        return list(self.extra_pos)
+
+    def __contains__(self, term) -> bool:
+        return self.find(term) >= 0
+
+    def __len__(self):
+        return self.n_terms
+
+    def keys(self):
+        for j in range(self.n_terms):
+            yield self.term_at(j)
+
+    __iter__ = keys
+
+    # --- postings ----------------------------------------
+    def _locate(self, key: bytes, all_hidden=True):
+        """[(part, term position in part, hidden books)] holding `key`
+        (all_hidden=False: only the hidden books the part holds)."""
+        found = []
+        for part, hidden in zip(self.parts, self.hidden if all_hidden else self.hidden_held):
+            i = part.lower_bound(key)
+            if i < part.n_terms and part.term_bytes(i) == key:
+                found.append((part, i, hidden))
+        return found
+
+    @property
+    def has_offsets(self) -> bool:
+        return self.width >= 3
+
+    @property
+    def has_positions(self) -> bool:
+        return all(part.has_positions for part in self.parts)
+
+    def postings_at(self, j: int, full=False):
+        lists = [
+            [p for p in part.postings_at(i, full) if p[0] not in hidden]
+            for part, i, hidden in self._locate(self.term_bytes(j))
+        ]
+        if len(lists) == 1:
+            return lists[0]
+        return list(heapq.merge(*lists, key=_bid))
+
+    def postings(self, term: str, full=False):
+        j = self.find(term)
+        return self.postings_at(j, full) if j >= 0 else []
+
+    def positions_at(self, j: int, book_ids):
+        result = {}
+        for part, i, hidden in self._locate(self.term_bytes(j)):
+            wanted = [b for b in book_ids if b not in hidden]
+            if wanted:
+                result.update(part.positions_at(i, wanted))
+        return result
+
+    def position_chunks_at(self, j: int):
+        lists = [
+            [c for c in part.position_chunks_at(i) if c[0][0] not in hidden]
+            for part, i, hidden in self._locate(self.term_bytes(j))
+        ]
+        return list(heapq.merge(*lists, key=lambda c: c[0][0]))
+
+    def items(self):
+        for j in range(self.n_terms):
+            yield self.term_at(j), self.postings_at(j)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(part.nbytes for part in self.parts)
+
+    @property
+    def posting_bytes(self) -> int:
+        return sum(part.posting_bytes for part in self.parts)
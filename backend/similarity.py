@@ -1,10 +1,32 @@
 # backend/similarity.py
 
 import json
-from indexing import DATA_DIR, BOOKS_DIR, METADATA_PATH, tokenize
+import math
+import os
+import sys
+import zlib
+import numpy as np
+from indexing import DATA_DIR, BOOKS_DIR, METADATA_PATH, load_wordsets, tokenize
+from packed import write_graph
+from bookstore import open_book_text
 from tqdm import tqdm
 
 SIM_PATH = DATA_DIR / "similarity.json"
+SIM_BIN_PATH = DATA_DIR / "similarity.bin"     # rows presorted by score
+
+# "exact" (all pairs) or "minhash" (MinHash signatures + LSH banding)
+SIMILARITY_METHOD = os.environ.get("SIMILARITY_METHOD", "exact")
+# minimum signature length (the MinHash estimate kept with --no-verify); the
+# banding may need more, up to MAX_PERM
+NUM_PERM = 256
+MAX_PERM = int(os.environ.get("SIMILARITY_MAX_PERM", "512"))
+# prime just above 2^32: every crc32 is below it, and a, b range over [0, p)
+HASH_PRIME = (1 << 32) + 15
+# LSH bands are chosen so a pair at the threshold is a candidate this often
+LSH_RECALL = float(os.environ.get("SIMILARITY_LSH_RECALL", "0.95"))
+# with one row per band any shared min-hash makes a candidate, i.e. nearly
+# every pair at low thresholds
+LSH_MIN_ROWS = int(os.environ.get("SIMILARITY_LSH_MIN_ROWS", "2"))
 
 
 def load_metadata():
@@ -14,13 +36,21 @@ def load_metadata():
 
 def load_book_wordsets():
     meta = load_metadata()
+    # word sets the index build already extracted (wordsets.bin)
+    cached = load_wordsets()
     wordsets = {}
 
     for entry in meta:
         bid = entry["book_id"]
         fname = entry["filename"]
 
-        with (BOOKS_DIR / fname).open("r", encoding="utf-8", errors="ignore") as f:
+        words = cached.get(bid)
+        if words is not None:
+            wordsets[bid] = set(words.split("\n")) if words else set()
+            continue
+
+        # not indexed yet (or older data): tokenize the file
+        with open_book_text(BOOKS_DIR / fname) as f:
             wordsets[bid] = set(tokenize(f.read()))
 
     return wordsets
@@ -32,14 +62,187 @@ def jaccard(a, b):
     return len(a & b) / len(a | b)
 
 
-def build_similarity_graph(threshold=0.12):
-    print("Loading wordsets...")
-    ws = load_book_wordsets()
-    ids = list(ws.keys())
+# ---------------------------------------------
+# MinHash + LSH banding
+# ---------------------------------------------
+def _mulmod(a, x, p):
+    """(a * x) % p for uint64 arrays with a, x < 2^33: x is split in 16-bit
+    halves so no intermediate product overflows 64 bits."""
+    hi = (a * (x >> np.uint64(16))) % p
+    return ((hi << np.uint64(16)) + a * (x & np.uint64(0xFFFF))) % p
+
+
+def minhash_signatures(wordsets, ids, num_perm=NUM_PERM, seed=1):
+    """(len(ids), num_perm) matrix of MinHash values over each word set,
+    one universal hash h(x) = (a*x + b) mod p per permutation."""
+    rng = np.random.default_rng(seed)
+    p = np.uint64(HASH_PRIME)
+    a = rng.integers(1, HASH_PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, HASH_PRIME, size=num_perm, dtype=np.uint64)
+
+    sigs = np.full((len(ids), num_perm), HASH_PRIME, dtype=np.uint64)
+    for row, bid in enumerate(tqdm(ids)):
+        words = wordsets[bid]
+        if not words:
+            continue
+        hv = np.fromiter(
+            (zlib.crc32(w.encode("utf-8")) for w in words),
+            dtype=np.uint64, count=len(words),
+        )
+        # chunked so the (terms x num_perm) temporary stays small
+        for start in range(0, len(hv), 4096):
+            chunk = hv[start:start + 4096, None]
+            h = (_mulmod(a, chunk, p) + b) % p
+            np.minimum(sigs[row], h.min(axis=0), out=sigs[row])
+    return sigs
+
+
+def candidate_probability(jaccard_value, bands, rows):
+    """Chance that a pair with this Jaccard shares at least one band."""
+    return 1 - (1 - jaccard_value ** rows) ** bands
+
+
+def choose_bands(threshold, recall=LSH_RECALL, max_perm=MAX_PERM, min_rows=LSH_MIN_ROWS):
+    """(bands, rows), at least min_rows rows and bands * rows <= max_perm:
+    the most rows per band (fewest false candidates) that still makes a
+    pair at `threshold` a candidate with probability >= recall, with as few
+    bands as that needs. The signature length follows from it: low
+    thresholds need many bands. When max_perm cannot reach the recall, the
+    most bands of min_rows rows are used and the recall is lower (see
+    candidate_probability; _minhash_edges reports it)."""
+    best = None
+    for rows in range(max(1, min_rows), max_perm + 1):
+        p = min(threshold, 1.0) ** rows
+        if p >= 1:
+            needed = 1
+        elif p > 0:
+            needed = math.log(1 - min(recall, 1 - 1e-12)) / math.log1p(-p)
+        else:
+            break
+        if needed * rows <= max_perm and math.ceil(needed) * rows <= max_perm:
+            best = (math.ceil(needed), rows)
+    if best is None:
+        rows = max(1, min(min_rows, max_perm))
+        best = (max_perm // rows, rows)
+    return best
+
+
+def _band_keys(sigs, bands, rows):
+    """(bands, n) array: one uint64 key per row and band. Keys mix the
+    band's min-hashes with odd multipliers (wrapping mod 2^64); a collision
+    only adds a candidate, which is then verified or estimated."""
+    mult = np.random.default_rng(0).integers(1, 1 << 62, size=rows, dtype=np.uint64)
+    mult |= np.uint64(1)
+    keys = np.empty((bands, len(sigs)), dtype=np.uint64)
+    for band in range(bands):
+        block = sigs[:, band * rows:(band + 1) * rows]
+        keys[band] = (block * mult).sum(axis=1, dtype=np.uint64)
+    return keys
 
-    graph = {bid: {} for bid in ids}
 
-    print("Computing similarities...")
+def lsh_candidates(sigs, bands, rows, probe=None):
+    """Yield index pairs (i, j) sharing at least one band bucket, each once.
+
+    Every band is bucketed once (rows sorted by key); each probed row then
+    gathers its bucket mates over the bands and dedupes them itself, so no
+    global pair set is built and memory stays linear in the number of rows.
+    With `probe` (row indices, e.g. the new books of an incremental build)
+    only pairs involving one of those rows are listed."""
+    n = len(sigs)
+    keys = _band_keys(sigs, bands, rows)
+    orders = np.empty((bands, n), dtype=np.int32)
+    # [first, end) of each row's bucket within orders[band]
+    first = np.empty((bands, n), dtype=np.int32)
+    end = np.empty((bands, n), dtype=np.int32)
+    for band in range(bands):
+        order = np.argsort(keys[band], kind="stable")
+        ordered = keys[band][order]
+        starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        sizes = np.diff(np.r_[starts, n])
+        orders[band] = order
+        first[band, order] = np.repeat(starts, sizes)
+        end[band, order] = np.repeat(starts + sizes, sizes)
+    del keys
+
+    if probe is None:
+        probe = range(n)
+        probed = np.ones(n, dtype=bool)
+    else:
+        probe = sorted(probe)
+        probed = np.zeros(n, dtype=bool)
+        probed[probe] = True
+
+    for i in probe:
+        shared = np.flatnonzero(end[:, i] - first[:, i] > 1)
+        if not len(shared):
+            continue
+        mates = np.unique(np.concatenate(
+            [orders[band, first[band, i]:end[band, i]] for band in shared]
+        ))
+        # a pair of two probed rows is listed from the lower one
+        for j in mates[(mates > i) | ~probed[mates]]:
+            yield i, int(j)
+
+
+def _lsh_params(threshold, num_perm, bands):
+    """(num_perm, bands, rows) for a build; derived from the threshold
+    unless given."""
+    if bands:
+        num_perm = num_perm or NUM_PERM
+        return num_perm, bands, max(1, num_perm // bands)
+    bands, rows = choose_bands(threshold, max_perm=num_perm or MAX_PERM)
+    return max(num_perm or NUM_PERM, bands * rows), bands, rows
+
+
+def _minhash_edges(ws, ids, threshold, num_perm=None, bands=None, verify=True, only=None):
+    """Edges among `ids` at or above `threshold`; with `only`, just the
+    edges involving one of those ids (the rest of the books are bucketed
+    but not probed)."""
+    # an empty word set has no edges (its signature would match every other
+    # empty set's in every band)
+    ids = [bid for bid in ids if ws[bid]]
+    num_perm, bands, rows = _lsh_params(threshold, num_perm, bands)
+
+    print(f"Computing MinHash signatures ({num_perm} permutations)...")
+    sigs = minhash_signatures(ws, ids, num_perm)
+
+    probe = None
+    if only is not None:
+        probe = [row for row, bid in enumerate(ids) if bid in only]
+    recall = candidate_probability(threshold, bands, rows)
+    print(f"LSH: {bands} bands x {rows} rows, {recall:.1%} recall at {threshold}"
+          + (f" (below the {LSH_RECALL:.0%} target)" if recall < LSH_RECALL else ""))
+
+    compared = 0
+    for i, j in lsh_candidates(sigs, bands, rows, probe):
+        compared += 1
+        if verify:
+            sim = jaccard(ws[ids[i]], ws[ids[j]])
+        else:
+            sim = float(np.count_nonzero(sigs[i] == sigs[j])) / num_perm
+        if sim >= threshold:
+            yield ids[i], ids[j], sim
+
+    n = len(ids)
+    total = n * (n - 1) // 2 if probe is None else len(probe) * (n - 1)
+    print(f"LSH: compared {compared} candidate pairs "
+          f"({compared / total if total else 0:.1%} of all pairs)")
+
+
+def _exact_edges(ws, ids, threshold, only=None):
+    """All pairs, or with `only` just the pairs involving one of those ids."""
+    if only is not None:
+        done = set()
+        for A in tqdm([bid for bid in ids if bid in only]):
+            done.add(A)
+            for B in ids:
+                if B in done:
+                    continue
+                sim = jaccard(ws[A], ws[B])
+                if sim >= threshold:
+                    yield A, B, sim
+        return
+
     for i in tqdm(range(len(ids))):
         A = ids[i]
         for j in range(i + 1, len(ids)):
@@ -47,16 +250,117 @@ def build_similarity_graph(threshold=0.12):
 
             sim = jaccard(ws[A], ws[B])
             if sim >= threshold:
-                graph[A][B] = sim
-                graph[B][A] = sim
+                yield A, B, sim
 
-    print("Saving:", SIM_PATH)
-    with SIM_PATH.open("w", encoding="utf-8") as f:
-        json.dump(graph, f, indent=2)
 
+def check_minhash(threshold=0.12, num_perm=None, bands=None, sample=2000, seed=1):
+    """Compare the MinHash build with the exact one on the current books:
+    recall of the exact edges, the share of all pairs LSH compared, and the
+    mean absolute error of the MinHash Jaccard estimate over sampled pairs."""
+    import random
+
+    ws = load_book_wordsets()
+    ids = list(ws.keys())
+    exact = {frozenset((a, b)) for a, b, _ in _exact_edges(ws, ids, threshold)}
+    found = {frozenset((a, b))
+             for a, b, _ in _minhash_edges(ws, ids, threshold, num_perm, bands, verify=True)}
+
+    num_perm, bands, rows = _lsh_params(threshold, num_perm, bands)
+    signed = [bid for bid in ids if ws[bid]]
+    sigs = minhash_signatures(ws, signed, num_perm)
+    rng = random.Random(seed)
+    n = len(signed)
+    pairs = [tuple(rng.sample(range(n), 2)) for _ in range(sample)] if n > 1 else []
+    errors = [
+        abs(float(np.count_nonzero(sigs[i] == sigs[j])) / num_perm
+            - jaccard(ws[signed[i]], ws[signed[j]]))
+        for i, j in pairs
+    ]
+    candidates = sum(1 for _ in lsh_candidates(sigs, bands, rows))
+    return {
+        "num_perm": num_perm,
+        "bands": bands,
+        "rows": rows,
+        "exact_edges": len(exact),
+        "minhash_edges": len(found),
+        "recall": len(exact & found) / len(exact) if exact else 1.0,
+        "candidate_fraction": candidates / (n * (n - 1) // 2) if n > 1 else 0.0,
+        "estimate_mae": sum(errors) / len(errors) if errors else 0.0,
+    }
+
+
+def build_similarity_graph(threshold=0.12, method=SIMILARITY_METHOD,
+                           num_perm=None, bands=None, verify=True):
+    """method="minhash" only compares LSH candidate pairs; with verify=True
+    their exact Jaccard is computed, otherwise the MinHash estimate is kept.
+    More bands (fewer rows each) trades build time for recall near the
+    threshold; by default they and the signature length are derived from
+    `threshold` (see choose_bands)."""
+    print("Loading wordsets...")
+    ws = load_book_wordsets()
+    ids = list(ws.keys())
+
+    graph = {bid: {} for bid in ids}
+
+    print(f"Computing similarities ({method})...")
+    if method == "minhash":
+        edges = _minhash_edges(ws, ids, threshold, num_perm, bands, verify)
+    else:
+        edges = _exact_edges(ws, ids, threshold)
+
+    for A, B, sim in edges:
+        graph[A][B] = sim
+        graph[B][A] = sim
+
+    save_similarity_graph(graph)
     return graph
 
 
+def update_similarity_graph(threshold=0.12, method=SIMILARITY_METHOD,
+                            num_perm=None, bands=None, verify=True):
+    """Bring similarity.json in line with metadata.json: books that left
+    it are dropped, and only pairs involving a new book are compared."""
+    graph = load_similarity_graph()
+
+    print("Loading wordsets...")
+    ws = load_book_wordsets()
+    ids = list(ws.keys())
+
+    removed = graph.keys() - ws.keys()
+    new = ws.keys() - graph.keys()
+    for bid in removed:
+        del graph[bid]
+    for nbrs in graph.values():
+        for bid in removed & nbrs.keys():
+            del nbrs[bid]
+    for bid in new:
+        graph[bid] = {}
+    print(f"{len(new)} new books, {len(removed)} removed")
+
+    if new:
+        print(f"Computing similarities for new books ({method})...")
+        if method == "minhash":
+            edges = _minhash_edges(ws, ids, threshold, num_perm, bands, verify, only=new)
+        else:
+            edges = _exact_edges(ws, ids, threshold, only=new)
+        for A, B, sim in edges:
+            graph[A][B] = sim
+            graph[B][A] = sim
+
+    save_similarity_graph(graph)
+    return graph
+
+
+def save_similarity_graph(graph):
+    print("Saving:", SIM_PATH)
+    tmp = SIM_PATH.with_name(SIM_PATH.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(graph, f, indent=2)
+    tmp.replace(SIM_PATH)
+    # compact copy the API serves from: each neighbour list sorted by score
+    write_graph(graph, SIM_BIN_PATH)
+
+
 def load_similarity_graph():
     with SIM_PATH.open("r", encoding="utf-8") as f:
         raw = json.load(f)
@@ -64,4 +368,14 @@ def load_similarity_graph():
 
 
 if __name__ == "__main__":
-    build_similarity_graph()
+    # python similarity.py [--minhash] [--no-verify] [--add]
+    # --add: only compare books added to metadata.json since the last build
+    # python similarity.py --check-minhash   MinHash recall vs the exact build
+    if "--check-minhash" in sys.argv:
+        print(json.dumps(check_minhash(), indent=2))
+        sys.exit(0)
+    build = update_similarity_graph if "--add" in sys.argv else build_similarity_graph
+    build(
+        method="minhash" if "--minhash" in sys.argv else SIMILARITY_METHOD,
+        verify="--no-verify" not in sys.argv,
+    )
@@ -0,0 +1,156 @@
+# backend/snapshot.py
+#
+# Prebuilt load snapshot of a generation's derived structures.
+#
+# Most of a cold start is spent rebuilding the same in-memory structures from
+# the artifacts: the title n-gram index (one pass over every title and
+# author), the parsed metadata / PageRank JSON and the similarity graph with
+# each row sorted by score. scripts/build_data.sh runs `python snapshot.py`
+# after packing, which writes them into DATA_DIR/snapshot.bin; a Generation
+# then loads them instead of rebuilding.
+#
+# The file sits on the shared data volume, so it holds only data: a header
+# (magic, format, JSON table of contents) followed by sections that are JSON
+# or little-endian arrays, never anything executable. The contents list each
+# section's offset, length and sha256, checked before it is decoded. The
+# structures every mode uses come first, then the parsed JSON artifacts (read
+# only when ARTIFACT_MMAP is off, so mmap workers never materialise the
+# metadata). The header also records the size and mtime of every source
+# file; a snapshot that no longer matches them (a hand-run indexing.py
+# --remove, a partial rebuild) is ignored and the generation is built from
+# the artifacts as before.
+
+import hashlib
+import json
+import struct
+from array import array
+
+from binindex import to_le, typed_view
+from indexing import (
+    DATA_DIR, METADATA_PATH, METADATA_BIN_PATH, DOCLENS_PATH, load_doc_lengths,
+)
+from packed import PackedGraph
+from segments import deleted_path, list_segments
+from similarity import SIM_PATH, load_similarity_graph
+from titleindex import TitleIndex
+
+SNAPSHOT_PATH = DATA_DIR / "snapshot.bin"
+# written by older releases (pickles); removed by write_snapshot
+LEGACY_SNAPSHOT_PATH = DATA_DIR / "snapshot.pkl"
+PAGERANK_PATH = DATA_DIR / "pagerank.json"
+# bump when the sections change shape
+SNAPSHOT_FORMAT = 2
+
+MAGIC = b"BSNP"
+# magic, format, length of the JSON contents that follow
+HEADER = struct.Struct("<4sIQ")
+# sections every mode loads; the rest are skipped with ARTIFACT_MMAP
+COMMON = ("title_index", "doc_lengths")
+
+
+def _sources():
+    """file name -> (size, mtime_ns) of everything the snapshot is built from
+    (None for files that do not exist)."""
+    paths = [METADATA_PATH, METADATA_BIN_PATH, PAGERANK_PATH, SIM_PATH, DOCLENS_PATH,
+             deleted_path(DATA_DIR)]
+    paths += [seg / DOCLENS_PATH.name for seg in list_segments(DATA_DIR)]
+    signature = {}
+    for path in paths:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            signature[str(path.relative_to(DATA_DIR))] = None
+        else:
+            signature[str(path.relative_to(DATA_DIR))] = [st.st_size, st.st_mtime_ns]
+    return signature
+
+
+def _json_bytes(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def write_snapshot(path=SNAPSHOT_PATH):
+    sources = _sources()
+    with METADATA_PATH.open("r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    meta_by_id = {m["book_id"]: m for m in metadata}
+    with PAGERANK_PATH.open("rb") as f:
+        pagerank = f.read()
+    similarity = PackedGraph.from_graph(load_similarity_graph())
+    lengths = load_doc_lengths()
+
+    sections = {
+        "title_index": TitleIndex(meta_by_id).to_bytes(),
+        "doc_lengths": to_le(array("q", lengths)) + to_le(array("q", lengths.values())),
+        "metadata": _json_bytes(metadata),
+        "pagerank": pagerank,
+        "similarity": bytes(similarity.buf),
+    }
+    contents, off = {}, 0
+    for name, data in sections.items():
+        contents[name] = [off, len(data), hashlib.sha256(data).hexdigest()]
+        off += len(data) + (-len(data) % 8)
+    toc = _json_bytes({"format": SNAPSHOT_FORMAT, "sources": sources, "sections": contents})
+    toc += b" " * (-(HEADER.size + len(toc)) % 8)
+
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(HEADER.pack(MAGIC, SNAPSHOT_FORMAT, len(toc)))
+        f.write(toc)
+        for data in sections.values():
+            f.write(data)
+            f.write(b"\0" * (-len(data) % 8))
+    tmp.replace(path)
+    LEGACY_SNAPSHOT_PATH.unlink(missing_ok=True)
+
+
+def _read_sections(f, contents, names):
+    """name -> verified bytes of the sections in `names`."""
+    base = f.tell()
+    found = {}
+    for name in names:
+        off, length, digest = contents[name]
+        f.seek(base + off)
+        data = f.read(length)
+        if len(data) != length or hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"section {name} is damaged")
+        found[name] = data
+    return found
+
+
+def load_snapshot(use_mmap=False, path=SNAPSHOT_PATH):
+    """The snapshot's structures as a dict, or None when there is no
+    snapshot or it is stale. mmap mode skips the parsed JSON artifacts."""
+    if not path.exists():
+        return None
+    try:
+        with path.open("rb") as f:
+            magic, fmt, toc_len = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or fmt != SNAPSHOT_FORMAT:
+                return None
+            toc = json.loads(f.read(toc_len))
+            if toc.get("sources") != _sources():
+                return None
+            names = COMMON if use_mmap else list(toc["sections"])
+            sections = _read_sections(f, toc["sections"], names)
+
+        n = len(sections["doc_lengths"]) // 16
+        ids = typed_view(sections["doc_lengths"], 0, "q", n)
+        lengths = typed_view(sections["doc_lengths"], 8 * n, "q", n)
+        snap = {
+            "title_index": TitleIndex.from_bytes(sections["title_index"]),
+            "doc_lengths": dict(zip(ids, lengths)),
+        }
+        if not use_mmap:
+            snap["meta_by_id"] = {m["book_id"]: m for m in json.loads(sections["metadata"])}
+            snap["pagerank_scores"] = json.loads(sections["pagerank"])
+            snap["similarity_graph"] = PackedGraph("<memory>", buf=sections["similarity"])
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print(f"Ignoring unreadable {path.name}: {e!r}")
+        return None
+    return snap
+
+
+if __name__ == "__main__":
+    write_snapshot()
+    print("Wrote", SNAPSHOT_PATH)
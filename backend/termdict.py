@@ -0,0 +1,168 @@
+# backend/termdict.py
+#
+# Regex matching over the index vocabulary without scanning every term.
+#
+# Candidates come from two structures:
+#   - the sorted term dictionary of index.bin: a pattern anchored with "^"
+#     and a literal prefix only needs the contiguous range of terms sharing
+#     that prefix;
+#   - trigrams.bin, a trigram -> term ids index (stored in the binindex
+#     format, "book ids" being term positions): every literal the pattern
+#     requires must appear in a candidate, so its trigrams' lists are
+#     intersected.
+# Only the candidates are run through the regex, under a term/time budget so
+# a pathological pattern cannot pin a worker.
+
+import os
+from collections import defaultdict
+from time import perf_counter
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from binindex import BinaryIndex, IndexWriter
+
+REGEX_MAX_TERMS = int(os.environ.get("REGEX_MAX_TERMS", "200000"))
+REGEX_TIME_BUDGET_MS = float(os.environ.get("REGEX_TIME_BUDGET_MS", "250"))
+
+LITERAL = sre_constants.LITERAL
+SUBPATTERN = sre_constants.SUBPATTERN
+MAX_REPEAT = sre_constants.MAX_REPEAT
+MIN_REPEAT = sre_constants.MIN_REPEAT
+AT = sre_constants.AT
+AT_BEGINNING = sre_constants.AT_BEGINNING
+AT_BEGINNING_STRING = sre_constants.AT_BEGINNING_STRING
+
+
+# ---------------------------------------------
+# Trigram index (built once per index build)
+# ---------------------------------------------
+def trigrams(term: str):
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def build_trigram_index(index: BinaryIndex, path):
+    grams = defaultdict(list)  # trigram -> [term position, ...] (ascending)
+    for i in range(len(index)):
+        for g in trigrams(index.term_at(i)):
+            grams[g].append((i,))
+
+    with IndexWriter(path, width=1) as w:
+        for g in sorted(grams, key=lambda t: t.encode("utf-8")):
+            w.add(g, grams[g])
+
+
+# ---------------------------------------------
+# Regex analysis
+# ---------------------------------------------
+def required_literals(pattern: str, flags=0):
+    """(prefix, literals) for a pattern.
+
+    `prefix` is a literal every match must start with when the pattern is
+    anchored at the beginning ("" otherwise); `literals` are substrings every
+    match must contain. Both are conservative: anything that is not plainly
+    required (alternation, optional parts, classes, lookarounds) is skipped.
+    """
+    literals = []
+
+    def walk(items):
+        run = []
+        for op, av in items:
+            if op is LITERAL:
+                run.append(chr(av))
+                continue
+            if run:
+                literals.append("".join(run))
+                run = []
+            if op is SUBPATTERN:
+                walk(av[-1])
+            elif op in (MAX_REPEAT, MIN_REPEAT) and av[0] >= 1:
+                walk(av[2])
+        if run:
+            literals.append("".join(run))
+
+    parsed = sre_parse.parse(pattern, flags)
+    items = list(parsed)
+    walk(items)
+
+    prefix = []
+    if items and items[0] in ((AT, AT_BEGINNING), (AT, AT_BEGINNING_STRING)):
+        for op, av in items[1:]:
+            if op is not LITERAL:
+                break
+            prefix.append(chr(av))
+    return "".join(prefix), literals
+
+
+# ---------------------------------------------
+# Matcher
+# ---------------------------------------------
+class TermMatcher:
+    def __init__(self, index: BinaryIndex, trigram_index: BinaryIndex = None):
+        self.index = index
+        self.trigram_index = trigram_index
+
+    def candidates(self, pattern_str: str, flags=0):
+        """Term positions worth testing (ascending), or None for "all"."""
+        prefix, literals = required_literals(pattern_str, flags)
+
+        cands = None
+        if prefix:
+            lo, hi = self.index.prefix_range(prefix)
+            cands = range(lo, hi)
+
+        if self.trigram_index is not None and (cands is None or len(cands) > 256):
+            # rarest trigrams first; once few candidates remain the regex
+            # itself is cheaper than decoding more posting lists
+            grams = {g for lit in literals for g in trigrams(lit)}
+            found = sorted(
+                (self.trigram_index.df[i], i)
+                for i in map(self.trigram_index.find, grams)
+                if i >= 0
+            )
+            ids = None
+            if len(found) < len(grams):
+                ids = set()  # some required trigram occurs in no term
+            else:
+                for _, i in found:
+                    grams_ids = {p[0] for p in self.trigram_index.postings_at(i, full=True)}
+                    ids = grams_ids if ids is None else ids & grams_ids
+                    if len(ids) <= 256:
+                        break
+
+            if ids is not None:
+                ids = self._from_trigram_space(ids)
+                cands = ids if cands is None else ids.intersection(cands)
+
+        return None if cands is None else sorted(cands)
+
+    def _from_trigram_space(self, ids):
+        """trigrams.bin covers the main index only: map its term positions
+        into a SegmentedIndex's merged vocabulary, plus every segment-only
+        term (few, and not prefiltered)."""
+        if not hasattr(self.index, "from_main"):
+            return ids
+        return {self.index.from_main(i) for i in ids} | set(self.index.extra_ids())
+
+    def match(self, pattern, max_terms=REGEX_MAX_TERMS, time_budget_ms=REGEX_TIME_BUDGET_MS):
+        """([term positions matching `pattern`], truncated).
+
+        `truncated` is True when the term or time budget ran out before all
+        candidates were tested.
+        """
+        cands = self.candidates(pattern.pattern, pattern.flags)
+        if cands is None:
+            cands = range(len(self.index))
+
+        deadline = perf_counter() + time_budget_ms / 1000
+        matched = []
+        for n, i in enumerate(cands):
+            if n >= max_terms or (n % 1024 == 0 and perf_counter() > deadline):
+                return matched, True
+            if pattern.search(self.index.term_at(i)):
+                matched.append(i)
+        return matched, False
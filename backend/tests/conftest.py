@@ -0,0 +1,80 @@
+# backend/tests/conftest.py
+#
+# The backend modules are flat (run from backend/) and read DATA_DIR when
+# imported, so both are set up here before any test module imports them.
+
+import json
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# never the real data: tests that build an index move indexing's paths into
+# their own tmp_path (see `data_dir`)
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="booksearch-tests-")
+os.makedirs(os.path.join(os.environ["DATA_DIR"], "covers"), exist_ok=True)
+os.environ["RELOAD_POLL_SECS"] = "0"
+os.environ["METRICS_DIR"] = os.path.join(os.environ["DATA_DIR"], "metrics")
+
+TEST_STOPWORDS = ["the", "and", "of", "a"]
+VOCABULARY = [
+    "white", "whale", "grey", "sea", "ship", "captain", "harpoon", "storm",
+    "island", "sailor", "ocean", "wind", "voyage", "deck", "mast", "rope",
+]
+
+
+def book_text(book_id: int) -> str:
+    """A few deterministic lines over a vocabulary of its own, so books
+    differ in which terms (and phrases) they contain."""
+    rng = random.Random(book_id)
+    words = rng.sample(VOCABULARY, 6) + TEST_STOPWORDS
+    lines = []
+    for _ in range(8):
+        line = rng.choices(words, k=rng.randint(4, 10))
+        if rng.random() < 0.1:
+            i = rng.randrange(len(line))
+            line[i:i] = ["white", "whale"]
+        lines.append(" ".join(line).capitalize() + ".")
+    return f"Book {book_id}\n\n" + "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """An empty DATA_DIR under tmp_path, with every indexing.py path moved
+    into it and a stopwords.json for English (so no NLTK lookup)."""
+    import indexing
+
+    old = indexing.DATA_DIR
+    for name, value in list(vars(indexing).items()):
+        if isinstance(value, Path) and value.is_relative_to(old):
+            monkeypatch.setattr(indexing, name, tmp_path / value.relative_to(old))
+    monkeypatch.setattr(indexing, "STOPWORDS", set())
+
+    (tmp_path / "books").mkdir()
+    with (tmp_path / "stopwords.json").open("w", encoding="utf-8") as f:
+        json.dump({"languages": ["en"], "words": TEST_STOPWORDS}, f)
+    return tmp_path
+
+
+@pytest.fixture
+def add_books(data_dir):
+    """add_books(ids): write the books' files and append them to metadata.json."""
+    path = data_dir / "metadata.json"
+
+    def add(book_ids):
+        metadata = json.loads(path.read_text(encoding="utf-8")) if path.exists() else []
+        for bid in book_ids:
+            fname = f"book_{bid}.txt"
+            (data_dir / "books" / fname).write_text(book_text(bid), encoding="utf-8")
+            metadata.append({"book_id": bid, "title": f"Book {bid}", "filename": fname,
+                             "languages": ["en"], "authors": [f"Author {bid}"]})
+        path.write_text(json.dumps(metadata), encoding="utf-8")
+        return metadata
+
+    return add
@@ -0,0 +1,118 @@
+# backend/tests/test_binindex.py
+
+import pytest
+
+from binindex import (
+    BinaryIndex, IndexWriter, decode_deltas, decode_postings, decode_varint,
+    encode_deltas, encode_postings, encode_varint, export_json, import_json,
+    merge_runs, read_run, write_index, write_run,
+)
+
+# term -> [(book_id, [token positions])], sorted by book_id
+DOCS = {
+    "whale": [(1, [0, 5, 9]), (4, [2]), (300, [1, 128, 40000])],
+    "white": [(1, [4]), (300, [0, 127])],
+    "wind": [(2, [7])],
+    "école": [(4, [3])],
+    "ö": [(70000, [0])],
+}
+
+
+def write_positional(path, docs=DOCS):
+    pos_path = path.with_name("positions.bin")
+    with IndexWriter(path, width=4, positions_path=pos_path) as w:
+        for term in sorted(docs, key=lambda t: t.encode("utf-8")):
+            chunks = [encode_deltas(plist) for _, plist in docs[term]]
+            postings = [(bid, len(plist), 10 * bid, len(c))
+                        for (bid, plist), c in zip(docs[term], chunks)]
+            w.add(term, postings, b"".join(chunks))
+    return pos_path
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 2**32 - 1, 2**63])
+def test_varint_round_trip(value):
+    out = bytearray()
+    encode_varint(value, out)
+    assert decode_varint(out, 0) == (value, len(out))
+
+
+def test_postings_and_deltas_round_trip():
+    postings = [(3, 1, 0), (10, 4, 77), (2**31, 2, 5)]
+    buf = encode_postings(postings)
+    assert decode_postings(buf, 0, len(postings), width=3) == (postings, len(buf))
+
+    values = [0, 1, 1, 200, 70000]
+    buf = encode_deltas(values)
+    assert decode_deltas(buf, 0, len(buf)) == values
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_index_round_trip(tmp_path, use_mmap):
+    path = tmp_path / "index.bin"
+    pos_path = write_positional(path)
+    index = BinaryIndex(path, use_mmap=use_mmap, positions_path=pos_path)
+
+    assert list(index.keys()) == sorted(DOCS, key=lambda t: t.encode("utf-8"))
+    assert index.n_docs == 5
+    assert index.has_offsets and index.has_positions
+    for term, docs in DOCS.items():
+        i = index.find(term)
+        assert index.term_at(i) == term
+        assert index.df[i] == len(docs)
+        assert index.postings(term) == [(bid, len(plist)) for bid, plist in docs]
+        assert [p[2] for p in index.postings_at(i, full=True)] == [10 * bid for bid, _ in docs]
+        assert index.positions_at(i, [bid for bid, _ in docs]) == dict(docs)
+
+    assert index.find("whal") == -1 and "zebra" not in index
+    lo, hi = index.prefix_range("wh")
+    assert [index.term_at(i) for i in range(lo, hi)] == ["whale", "white"]
+
+
+def test_writer_rejects_unsorted_terms(tmp_path):
+    with pytest.raises(ValueError):
+        with IndexWriter(tmp_path / "index.bin") as w:
+            w.add("whale", [(1, 1)])
+            w.add("sea", [(1, 1)])
+    # nothing half-written is left behind
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_json_round_trip(tmp_path):
+    inverted = {"whale": {"1": 3, "4": 1}, "white": {"300": 2}, "école": {"4": 1}}
+    write_index(inverted, tmp_path / "index.bin")
+    export_json(BinaryIndex(tmp_path / "index.bin"), tmp_path / "index.json")
+    import_json(tmp_path / "index.json", tmp_path / "again.bin")
+
+    assert (tmp_path / "again.bin").read_bytes() == (tmp_path / "index.bin").read_bytes()
+    assert dict(BinaryIndex(tmp_path / "again.bin").items()) == {
+        t: sorted((int(b), tf) for b, tf in ps.items()) for t, ps in inverted.items()
+    }
+
+
+def test_merged_runs_match_a_single_write(tmp_path):
+    # the same documents split across two runs, books interleaved
+    split = [{}, {}]
+    for term, docs in DOCS.items():
+        for k, (bid, plist) in enumerate(docs):
+            split[k % 2].setdefault(term, []).append((bid, plist))
+
+    runs = []
+    for n, docs in enumerate(split):
+        run = tmp_path / f"run_{n}.run"
+        write_run(run, (
+            (term.encode("utf-8"),
+             [(bid, len(pl), 10 * bid, len(encode_deltas(pl))) for bid, pl in docs[term]],
+             b"".join(encode_deltas(pl) for _, pl in docs[term]))
+            for term in sorted(docs, key=lambda t: t.encode("utf-8"))
+        ))
+        runs.append(run)
+    assert sum(1 for _ in read_run(runs[0], width=4)) == len(split[0])
+
+    merged = tmp_path / "merged.bin"
+    with IndexWriter(merged, width=4, positions_path=tmp_path / "merged_pos.bin") as w:
+        for key, postings, positions in merge_runs(runs, width=4):
+            w.add(key, postings, positions)
+
+    write_positional(tmp_path / "index.bin")
+    assert merged.read_bytes() == (tmp_path / "index.bin").read_bytes()
+    assert (tmp_path / "merged_pos.bin").read_bytes() == (tmp_path / "positions.bin").read_bytes()
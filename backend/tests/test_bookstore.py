@@ -0,0 +1,85 @@
+# backend/tests/test_bookstore.py
+
+import json
+
+import pytest
+
+import indexing
+from bookstore import (
+    PageCheckpoints, compress_book, iter_json_with_text, iter_text, open_book,
+    page_checkpoints, read_chars,
+)
+
+
+def sample_bytes():
+    """Text mixing everything that makes chars and bytes drift apart:
+    multibyte characters, CRLF and lone CR newlines, invalid UTF-8."""
+    parts = []
+    for i in range(400):
+        parts.append(f"Line {i}: naïve café, Ελληνικά 中文 {'x' * (i % 13)}".encode("utf-8"))
+        parts.append([b"\n", b"\r\n", b"\r", b"\xff\n", b"\r\xfe\n"][i % 5])
+    return b"".join(parts)
+
+
+def text_mode(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+@pytest.fixture(params=["plain", "blocks"])
+def book(tmp_path, request):
+    path = tmp_path / "book.txt"
+    path.write_bytes(sample_bytes())
+    text = text_mode(path)
+    if request.param == "blocks":
+        compress_book(path, block_size=1000)
+        assert not path.exists()
+    return path, text
+
+
+def test_checkpoints_point_at_the_same_text(book):
+    path, text = book
+    total, chars, offsets = page_checkpoints(sample_bytes(), stride=500)
+    assert total == len(text)
+    assert len(chars) > 10
+    with open_book(path) as f:
+        raw = f.read()
+    for c, b in zip(chars, offsets):
+        assert raw[b:].decode("utf-8", errors="ignore").replace("\r\n", "\n") \
+            .replace("\r", "\n").startswith(text[c:c + 200])
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 4096])
+def test_incremental_checkpoints_match(chunk):
+    raw = sample_bytes()
+    pages = PageCheckpoints(stride=500)
+    for i in range(0, len(raw), chunk):
+        pages.feed(raw[i:i + chunk])
+    total, chars, offsets = pages.finish()
+    expected = page_checkpoints(raw, stride=500)
+    assert (total, list(chars), list(offsets)) == (expected[0], list(expected[1]), list(expected[2]))
+
+
+@pytest.mark.parametrize("size", [97, 333, 5000])
+def test_pages_match_text_mode_slices(book, size):
+    path, text = book
+    _, chars, offsets = page_checkpoints(sample_bytes(), stride=500)
+    for start in range(0, len(text) + size, size):
+        assert read_chars(path, (chars, offsets), start, size) == text[start:start + size]
+
+
+def test_index_build_records_the_same_checkpoints(book, monkeypatch):
+    path, _ = book
+    monkeypatch.setattr(indexing, "STOPWORDS", set())
+    monkeypatch.setattr(indexing, "READ_CHUNK", 777)
+    *_, pages, _ = indexing.scan_book(path)
+    total, chars, offsets = page_checkpoints(sample_bytes())
+    assert pages[0] == total
+    assert (list(pages[1]), list(pages[2])) == (list(chars), list(offsets))
+
+
+def test_streamed_text(book):
+    path, text = book
+    assert "".join(iter_text(path, chunk_chars=100)) == text
+    body = b"".join(iter_json_with_text({"book_id": 1, "text": None, "title": "T"}, "text", path))
+    assert json.loads(body) == {"book_id": 1, "text": text, "title": "T"}
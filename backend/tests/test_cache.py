@@ -0,0 +1,24 @@
+# backend/tests/test_cache.py
+
+from cache import ResultCache, read_data_version, touch_data_version
+
+
+def test_touch_changes_the_version_but_not_the_contents(tmp_path):
+    path = tmp_path / ".data_version"
+    assert not touch_data_version(path)
+    path.write_text("v1\n")
+    before = read_data_version(path)
+    assert touch_data_version(path)
+    after = read_data_version(path)
+    assert after != before and after[0] == "v1" == path.read_text().strip()
+
+
+def test_touch_invalidates_result_caches(tmp_path):
+    path = tmp_path / ".data_version"
+    path.write_text("v1\n")
+    cache = ResultCache(path, check_secs=0)
+    cache.put("q", {"results": []})
+    assert cache.get("q") == {"results": []}
+    touch_data_version(path)
+    assert cache.get("q") is None
+    assert cache.invalidations == 1
@@ -0,0 +1,181 @@
+# backend/tests/test_download_books.py
+#
+# Downloader runs against a local stand-in for Gutendex and gutenberg.org.
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import download_books
+from download_books import Downloader, Fetcher
+
+PAGE_SIZE = 5
+
+
+class StandIn:
+    """Listing pages of PAGE_SIZE books (ids 1..n_books) and their texts.
+    `fail_texts` answer 503, `throttle` requests answer 429 first."""
+
+    def __init__(self, n_books):
+        self.n_books = n_books
+        self.fail_texts = set()
+        self.throttle = 0
+        self.requests = []          # (monotonic time, path, status)
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, body, headers = stand_in.answer(self.path)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def book(self, i):
+        return {
+            "id": i, "title": f"Book {i}", "languages": ["en"],
+            "authors": [{"name": f"Author {i}"}], "summaries": [f"About book {i}."],
+            "formats": {"text/plain; charset=utf-8": f"{self.url}/txt/{i}"},
+        }
+
+    def answer(self, path):
+        url = urlparse(path)
+        with self.lock:
+            if self.throttle:
+                self.throttle -= 1
+                status, body, headers = 429, b"slow down", {"Retry-After": "1"}
+            elif url.path == "/books":
+                page = int(parse_qs(url.query)["page"][0])
+                ids = range((page - 1) * PAGE_SIZE + 1, min(self.n_books, page * PAGE_SIZE) + 1)
+                body = json.dumps({"results": [self.book(i) for i in ids]}).encode()
+                status, headers = 200, {"Content-Type": "application/json"}
+            elif url.path.startswith("/txt/") and int(url.path[5:]) not in self.fail_texts:
+                i = int(url.path[5:])
+                status, body, headers = 200, " ".join(f"word{i}" for _ in range(20)).encode(), {}
+            elif url.path.startswith("/txt/"):
+                status, body, headers = 503, b"", {}
+            else:
+                status, body, headers = 404, b"", {}
+            self.requests.append((time.monotonic(), url.path + ("?" + url.query if url.query else ""),
+                                  status))
+        return status, body, headers
+
+    def paths(self):
+        return [path for _, path, _ in self.requests]
+
+
+@pytest.fixture
+def stand_in(tmp_path, monkeypatch):
+    server = StandIn(n_books=2 * PAGE_SIZE)
+    thread = threading.Thread(target=server.server.serve_forever, daemon=True)
+    thread.start()
+
+    for name in ("books", "covers"):
+        (tmp_path / name).mkdir()
+    monkeypatch.setattr(download_books, "BOOKS_DIR", str(tmp_path / "books"))
+    monkeypatch.setattr(download_books, "COVERS_DIR", str(tmp_path / "covers"))
+    monkeypatch.setattr(download_books, "METADATA_PATH", str(tmp_path / "metadata.json"))
+    monkeypatch.setattr(download_books, "JOURNAL_PATH", str(tmp_path / "journal.jsonl"))
+    monkeypatch.setattr(download_books, "API", f"{server.url}/books")
+    monkeypatch.setattr(download_books, "GUTENDEX_URL", f"{server.url}/books/{{}}")
+    monkeypatch.setattr(download_books, "GUTENBERG_BASE", server.url)
+    monkeypatch.setattr(download_books, "MIN_WORDS", 10)
+    # back-off sleeps are recorded, and kept short
+    server.sleeps = []
+
+    def sleep(secs):
+        server.sleeps.append(secs)
+        time.sleep(min(secs, 0.01))
+    monkeypatch.setattr(download_books, "time", SimpleNamespace(monotonic=time.monotonic, sleep=sleep))
+
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+def run(target=100, workers=2):
+    downloader = Downloader(target=target, workers=workers)
+    downloader.fetcher = Fetcher(workers, rate=1000, burst=100)
+    downloader.run()
+    return downloader
+
+
+def journal():
+    with open(download_books.JOURNAL_PATH, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def saved_ids():
+    with open(download_books.METADATA_PATH, encoding="utf-8") as f:
+        return sorted(m["book_id"] for m in json.load(f))
+
+
+def test_429_pauses_for_retry_after(stand_in):
+    stand_in.throttle = 1
+    run()
+    assert saved_ids() == list(range(1, 11))
+
+    (t429, path, status), (t_next, next_path, _) = stand_in.requests[:2]
+    assert status == 429 and next_path == path
+    assert t_next - t429 >= 0.9         # the whole bucket waited Retry-After: 1
+
+
+def test_failed_text_is_retried_by_the_next_run(stand_in):
+    stand_in.fail_texts = {3}
+    run()
+    assert saved_ids() == [1, 2, 4, 5, 6, 7, 8, 9, 10]
+    records = journal()
+    assert not [r for r in records if r.get("book_id") == 3]
+    assert {"page": 1} not in records and {"page": 2} in records
+
+    stand_in.fail_texts = set()
+    stand_in.requests.clear()
+    run()
+    assert saved_ids() == list(range(1, 11))
+    # only page 1 is listed again, and only book 3 is downloaded again
+    texts = [p for p in stand_in.paths() if p.startswith("/txt/")]
+    assert texts == ["/txt/3"]
+    assert [p for p in stand_in.paths() if p.startswith("/books?")][0].startswith("/books?page=1&")
+    assert {"page": 1} in journal()
+
+
+def test_interrupted_run_resumes_from_the_journal(stand_in, monkeypatch):
+    fetch_book = Downloader.fetch_book
+
+    def killed_at_book_7(self, b):
+        if b["id"] == 7:
+            raise KeyboardInterrupt
+        return fetch_book(self, b)
+    monkeypatch.setattr(Downloader, "fetch_book", killed_at_book_7)
+    with pytest.raises(KeyboardInterrupt):
+        run(workers=1)
+    assert not os.path.exists(download_books.METADATA_PATH)
+    pages = [r["page"] for r in journal() if "page" in r]
+    assert pages == [1]
+    before = {r["book_id"] for r in journal() if r.get("status") == "saved"}
+    assert set(range(1, 6)) <= before and 7 not in before
+
+    monkeypatch.setattr(Downloader, "fetch_book", fetch_book)
+    stand_in.requests.clear()
+    run(workers=1)
+    assert saved_ids() == list(range(1, 11))
+    # the finished page is skipped and saved books are not fetched again
+    assert not [p for p in stand_in.paths() if p.startswith("/books?page=1&")]
+    texts = {p for p in stand_in.paths() if p.startswith("/txt/")}
+    assert texts == {f"/txt/{i}" for i in range(6, 11) if i not in before}
+    assert [r["page"] for r in journal() if "page" in r] == [1, 2]
@@ -0,0 +1,78 @@
+# backend/tests/test_metrics.py
+
+import json
+import os
+
+import metrics
+from metrics import Registry, metric
+
+
+def make_registry(tmp_path):
+    registry = Registry(tmp_path)
+    hist = registry.histogram("test_seconds", "Test latency.", ("endpoint",), buckets=(0.1, 1.0))
+    registry.collector(lambda: [metric("test_entries", "Cached entries.", 3)])
+    return registry, hist
+
+
+def write_worker(registry, pid, series, gauges=()):
+    state = {"histograms": {"test_seconds": series}, "gauges": list(gauges)}
+    (registry.directory / f"{registry.group}-{pid}.json").write_text(json.dumps(state))
+
+
+def exited_pid():
+    pid = 2 ** 22 - 1
+    while metrics._alive(pid):
+        pid -= 1
+    return pid
+
+
+def test_render_sums_histograms_over_workers(tmp_path):
+    registry, hist = make_registry(tmp_path)
+    hist.observe(0.05, "/search")
+    hist.observe(0.5, "/search")
+    # another worker of the same server, and one that has exited since
+    write_worker(registry, os.getppid(), [[["/search"], [1, 0, 0.01, 2]]])
+    write_worker(registry, exited_pid(), [[["/search"], [0, 0, 7.0, 1]], [["/book"], [1, 0, 0.02, 1]]])
+
+    text = registry.render()
+    assert 'test_seconds_bucket{endpoint="/search",le="0.1"} 2' in text
+    assert 'test_seconds_bucket{endpoint="/search",le="1.0"} 3' in text
+    assert 'test_seconds_count{endpoint="/search"} 5' in text
+    assert 'test_seconds_count{endpoint="/book"} 1' in text
+    assert f"{registry.group}-{os.getpid()}.json" in os.listdir(tmp_path)
+
+
+def test_gauges_are_per_live_worker(tmp_path):
+    registry, _ = make_registry(tmp_path)
+    gauge = ["test_entries", "Cached entries.", "gauge", {}, 9]
+    write_worker(registry, os.getppid(), [], [gauge])
+    write_worker(registry, exited_pid(), [], [gauge])
+
+    lines = [l for l in registry.render().splitlines() if l.startswith("test_entries")]
+    assert sorted(lines) == sorted([
+        f'test_entries{{worker="{os.getpid()}"}} 3',
+        f'test_entries{{worker="{os.getppid()}"}} 9',
+    ])
+
+
+def test_other_servers_files_are_ignored(tmp_path):
+    registry, _ = make_registry(tmp_path)
+    (tmp_path / f"{exited_pid()}-5.json").write_text(json.dumps(
+        {"histograms": {"test_seconds": [[["/x"], [1, 0, 0.01, 1]]]}, "gauges": []}))
+    assert "/x" not in registry.render()
+    registry._remove_stale()
+    assert [p.name for p in tmp_path.glob("*.json")] == [f"{registry.group}-{os.getpid()}.json"]
+
+
+def test_profiles_are_shared_and_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "PROFILES_DIR", tmp_path / "profiles")
+    monkeypatch.setattr(metrics, "PROFILE_KEEP", 2)
+    ids = [metrics._next_profile_id() for _ in range(3)]
+    assert len(set(ids)) == 3 and all(i.startswith(f"{os.getpid()}-") for i in ids)
+    for n, profile_id in enumerate(ids):
+        metrics._keep_profile(profile_id, f"main.py:run {n}\n")
+        os.utime(tmp_path / "profiles" / f"{profile_id}.folded", (n, n))
+
+    assert metrics.get_profile(ids[0]) is None
+    assert metrics.get_profile(ids[2]) == "main.py:run 2\n"
+    assert metrics.get_profile("../../etc/passwd") is None
@@ -0,0 +1,119 @@
+# backend/tests/test_packed.py
+
+import io
+import random
+from array import array
+
+import pytest
+
+from binindex import to_le
+from packed import (
+    GRAPH_MAGIC, PackedGraph, PackedPageIndex, PackedRecords, PackedScores, PackedTexts,
+    PageIndexWriter, ScoresWriter, TextsWriter, _write_to,
+    write_graph, write_page_index, write_records, write_scores, write_texts,
+)
+
+RECORDS = {
+    7: {"book_id": 7, "title": "Moby Dick", "authors": ["Melville, Herman"]},
+    2: {"book_id": 2, "title": "Les Misérables", "languages": ["fr"]},
+    70000: {"book_id": 70000, "title": "", "summary": None},
+}
+TEXTS = {5: "Call me Ishmael.", 1: "", 3: "naïve café — ünïcödé\n", 2**31: "x" * 1000}
+PAGES = {
+    4: (12345, [0, 1000, 2003], [0, 1010, 2025]),
+    1: (10, [0], [0]),
+    9: (0, [0], [0]),
+}
+SCORES = {3: 0.25, 1: 1e-9, 8: 0.0, 2: 7.5}
+GRAPH = {1: {2: 0.5, 3: 0.9, 4: 0.1}, 2: {1: 0.5}, 3: {}, 4: {1: 0.1, 3: 0.1}}
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_round_trips(tmp_path, use_mmap):
+    write_records(RECORDS, tmp_path / "metadata.bin")
+    write_texts(TEXTS, tmp_path / "snippets.bin")
+    write_page_index(PAGES, tmp_path / "pages.bin")
+    write_scores(SCORES, tmp_path / "pagerank.bin")
+    write_graph(GRAPH, tmp_path / "similarity.bin")
+
+    records = PackedRecords(tmp_path / "metadata.bin", use_mmap)
+    assert list(records) == sorted(RECORDS)
+    assert {bid: records[bid] for bid in records} == RECORDS
+
+    texts = PackedTexts(tmp_path / "snippets.bin", use_mmap)
+    assert dict(texts) == TEXTS
+
+    pages = PackedPageIndex(tmp_path / "pages.bin", use_mmap)
+    assert {bid: (t, list(c), list(b)) for bid, (t, c, b) in pages.items()} == PAGES
+
+    scores = PackedScores(tmp_path / "pagerank.bin", use_mmap)
+    assert dict(scores) == SCORES
+
+    graph = PackedGraph(tmp_path / "similarity.bin", use_mmap)
+    assert dict(graph) == GRAPH
+    assert graph.top(1) == [(3, 0.9), (2, 0.5), (4, 0.1)]
+    assert graph.top(1, k=2) == [(3, 0.9), (2, 0.5)]
+    assert graph.top(3) == []
+
+
+def test_lookups_of_unknown_ids(tmp_path):
+    write_scores(SCORES, tmp_path / "pagerank.bin")
+    scores = PackedScores(tmp_path / "pagerank.bin")
+    for missing in (0, 4, 9, "x", None):
+        assert missing not in scores
+        with pytest.raises(KeyError):
+            scores[missing]
+    # JSON-style string keys resolve like ints
+    assert "3" in scores and scores["3"] == 0.25
+    assert scores.get(4, -1.0) == -1.0
+
+
+def test_string_keys_from_json(tmp_path):
+    write_scores({str(k): v for k, v in SCORES.items()}, tmp_path / "pagerank.bin")
+    assert dict(PackedScores(tmp_path / "pagerank.bin")) == SCORES
+
+
+def test_graph_without_sorted_flag(tmp_path):
+    # files written before rows were presorted are still ranked on read
+    f = io.BytesIO()
+    ids, nbrs, weights = [1], [2, 3, 4], [0.5, 0.9, 0.1]
+    _write_to(f, GRAPH_MAGIC, 1, 3, [
+        to_le(array("I", ids)), to_le(array("Q", [0, 3])),
+        to_le(array("I", nbrs)), to_le(array("d", weights)),
+    ])
+    graph = PackedGraph("<memory>", buf=f.getvalue())
+    assert not graph.presorted
+    assert graph.top(1) == [(3, 0.9), (2, 0.5), (4, 0.1)]
+    assert graph.top(1, k=1) == [(3, 0.9)]
+
+
+def test_streaming_writers_take_any_order(tmp_path):
+    order = list(range(1, 200))
+    random.Random(4).shuffle(order)
+    texts = {bid: f"book {bid} " * (bid % 7) for bid in order}
+    pages = {bid: (bid * 100, list(range(0, bid * 100, 1000)) or [0],
+                   list(range(0, bid * 105, 1050)) or [0]) for bid in order}
+
+    with TextsWriter(tmp_path / "texts.bin") as tw, \
+            PageIndexWriter(tmp_path / "pages.bin") as pw, \
+            ScoresWriter(tmp_path / "scores.bin") as sw:
+        for bid in order:
+            tw.add(bid, texts[bid])
+            pw.add(bid, pages[bid])
+            sw.add(bid, bid / 3)
+
+    write_texts(dict(sorted(texts.items())), tmp_path / "texts_dict.bin")
+    write_page_index(dict(sorted(pages.items())), tmp_path / "pages_dict.bin")
+    assert (tmp_path / "texts.bin").read_bytes() == (tmp_path / "texts_dict.bin").read_bytes()
+    assert (tmp_path / "pages.bin").read_bytes() == (tmp_path / "pages_dict.bin").read_bytes()
+    assert dict(PackedScores(tmp_path / "scores.bin")) == {bid: bid / 3 for bid in order}
+    # spill files are cleaned up
+    assert not list(tmp_path.glob("*.spill"))
+
+
+def test_failed_writer_leaves_nothing(tmp_path):
+    with pytest.raises(RuntimeError):
+        with TextsWriter(tmp_path / "texts.bin") as w:
+            w.add(1, "partial")
+            raise RuntimeError("worker died")
+    assert list(tmp_path.iterdir()) == []
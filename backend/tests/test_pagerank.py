@@ -0,0 +1,82 @@
+# backend/tests/test_pagerank.py
+
+import random
+
+import numpy as np
+import pytest
+
+from pagerank import DAMPING, compute_pagerank, pagerank_vector
+
+
+def exact_pagerank(graph, damping=DAMPING, weighted=False):
+    """Dense solve of the same model: (I - d*G) pr = (1 - d)/N, where G
+    moves each node's rank along its out-edges, or everywhere if it has none."""
+    nodes = list(graph)
+    pos = {n: i for i, n in enumerate(nodes)}
+    N = len(nodes)
+    G = np.zeros((N, N))
+    for n, nbrs in graph.items():
+        edges = {pos[m]: (w if weighted else 1.0) for m, w in nbrs.items() if m in pos}
+        total = sum(edges.values())
+        if total:
+            for j, w in edges.items():
+                G[j, pos[n]] = w / total
+        else:
+            G[:, pos[n]] = 1.0 / N
+    pr = np.linalg.solve(np.eye(N) - damping * G, np.full(N, (1 - damping) / N))
+    return dict(zip(nodes, pr))
+
+
+def random_graph(n=60, seed=0):
+    rng = random.Random(seed)
+    graph = {}
+    for a in range(n):
+        # a few sinks, and some edges to books outside the graph
+        k = 0 if a % 9 == 0 else rng.randint(1, 6)
+        graph[a] = {rng.randrange(n + 5): round(rng.random(), 3) for _ in range(k)}
+        graph[a].pop(a, None)
+    return graph
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_matches_exact_solution(weighted):
+    graph = random_graph()
+    nodes, pr, iterations, residual = pagerank_vector(graph, weighted=weighted)
+    exact = exact_pagerank(graph, weighted=weighted)
+
+    assert pr.sum() == pytest.approx(1.0)
+    assert dict(zip(nodes, pr)) == pytest.approx(exact, abs=1e-9)
+    assert residual < 1e-10 and iterations < 100
+
+
+def test_weights_change_the_ranking():
+    graph = {1: {2: 0.9, 3: 0.1}, 2: {1: 1.0}, 3: {1: 1.0}}
+    plain = compute_pagerank(graph)
+    weighted = compute_pagerank(graph, weighted=True)
+    assert plain[2] == pytest.approx(plain[3])
+    assert weighted[2] > weighted[3]
+
+
+def test_dangling_nodes_keep_total_rank():
+    # 3 has no out-edges: its rank is spread over every node, not lost
+    graph = {1: {3: 1.0}, 2: {3: 1.0}, 3: {}}
+    nodes, pr, _, _ = pagerank_vector(graph)
+    assert pr.sum() == pytest.approx(1.0)
+    assert dict(zip(nodes, pr)) == pytest.approx(exact_pagerank(graph), abs=1e-9)
+
+
+def test_warm_start_converges_faster():
+    graph = random_graph(seed=3)
+    _, _, cold_iterations, _ = pagerank_vector(graph)
+    previous = compute_pagerank(graph)
+
+    # one new book linking into the graph
+    graph[1000] = {1: 1.0, 2: 0.5}
+    nodes, pr, warm_iterations, _ = pagerank_vector(graph, init=previous)
+    assert warm_iterations < cold_iterations
+    assert dict(zip(nodes, pr)) == pytest.approx(exact_pagerank(graph), abs=1e-9)
+
+
+def test_empty_graph():
+    nodes, pr, iterations, residual = pagerank_vector({})
+    assert nodes == [] and len(pr) == 0 and iterations == 0
@@ -0,0 +1,137 @@
+# backend/tests/test_query.py
+
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from binindex import BinaryIndex, IndexWriter, encode_deltas
+from query import (
+    And, Not, Or, Phrase, QueryError, QueryEvaluator, Term, normalize_query, parse_query,
+)
+
+STOPWORDS = {"the", "of"}
+
+BOOKS = {
+    1: "white whale of the sea",
+    2: "grey whale",
+    3: "the white sea white",
+    4: "whale white whale",
+    5: "ship of the line",
+}
+
+
+def shape(node):
+    """Nested tuples for comparing parse trees."""
+    if node is None:
+        return None
+    if isinstance(node, Term):
+        return node.word
+    if isinstance(node, Phrase):
+        return ("PHRASE", *node.words)
+    if isinstance(node, Not):
+        return ("NOT", shape(node.child))
+    return (type(node).__name__.upper(), *map(shape, node.children))
+
+
+@pytest.mark.parametrize("q, expected", [
+    ("whale", "whale"),
+    ("White Whale", ("AND", "white", "whale")),
+    ("white AND whale", ("AND", "white", "whale")),
+    # AND binds tighter than OR
+    ("white OR grey whale", ("OR", "white", ("AND", "grey", "whale"))),
+    ("white whale OR grey", ("OR", ("AND", "white", "whale"), "grey")),
+    ("(white OR grey) whale", ("AND", ("OR", "white", "grey"), "whale")),
+    ("whale NOT white", ("AND", "whale", ("NOT", "white"))),
+    ("whale -white", ("AND", "whale", ("NOT", "white"))),
+    ("NOT NOT whale", ("NOT", ("NOT", "whale"))),
+    ("NOT (white OR grey)", ("NOT", ("OR", "white", "grey"))),
+    ('"white whale"', ("PHRASE", ("white", 0), ("whale", 1))),
+    # stopwords keep their slot in a phrase
+    ('"whale of the sea"', ("PHRASE", ("whale", 0), ("sea", 3))),
+    ('"the whale"', "whale"),
+    ('"white whale" OR sea', ("OR", ("PHRASE", ("white", 0), ("whale", 1)), "sea")),
+    # operators are case-sensitive
+    ("whale or white", ("AND", "whale", "or", "white")),
+    ("the of", None),
+    ("", None),
+    ("whale -the", "whale"),
+])
+def test_parse(q, expected):
+    assert shape(parse_query(q, STOPWORDS)) == expected
+
+
+@pytest.mark.parametrize("q", [
+    "(white whale", "white)", "NOT", "whale NOT", "NOT OR whale", "(NOT)", "((white)",
+])
+def test_malformed_queries(q):
+    with pytest.raises(QueryError):
+        parse_query(q, STOPWORDS)
+
+
+def test_normalize_keeps_operators():
+    assert normalize_query('White  OR "Grey WHALE"  NOT Sea') == 'white OR "grey whale" NOT sea'
+
+
+@pytest.fixture
+def evaluator(tmp_path):
+    index = {}
+    for bid, text in sorted(BOOKS.items()):
+        for pos, word in enumerate(text.split()):
+            if word not in STOPWORDS:
+                index.setdefault(word, {}).setdefault(bid, []).append(pos)
+
+    with IndexWriter(tmp_path / "index.bin", width=4,
+                     positions_path=tmp_path / "positions.bin") as w:
+        for term in sorted(index):
+            chunks = [(bid, encode_deltas(plist)) for bid, plist in index[term].items()]
+            postings = [(bid, len(index[term][bid]), 0, len(c)) for bid, c in chunks]
+            w.add(term, postings, b"".join(c for _, c in chunks))
+    binary = BinaryIndex(tmp_path / "index.bin", positions_path=tmp_path / "positions.bin")
+    return QueryEvaluator(binary, BOOKS.keys())
+
+
+@pytest.mark.parametrize("q, books", [
+    ("whale", [1, 2, 4]),
+    ("white whale", [1, 4]),
+    ("white OR grey", [1, 2, 3, 4]),
+    ("white OR grey whale", [1, 2, 3, 4]),
+    ("(white OR grey) whale", [1, 2, 4]),
+    ("whale NOT white", [2]),
+    ("whale -grey", [1, 4]),
+    ("NOT whale", [3, 5]),
+    ('"white whale"', [1, 4]),
+    ('"whale white"', [4]),
+    ('"white sea"', [3]),
+    ('"whale of the sea"', [1]),
+    ('"whale sea"', []),
+    ("unknown", []),
+    ("unknown OR ship", [5]),
+])
+def test_evaluate(evaluator, q, books):
+    hits = evaluator.evaluate(parse_query(q, STOPWORDS))
+    assert [h[0] for h in hits] == books
+
+
+def test_phrase_counts(evaluator):
+    hits = evaluator.evaluate(parse_query('"white whale"', STOPWORDS))
+    assert {h[0]: h[1] for h in hits} == {1: 1, 4: 1}
+    hits = evaluator.evaluate(parse_query("white", STOPWORDS))
+    assert {h[0]: h[1] for h in hits} == {1: 1, 3: 2, 4: 1}
+
+
+def test_malformed_query_is_a_400(evaluator, monkeypatch):
+    import main
+    from ranking import CursorCache
+
+    gen = SimpleNamespace(
+        number=0, ranked_cursors=CursorCache(), inverted_index=evaluator.index,
+        pagerank_scores={}, bm25=None, query_stopwords=STOPWORDS, query_evaluator=evaluator,
+    )
+    monkeypatch.setattr(main.generations, "current", gen)
+    client = TestClient(main.app)
+
+    r = client.get("/search-keyword", params={"q": "(white whale"})
+    assert r.status_code == 400
+    assert "missing closing parenthesis" in r.json()["detail"]
+    assert client.get("/search-keyword", params={"q": "whale NOT"}).status_code == 400
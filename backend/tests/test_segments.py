@@ -0,0 +1,89 @@
+# backend/tests/test_segments.py
+
+import json
+
+import indexing
+from query import QueryEvaluator, parse_query
+from segments import SegmentedIndex, list_segments
+
+QUERIES = [
+    "whale", "white whale", "white OR storm", "(grey OR sea) NOT ship",
+    '"white whale"', '"white whale" captain', "NOT harpoon", "book",
+]
+
+
+def state():
+    """Everything a query can observe, from whatever index parts exist."""
+    index = indexing.load_index()
+    lengths = indexing.load_doc_lengths()
+    live = sorted(lengths)
+    evaluator = QueryEvaluator(index, live)
+    stopwords = indexing.load_stopwords()
+
+    postings, df = {}, {}
+    for j in range(len(index)):
+        found = index.postings_at(j, full=True)
+        if found:
+            postings[index.term_at(j)] = (found, index.positions_at(j, live))
+            df[index.term_at(j)] = index.df[j]
+    snippets = indexing.load_snippets()
+    pages = indexing.load_page_index()
+    wordsets = indexing.load_wordsets()
+    return {
+        "postings": postings,
+        "df": df,
+        "n_docs": index.n_docs,
+        "lengths": lengths,
+        "results": {q: evaluator.evaluate(parse_query(q, stopwords)) for q in QUERIES},
+        "snippets": {bid: snippets[bid] for bid in live},
+        "pages": {bid: (t, list(c), list(o)) for bid, (t, c, o) in
+                  ((bid, pages[bid]) for bid in live)},
+        "wordsets": {bid: wordsets[bid] for bid in live},
+    }
+
+
+def test_segments_match_a_full_rebuild(data_dir, add_books):
+    add_books(range(1, 9))
+    indexing.build_index(workers=1)
+
+    # two batches of new books, a removal, and a removed book coming back
+    add_books(range(9, 13))
+    indexing.build_segment(workers=1)
+    indexing.remove_books([3, 10])
+    add_books([14, 15, 3])
+    indexing.build_segment(workers=1)
+
+    assert len(list_segments(data_dir)) == 2
+    assert isinstance(indexing.load_index(), SegmentedIndex)
+    segmented = state()
+    assert sorted(segmented["lengths"]) == [1, 2, 3, 4, 5, 6, 7, 8, 9, 11, 12, 14, 15]
+
+    indexing.compact_index()
+    assert not list_segments(data_dir)
+    compacted = state()
+
+    indexing.build_index(workers=1)
+    rebuilt = state()
+
+    for name in rebuilt:
+        assert segmented[name] == rebuilt[name], name
+        assert compacted[name] == rebuilt[name], name
+
+
+def test_add_with_nothing_new(data_dir, add_books):
+    add_books(range(1, 4))
+    indexing.build_index(workers=1)
+    assert indexing.build_segment(workers=1) is None
+    assert not list_segments(data_dir)
+
+
+def test_remove_books_updates_metadata(data_dir, add_books):
+    add_books(range(1, 5))
+    indexing.build_index(workers=1)
+    indexing.remove_books([2])
+
+    metadata = json.loads((data_dir / "metadata.json").read_text(encoding="utf-8"))
+    assert [m["book_id"] for m in metadata] == [1, 3, 4]
+    assert 2 not in indexing.load_doc_lengths()
+    assert all(2 not in dict(index_postings)
+               for _, index_postings in indexing.load_index().items())
@@ -0,0 +1,93 @@
+# backend/tests/test_similarity.py
+
+import random
+
+import numpy as np
+import pytest
+
+from similarity import (
+    LSH_RECALL, _minhash_edges, candidate_probability, choose_bands, jaccard, lsh_candidates,
+)
+
+
+@pytest.mark.parametrize("threshold", [0.05, 0.12, 0.3, 0.5, 0.8])
+def test_bands_follow_the_threshold(threshold):
+    bands, rows = choose_bands(threshold, max_perm=512, min_rows=2)
+    assert rows >= 2 and bands * rows <= 512
+    if threshold >= 0.12:
+        assert candidate_probability(threshold, bands, rows) >= LSH_RECALL
+        # one more row per band would need more than 512 permutations
+        more = choose_bands(threshold, max_perm=512, min_rows=rows + 1)
+        assert more[1] * more[0] > 512 or candidate_probability(threshold, *more) < LSH_RECALL
+    else:
+        # too low for 512 permutations: as many bands as fit, recall reported lower
+        assert (bands, rows) == (256, 2)
+
+
+def brute_force_candidates(sigs, bands, rows):
+    return {
+        (i, j)
+        for i in range(len(sigs)) for j in range(i + 1, len(sigs))
+        if any((sigs[i, b * rows:(b + 1) * rows] == sigs[j, b * rows:(b + 1) * rows]).all()
+               for b in range(bands))
+    }
+
+
+def test_candidates_are_each_colliding_pair_once():
+    rng = np.random.default_rng(3)
+    sigs = rng.integers(0, 4, size=(60, 12), dtype=np.uint64)
+    pairs = list(lsh_candidates(sigs, 4, 3))
+    assert len(pairs) == len(set(pairs))
+    assert {tuple(sorted(p)) for p in pairs} == brute_force_candidates(sigs, 4, 3)
+
+
+def test_probed_candidates():
+    rng = np.random.default_rng(4)
+    sigs = rng.integers(0, 4, size=(60, 12), dtype=np.uint64)
+    probe = [5, 17, 18, 59]
+    pairs = [tuple(sorted(p)) for p in lsh_candidates(sigs, 4, 3, probe=probe)]
+    assert len(pairs) == len(set(pairs))
+    assert set(pairs) == {p for p in brute_force_candidates(sigs, 4, 3)
+                          if p[0] in probe or p[1] in probe}
+
+
+def corpus(n=120, seed=0):
+    """Random books plus a near-duplicate of every tenth one."""
+    rng = random.Random(seed)
+    vocab = [f"w{i}" for i in range(20000)]
+    ws = {}
+    for bid in range(n):
+        if bid % 10 == 1:
+            base = sorted(ws[bid - 1])
+            ws[bid] = set(rng.sample(base, len(base) * 4 // 5)) | set(rng.sample(vocab, 40))
+        else:
+            ws[bid] = set(rng.sample(vocab, 300))
+    ws[n] = ws[n + 1] = set()
+    return ws
+
+
+def test_minhash_finds_the_exact_edges():
+    ws = corpus()
+    ids = list(ws)
+    exact = {frozenset((a, b)) for a in ids for b in ids
+             if a < b and jaccard(ws[a], ws[b]) >= 0.3}
+    found = {frozenset((a, b)) for a, b, _ in _minhash_edges(ws, ids, 0.3)}
+    assert len(exact) >= 10
+    assert found == exact
+
+
+def test_empty_word_sets_have_no_edges():
+    ws = corpus()
+    ids = list(ws)
+    edges = list(_minhash_edges(ws, ids, 0.3, verify=False))
+    assert all(ws[a] and ws[b] for a, b, _ in edges)
+
+
+def test_incremental_matches_the_full_build():
+    ws = corpus()
+    ids = list(ws)
+    new = {11, 31, 32, 70, len(ws) - 1}
+    full = {frozenset((a, b)): s for a, b, s in _minhash_edges(ws, ids, 0.3)}
+    only = {frozenset((a, b)): s for a, b, s in _minhash_edges(ws, ids, 0.3, only=new)}
+    assert only == {pair: s for pair, s in full.items() if pair & new}
+    assert any(pair & new for pair in full)
@@ -0,0 +1,70 @@
+# backend/tests/test_snapshot.py
+
+import json
+from pathlib import Path
+
+import pytest
+
+import indexing
+import similarity
+import snapshot
+from titleindex import TitleIndex
+
+
+@pytest.fixture
+def built(data_dir, add_books, monkeypatch):
+    """A built index plus pagerank.json / similarity.json, with snapshot.py
+    and similarity.py reading from data_dir."""
+    old = snapshot.DATA_DIR
+    for module in (snapshot, similarity):
+        for name, value in list(vars(module).items()):
+            if isinstance(value, Path) and value.is_relative_to(old):
+                monkeypatch.setattr(module, name, data_dir / value.relative_to(old))
+
+    add_books(range(1, 7))
+    indexing.build_index(workers=1)
+    (data_dir / "pagerank.json").write_text(json.dumps({str(i): 1 / 6 for i in range(1, 7)}))
+    graph = {"1": {"2": 0.5, "3": 0.25}, "2": {"1": 0.5}}
+    (data_dir / "similarity.json").write_text(json.dumps(graph))
+    return data_dir
+
+
+def test_round_trip(built):
+    snapshot.write_snapshot(snapshot.SNAPSHOT_PATH)
+    snap = snapshot.load_snapshot(path=snapshot.SNAPSHOT_PATH)
+
+    metadata = json.loads((built / "metadata.json").read_text())
+    assert snap["meta_by_id"] == {m["book_id"]: m for m in metadata}
+    assert snap["doc_lengths"] == indexing.load_doc_lengths()
+    assert snap["pagerank_scores"] == json.loads((built / "pagerank.json").read_text())
+    assert list(snap["similarity_graph"].get(1)) == [2, 3]
+
+    expected = TitleIndex(snap["meta_by_id"])
+    title_index = snap["title_index"]
+    assert vars(title_index) == vars(expected)
+    assert title_index.search("author 4") == [4]
+
+    # mmap workers only need the common sections
+    common = snapshot.load_snapshot(use_mmap=True, path=snapshot.SNAPSHOT_PATH)
+    assert set(common) == {"title_index", "doc_lengths"}
+
+
+def test_damaged_or_stale_snapshots_are_ignored(built):
+    snapshot.write_snapshot(snapshot.SNAPSHOT_PATH)
+    path = snapshot.SNAPSHOT_PATH
+    data = bytearray(path.read_bytes())
+    data[-9] ^= 0xff        # inside the last section (similarity)
+    path.write_bytes(bytes(data))
+    assert snapshot.load_snapshot(path=snapshot.SNAPSHOT_PATH) is None
+    # ...which mmap workers never read
+    assert snapshot.load_snapshot(use_mmap=True, path=snapshot.SNAPSHOT_PATH) is not None
+
+    snapshot.write_snapshot(snapshot.SNAPSHOT_PATH)
+    (built / "pagerank.json").write_text(json.dumps({"1": 1.0}))
+    assert snapshot.load_snapshot(path=snapshot.SNAPSHOT_PATH) is None
+
+
+def test_legacy_pickle_is_removed(built):
+    snapshot.LEGACY_SNAPSHOT_PATH.write_bytes(b"\x80\x05N.")
+    snapshot.write_snapshot(snapshot.SNAPSHOT_PATH)
+    assert not snapshot.LEGACY_SNAPSHOT_PATH.exists()
@@ -0,0 +1,101 @@
+# backend/titleindex.py
+#
+# Substring search over book titles and authors.
+#
+# Every title and author name (lowercased) is an entry; each 1-, 2- and
+# 3-character gram maps to the sorted list of entries containing it. A query
+# of up to 3 characters is answered by one list; a longer one intersects its
+# rarest trigram lists and verifies the few survivors, so nothing scans the
+# whole catalogue per keystroke.
+#
+# to_bytes() / from_bytes() store a built index (in snapshot.py) as JSON for
+# the texts and little-endian arrays for the entry and posting lists.
+
+import json
+import struct
+from array import array
+from collections import defaultdict
+
+from binindex import to_le, typed_view
+
+MAX_GRAM = 3
+# json length, entries, grams, posting ids
+_LAYOUT = struct.Struct("<QQQQ")
+
+
+def grams(text: str, n: int):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class TitleIndex:
+    def __init__(self, meta_by_id):
+        self.book_ids = []      # book ordinal -> book_id (metadata order)
+        self.entry_book = array("I")   # entry -> book ordinal
+        self.entry_text = []    # entry -> normalized title / author
+
+        postings = defaultdict(list)
+        for ordinal, (book_id, meta) in enumerate(meta_by_id.items()):
+            self.book_ids.append(book_id)
+            for text in [meta["title"], *meta.get("authors", [])]:
+                entry = len(self.entry_text)
+                text = text.lower()
+                self.entry_book.append(ordinal)
+                self.entry_text.append(text)
+                for n in range(1, MAX_GRAM + 1):
+                    for g in grams(text, n):
+                        postings[g].append(entry)
+
+        self.postings = {g: array("I", ids) for g, ids in postings.items()}
+
+    def to_bytes(self) -> bytes:
+        grams = list(self.postings)
+        offsets = array("Q", [0])
+        for g in grams:
+            offsets.append(offsets[-1] + len(self.postings[g]))
+        ids = array("I")
+        for g in grams:
+            ids.extend(self.postings[g])
+        texts = json.dumps({"book_ids": self.book_ids, "entry_text": self.entry_text,
+                            "grams": grams}, ensure_ascii=False).encode("utf-8")
+        texts += b" " * (-len(texts) % 8)
+        layout = _LAYOUT.pack(len(texts), len(self.entry_book), len(grams), len(ids))
+        entry_book = to_le(self.entry_book)
+        entry_book += b"\0" * (-len(entry_book) % 8)
+        return b"".join([layout, texts, entry_book, to_le(offsets), to_le(ids)])
+
+    @classmethod
+    def from_bytes(cls, buf):
+        n_json, n_entries, n_grams, n_ids = _LAYOUT.unpack_from(buf, 0)
+        off = _LAYOUT.size
+        texts = json.loads(bytes(buf[off:off + n_json]))
+        off += n_json
+        self = cls.__new__(cls)
+        self.book_ids = texts["book_ids"]
+        self.entry_text = texts["entry_text"]
+        self.entry_book = array("I", typed_view(buf, off, "I", n_entries))
+        off += (4 * n_entries + 7) & ~7
+        offsets = typed_view(buf, off, "Q", n_grams + 1)
+        ids = typed_view(buf, off + 8 * (n_grams + 1), "I", n_ids)
+        self.postings = {g: array("I", ids[offsets[k]:offsets[k + 1]])
+                         for k, g in enumerate(texts["grams"])}
+        return self
+
+    def _entries(self, term: str):
+        if len(term) <= MAX_GRAM:
+            return self.postings.get(term, ())
+
+        lists = sorted((self.postings.get(g, ()) for g in grams(term, MAX_GRAM)), key=len)
+        if not lists or not lists[0]:
+            return ()
+        cands = set(lists[0])
+        for ids in lists[1:]:
+            if len(cands) <= 32:
+                break
+            cands.intersection_update(ids)
+        return [e for e in cands if term in self.entry_text[e]]
+
+    def search(self, term: str):
+        """book_ids whose title or an author contains `term` (already
+        lowercased), each book once, in metadata order."""
+        ordinals = {self.entry_book[e] for e in self._entries(term)}
+        return [self.book_ids[o] for o in sorted(ordinals)]
@@ -17,6 +17,13 @@ export async function getBook(id: string) {
   return (await axios.get(`${API_BASE}/book/${id}`)).data;
 }
 
+// lightweight metadata cards (no book text); fields: see CARD_FIELDS in main.py
+export async function getBookCards(ids: (string | number)[], fields?: string[]) {
+  return (await axios.get(`${API_BASE}/books`, {
+    params: { ids: ids.join(","), fields: fields?.join(",") },
+  })).data;
+}
+
 export async function getRecommendations(id: string) {
   return (await axios.get(`${API_BASE}/recommend/${id}`)).data;
 }
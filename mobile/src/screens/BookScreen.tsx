@@ -5,7 +5,7 @@ import {
   ScrollView, ActivityIndicator
 } from "react-native";
 import { useRoute, useNavigation } from "@react-navigation/native";
-import { getBook, getRecommendations } from "../api";
+import { getBookCards, getRecommendations } from "../api";
 import { API_BASE } from "../config";
 
 export default function BookScreen() {
@@ -17,12 +17,24 @@ export default function BookScreen() {
 
   const [book, setBook] = useState(null);
   const [recs, setRecs] = useState([]);
+  const [notFound, setNotFound] = useState(false);
 
   useEffect(() => {
-    getBook(bookId).then(setBook);
+    // metadata only: /book would stream the whole text over the network
+    getBookCards([bookId], ["title", "authors", "cover_url", "summary"]).then((d) => {
+      // an unknown id is listed under "missing", not returned as an error
+      setNotFound(d.books.length === 0);
+      setBook(d.books[0] ?? null);
+    });
     getRecommendations(bookId).then((d) => setRecs(d.recommendations));
   }, [bookId]);
 
+  if (notFound)
+    return (
+      <Text style={{ marginTop: 40, textAlign: "center", fontSize: 18 }}>
+        Book not found.
+      </Text>
+    );
   if (!book) return <ActivityIndicator size="large" style={{ marginTop: 40 }} />;
 
   return (
@@ -124,7 +124,7 @@ export default function SearchScreen({ navigation, route }) {
         <View style={{ flexDirection: "row", marginBottom: 10 }}>
           <Text style={{ marginRight: 10, padding: 5 }}>Rank:</Text>
 
-          {["tf", "pr", "tfpr"].map((rm) => (
+          {["tf", "pr", "tfpr", "bm25"].map((rm) => (
             <TouchableOpacity
               key={rm}
               onPress={() => setRankMode(rm)}
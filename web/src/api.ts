@@ -37,10 +37,31 @@ export async function getBook(id: string) {
   return (await axios.get(`${API_BASE}/book/${encodeURIComponent(id)}`)).data;
 }
 
+// lightweight metadata cards (no book text); fields: see CARD_FIELDS in main.py
+export async function getBookCards(ids: (string | number)[], fields?: string[]) {
+  return (
+    await axios.get(`${API_BASE}/books`, {
+      params: { ids: ids.join(","), fields: fields?.join(",") },
+    })
+  ).data;
+}
+
 export async function getRecommendations(id: string) {
   return (await axios.get(`${API_BASE}/recommend/${id}`)).data;
 }
 
+// one request for many books: per-book lists for `bookIds`, and one merged
+// list for `seeds` ("more like these")
+export async function getRecommendationsBatch(
+  bookIds: number[],
+  seeds: number[] = [],
+  limit = 5
+) {
+  return (
+    await axios.post(`${API_BASE}/recommend`, { book_ids: bookIds, seeds, limit })
+  ).data;
+}
+
 export async function getBookPage(id: string, page: number) {
   return (
     await axios.get(`${API_BASE}/book-page/${id}`, {
@@ -5,7 +5,7 @@ import {
   useLocation,
   Link,
 } from "react-router-dom";
-import { getBook, getRecommendations, API_BASE } from "../api";
+import { getBookCards, getRecommendations, API_BASE } from "../api";
 
 export default function BookPage() {
   const { id } = useParams();
@@ -14,13 +14,28 @@ export default function BookPage() {
 
   const [book, setBook] = useState<any>(null);
   const [recs, setRecs] = useState<any[]>([]);
+  const [notFound, setNotFound] = useState(false);
 
 
   useEffect(() => {
-    getBook(id!).then(setBook);
+    // the page only shows metadata: skip /book, which streams the whole text
+    getBookCards([id!], ["title", "authors", "cover_url", "summary"]).then(
+      (data) => {
+        // an unknown id is listed under "missing", not returned as an error
+        setNotFound(data.books.length === 0);
+        setBook(data.books[0] ?? null);
+      }
+    );
     getRecommendations(id!).then((data) => setRecs(data.recommendations));
   }, [id]);
 
+  if (notFound)
+    return (
+      <div style={{ maxWidth: 900, margin: "0 auto", padding: "1rem" }}>
+        <p>Book not found.</p>
+        <Link to="/">← Back to search</Link>
+      </div>
+    );
   if (!book) return <p>Loading...</p>;
 
   // ========== BACK BUTTON LOGIC ==========
@@ -6,7 +6,7 @@ export default function SearchPage() {
   const [query, setQuery] = useState("");
   const [mode, setMode] = useState<"keyword" | "title">("keyword");
   const [advanced, setAdvanced] = useState(false);
-  const [rankMode, setRankMode] = useState<"tf" | "pr" | "tfpr">("tf");
+  const [rankMode, setRankMode] = useState<"tf" | "pr" | "tfpr" | "bm25" | "bm25pr">("tf");
 
   const [loading, setLoading] = useState(false);
   const [results, setResults] = useState<any[]>([]);
@@ -138,6 +138,8 @@ export default function SearchPage() {
             <option value="tf">Occurrences (TF)</option>
             <option value="pr">Importance (PageRank)</option>
             <option value="tfpr">Combined (TF × PR)</option>
+            <option value="bm25">Relevance (BM25)</option>
+            <option value="bm25pr">Relevance + PageRank</option>
           </select>
         )}
 